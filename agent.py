@@ -1,14 +1,24 @@
-from crewai_tools import RagTool, NL2SQLTool
-from crewai import Agent, Task, Crew, Process
-from crewai_tools.aws.bedrock.knowledge_base.retriever_tool import BedrockKBRetrieverTool
+"""
+Knowledge Base and SQL agents, and the conversation history in DynamoDB.
+Importing this module has no side effects: crewai, the tools, the DynamoDB table, the database
+connection test and the log file are all set up on first use, once per process. warm_up() (or
+start_warm_up() in a background thread) initializes them ahead of the first question.
+
+Configuration:
+- AGENT_WARMUP: "background" (default) initializes everything in a background thread at startup,
+  "blocking" before serving, "off" on first use
+- DYNAMODB_CREATE_TABLE: 1 (default) creates the conversation table on first use if it doesn't
+  exist, 0 assumes it does (see setup_dynamodb.py)
+"""
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import json
 import os
 from dotenv import load_dotenv
+from question_router import KB, SQL, route_question
 import glob
 import logging
-import boto3
-from boto3.dynamodb.conditions import Key
+import threading
 import uuid
 
 load_dotenv()
@@ -22,9 +32,23 @@ KB_ID = os.getenv("KB_ID")
 DYNAMODB_TABLE_NAME = os.getenv("DYNAMODB_TABLE_NAME", "chatbot-conversations")
 AWS_REGION = os.getenv("AWS_REGION", "us-west-2")
 
+# "parallel": the KB and SQL tasks run at the same time as separate crews and their answers are merged
+# "sequential": both tasks run one after the other in a single crew
+CREW_EXECUTION = os.getenv("CREW_EXECUTION", "parallel").lower()
+AGENT_WARMUP = os.getenv("AGENT_WARMUP", "background").lower()
+DYNAMODB_CREATE_TABLE = os.getenv("DYNAMODB_CREATE_TABLE", "1").lower() not in ("0", "false", "no")
+
+logger = logging.getLogger(__name__)
+_logging_ready = False
+
 # Setup logging
 def setup_logging():
-    """Setup logging configuration"""
+    """Setup logging configuration, once per process; called by the entry points, not on import"""
+    global _logging_ready
+    if _logging_ready:
+        return logger
+    _logging_ready = True
+
     os.makedirs("logs", exist_ok=True)
     log_filename = f"logs/agent_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
     
@@ -51,32 +75,46 @@ def setup_logging():
         handlers=[file_handler, console_handler]
     )
     
-    logger = logging.getLogger(__name__)
     logger.info(f"Logging initialized - Log file: {log_filename}")
+    logger.info("=== AGENT STARTUP ===")
+    logger.info(f"Environment loaded - DB_URI: {'Set' if DB_URI else 'Not set'}")
+    logger.info(f"Default Schema: {DEFAULT_SCHEMA}")
+    logger.info(f"DynamoDB Table: {DYNAMODB_TABLE_NAME}")
+    logger.info(f"AWS Region: {AWS_REGION}")
+    #logger.info(f"Docs Directory: {DOCS_DIR}")
     return logger
 
-# Initialize logger
-logger = setup_logging()
-
-# Test logging
-logger.info("=== AGENT STARTUP ===")
-logger.info("Logger initialized successfully")
-
-
-
-logger.info(f"Environment loaded - DB_URI: {'Set' if DB_URI else 'Not set'}")
-logger.info(f"Default Schema: {DEFAULT_SCHEMA}")
-logger.info(f"DynamoDB Table: {DYNAMODB_TABLE_NAME}")
-logger.info(f"AWS Region: {AWS_REGION}")
-#logger.info(f"Docs Directory: {DOCS_DIR}")
-
-# Initialize DynamoDB
-dynamodb = boto3.resource('dynamodb', region_name=AWS_REGION)
-conversation_table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+# DynamoDB, created on first use
+_dynamodb = None
+_conversation_table = None
+_dynamodb_lock = threading.Lock()
+
+def get_dynamodb():
+    """boto3 DynamoDB resource"""
+    global _dynamodb
+    with _dynamodb_lock:
+        if _dynamodb is None:
+            import boto3
+            _dynamodb = boto3.resource('dynamodb', region_name=AWS_REGION)
+        return _dynamodb
+
+def get_conversation_table():
+    """Conversation history table; created on first use if it doesn't exist yet"""
+    global _conversation_table
+    if _conversation_table is not None:
+        return _conversation_table
+    dynamodb = get_dynamodb()
+    with _dynamodb_lock:
+        if _conversation_table is None:
+            if DYNAMODB_CREATE_TABLE:
+                create_conversation_table(dynamodb)
+            _conversation_table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+        return _conversation_table
 
 # DynamoDB helper functions
-def create_conversation_table():
+def create_conversation_table(dynamodb=None):
     """Create DynamoDB table for conversation history"""
+    dynamodb = dynamodb or get_dynamodb()
     try:
         logger.info(f"Creating DynamoDB table: {DYNAMODB_TABLE_NAME}")
         
@@ -130,7 +168,7 @@ def save_conversation_to_dynamodb(session_id, user_question, ai_response):
             'ttl': int(datetime.now().timestamp()) + (30 * 24 * 60 * 60)  # 30 days TTL
         }
         
-        conversation_table.put_item(Item=item)
+        get_conversation_table().put_item(Item=item)
         logger.info(f"Conversation saved to DynamoDB - Session: {session_id}")
         return True
         
@@ -141,7 +179,8 @@ def save_conversation_to_dynamodb(session_id, user_question, ai_response):
 def get_conversation_history_from_dynamodb(session_id, limit=10):
     """Get conversation history from DynamoDB for a session"""
     try:
-        response = conversation_table.query(
+        from boto3.dynamodb.conditions import Key
+        response = get_conversation_table().query(
             KeyConditionExpression=Key('session_id').eq(session_id),
             ScanIndexForward=False,  # Get most recent first
             Limit=limit
@@ -164,9 +203,6 @@ def get_conversation_history_from_dynamodb(session_id, limit=10):
         logger.error(f"Error retrieving conversation history: {e}")
         return []
 
-# Create table if it doesn't exist
-create_conversation_table()
-
 
 # Database configuration
 DATABASE_NAME = "talbotdevv1"
@@ -219,41 +255,60 @@ def test_database_connection(uri):
         #print(f"❌ Database connection failed: {e}")
         return False
 
-# Initialize NL2SQL tool
-nl2sql_tool = None
-if DB_URI:
+# Tools, built on first use
+_UNSET = object()
+_nl2sql_tool = _UNSET
+_kb_tool = None
+_nl2sql_lock = threading.Lock()
+_kb_tool_lock = threading.Lock()
+
+def get_nl2sql_tool():
+    """NL2SQL tool, or None when there is no database; the connection is tested once per process"""
+    global _nl2sql_tool
+    with _nl2sql_lock:
+        if _nl2sql_tool is _UNSET:
+            _nl2sql_tool = create_nl2sql_tool()
+        return _nl2sql_tool
+
+def create_nl2sql_tool():
+    """Initialize NL2SQL tool"""
+    db_uri = DB_URI
+    if not db_uri:
+        print("❌ No database URI provided - Database search functionality disabled")
+        print("Please set POSTGRES_URI in your .env file")
+        return None
+
     print(f"Attempting to initialize NL2SQL tool...")
-    print(f"Database URI: {DB_URI}")
+    print(f"Database URI: {db_uri}")
     print(f"Default Schema: {DEFAULT_SCHEMA}")
     
     try:
+        from crewai_tools import NL2SQLTool
         # Ensure the URI points to the correct database
-        if "talbotdevv1" not in DB_URI:
+        if "talbotdevv1" not in db_uri:
             # Update URI to include the correct database name
             # Replace the database name in the URI
-            if DB_URI.endswith("/"):
-                DB_URI = DB_URI + "talbotdevv1"
+            if db_uri.endswith("/"):
+                db_uri = db_uri + "talbotdevv1"
             else:
-                DB_URI = DB_URI + "/talbotdevv1"
-            print(f"Updated URI to: {DB_URI}")
+                db_uri = db_uri + "/talbotdevv1"
+            print(f"Updated URI to: {db_uri}")
         
         # Test database connection first
-        if test_database_connection(DB_URI):
+        if test_database_connection(db_uri):
             print("Creating NL2SQLTool instance...")
-            nl2sql_tool = NL2SQLTool(db_uri=DB_URI, default_schema=DEFAULT_SCHEMA)
+            nl2sql_tool = NL2SQLTool(db_uri=db_uri, default_schema=DEFAULT_SCHEMA)
             print(f"NL2SQL tool initialized successfully for database: {DATABASE_NAME}")
             print(f"Available tables: {', '.join(AVAILABLE_TABLES)}")
+            return nl2sql_tool
         else:
             print("❌ Cannot initialize NL2SQL tool - database connection failed")
-            nl2sql_tool = None
+            return None
     except Exception as e:
         print(f"❌ NL2SQL tool initialization failed: {e}")
         print(f"Error type: {type(e)}")
         print("Continuing without database search functionality...")
-        nl2sql_tool = None
-else:
-    print("❌ No database URI provided - Database search functionality disabled")
-    print("Please set POSTGRES_URI in your .env file")
+        return None
 
     # Method 2: If directory doesn't work, try adding individual files
     # md_files = glob.glob("docs-text/*.md")
@@ -265,11 +320,40 @@ else:
     #         print(f"Failed to add {file_path}: {e}")
 
 
-# Initialize the tool
-kb_tool = BedrockKBRetrieverTool(
-    knowledge_base_id=KB_ID,
-    number_of_results=5
-)
+
+def get_kb_tool():
+    """Bedrock Knowledge Base retriever tool"""
+    global _kb_tool
+    with _kb_tool_lock:
+        if _kb_tool is None:
+            from crewai_tools.aws.bedrock.knowledge_base.retriever_tool import BedrockKBRetrieverTool
+            # Initialize the tool
+            _kb_tool = BedrockKBRetrieverTool(
+                knowledge_base_id=KB_ID,
+                number_of_results=5
+            )
+        return _kb_tool
+
+def warm_up():
+    """Initialize everything that is otherwise set up on first use: crewai, the tools and DynamoDB"""
+    start = datetime.now()
+    import crewai
+    get_conversation_table()
+    get_nl2sql_tool()
+    get_kb_tool()
+    logger.info(f"Agent warm-up completed in {(datetime.now() - start).total_seconds():.1f}s")
+
+def start_warm_up():
+    """Run warm_up() in a background thread; first uses wait for whatever it is still initializing"""
+    def run():
+        try:
+            warm_up()
+        except Exception as e:
+            logger.error(f"Agent warm-up failed, resources will be initialized on first use: {e}")
+    thread = threading.Thread(target=run, name="agent-warmup", daemon=True)
+    thread.start()
+    return thread
+
 '''
 # Create Knowledge Expert Agent
 def create_knowledge_agent():
@@ -300,12 +384,14 @@ def create_knowledge_agent():
 '''
 # Create SQL Assistant Agent
 def create_sql_agent():
+    nl2sql_tool = get_nl2sql_tool()
     if nl2sql_tool is None:
         logger.warning("SQL agent not created - NL2SQL tool not available")
         print("Warning: SQL agent not created - NL2SQL tool not available")
         return None
     
     try:
+        from crewai import Agent
         logger.info("Creating SQL Assistant Agent with NL2SQL tool...")
         print("Creating SQL agent with NL2SQL tool...")
         agent = Agent(
@@ -333,6 +419,7 @@ def create_sql_agent():
 
 def create_kb_agent():
     try:
+        from crewai import Agent
         logger.info("Creating Knowledge Base Agent...")
         agent = Agent(
             role="Knowledge Base Agent",
@@ -343,7 +430,7 @@ def create_kb_agent():
             content from multiple sources, and providing clear, accurate answers to user questions.
             Always use the RAG tool to search through the knowledge base before answering.
             """,
-            tools=[kb_tool],
+            tools=[get_kb_tool()],
             verbose=False,
             allow_delegation=False,
             llm_config={
@@ -400,6 +487,7 @@ def create_sql_task(user_question: str, conversation_history: list = None, agent
         recent_history = conversation_history[-3:] if len(conversation_history) > 3 else conversation_history
         for exchange in recent_history:
             context += f"User: {exchange['user']}\nAI: {exchange['ai'][:200]}...\n\n"
+    from crewai import Task
     return Task(
         description=f"""
         Answer this question by querying the database using SQL.
@@ -427,6 +515,7 @@ def create_kb_task(user_question: str, conversation_history: list = None, agent=
         recent_history = conversation_history[-3:] if len(conversation_history) > 3 else conversation_history
         for exchange in recent_history:
             context += f"User: {exchange['user']}\nAI: {exchange['ai'][:200]}...\n\n"
+    from crewai import Task
     return Task(
         description=f"""
         Answer the user's question using the knowledge base available through the RAG tool.
@@ -446,6 +535,106 @@ def create_kb_task(user_question: str, conversation_history: list = None, agent=
         agent=agent
     )
 
+# route -> (label, agent factory, task factory)
+AGENT_ROUTES = {
+    KB: ("Knowledge Base", create_kb_agent, create_kb_task),
+    SQL: ("SQL Assistant", create_sql_agent, create_sql_task),
+}
+
+def available_routes(routes):
+    """Routes whose agent can run; database questions fall back to the knowledge base without the NL2SQL tool"""
+    if SQL in routes and get_nl2sql_tool() is None:
+        routes = [route for route in routes if route != SQL] or [KB]
+    return routes
+
+def create_route_agents(routes, user_question, conversation_history=None):
+    """
+    Fresh agents and tasks for the given routes, returned as ([agent], [task], [label]).
+    crewai keeps per-run state on Agent objects (their crew and the executor of the current task),
+    so agents are created per crew and never shared between crews running at the same time;
+    the tools behind them are built once per process and shared.
+    """
+    agents, tasks, labels = [], [], []
+    for route in routes:
+        label, create_agent, create_task = AGENT_ROUTES[route]
+        agent = create_agent()
+        if agent is None:
+            continue
+        agents.append(agent)
+        tasks.append(create_task(user_question, conversation_history, agent))
+        labels.append(label)
+    return agents, tasks, labels
+
+def run_route_crew(routes, user_question, conversation_history=None):
+    """Run the agents of the given routes as one sequential crew and return the answer text"""
+    from crewai import Crew, Process
+    agents, tasks, labels = create_route_agents(routes, user_question, conversation_history)
+    if not agents:
+        raise RuntimeError("No agents available")
+    logger.info(f"Running crew with {', '.join(labels)}...")
+    crew = Crew(agents=agents, tasks=tasks, verbose=False, process=Process.sequential)
+    return crew_output_text(crew.kickoff())
+
+# Phrases agents use when their source has nothing on the question
+NO_ANSWER_MARKERS = [
+    "not available in the knowledge base", "no relevant data", "no relevant information",
+    "could not find", "couldn't find", "unable to find", "no information", "no results",
+]
+
+def crew_output_text(crew_output):
+    """Answer text of a crew.kickoff() result"""
+    if hasattr(crew_output, 'raw_output'):
+        return crew_output.raw_output
+    elif hasattr(crew_output, 'result'):
+        return crew_output.result
+    elif hasattr(crew_output, 'raw'):
+        return crew_output.raw
+    return str(crew_output)
+
+def merge_agent_answers(answers):
+    """
+    Combine the answers of agents that ran in parallel, given as [(label, text or None)].
+    Agents that failed are dropped, and so are agents that found nothing when another one did;
+    a single remaining answer is returned as-is, several get one labeled section each.
+    Returns (answer, labels of the agents whose answers were used).
+    """
+    usable = [(label, text.strip()) for label, text in answers if text and text.strip()]
+    found = [(label, text) for label, text in usable if not any(marker in text.lower() for marker in NO_ANSWER_MARKERS)]
+    chosen = found or usable
+    if not chosen:
+        return "Sorry, I couldn't find an answer to your question.", [label for label, text in answers if text is not None]
+    if len(chosen) == 1:
+        return chosen[0][1], [chosen[0][0]]
+    return "\n\n".join(f"**{label}:**\n{text}" for label, text in chosen), [label for label, _ in chosen]
+
+def submit_route_crews(executor, routes, user_question, conversation_history=None):
+    """
+    Start one single-agent crew per route on the executor, so the agents' tasks, which don't depend
+    on each other, run at the same time. Returns [(label, future)] for collect_route_answers.
+    """
+    return [
+        (AGENT_ROUTES[route][0], executor.submit(run_route_crew, [route], user_question, conversation_history))
+        for route in routes
+    ]
+
+def collect_route_answers(runs):
+    """
+    Wait for the crews started by submit_route_crews and merge their answers; an agent that fails
+    is logged and left out. Returns (answer, labels of the agents used); raises if every agent failed.
+    """
+    answers = []
+    errors = []
+    for label, future in runs:
+        try:
+            answers.append((label, future.result()))
+        except Exception as e:
+            logger.error(f"{label} agent failed: {e}")
+            errors.append(e)
+            answers.append((label, None))
+    if len(errors) == len(runs):
+        raise errors[0]
+    return merge_agent_answers(answers)
+
 # Main conversational loop
 def run_knowledge_assistant():
     print("\n===== KNOWLEDGE BASE ASSISTANT =====")
@@ -471,85 +660,20 @@ def run_knowledge_assistant():
         logger.info(f"Processing user question: {user_question}")
 
         try:
-            # Prepare agents and tasks (only include valid agents)
-            agents = []
-            tasks = []
-            '''
-            # Add knowledge agent (always available)
-            logger.info("Creating Knowledge Agent...")
-            knowledge_agent = create_knowledge_agent()
-            if knowledge_agent is not None:
-                agents.append(knowledge_agent)
-                knowledge_task = create_knowledge_task(user_question, conversation_history, knowledge_agent)
-                tasks.append(knowledge_task)
-                logger.info("Knowledge agent ready and added to crew")
-                print(f"Knowledge agent ready")
-            else:
-                logger.error("Knowledge agent failed to create")
-                print("Knowledge agent failed to create")
-            '''
-            # Add SQL agent (only if available)
-            logger.info("Creating SQL Agent...")
-            sql_agent = create_sql_agent()
-            if sql_agent is not None:
-                agents.append(sql_agent)
-                sql_task = create_sql_task(user_question, conversation_history, sql_agent)
-                tasks.append(sql_task)
-                logger.info("SQL agent ready and added to crew")
-                print(f"SQL agent ready")
-            else:
-                logger.warning("SQL agent not available")
-                print("SQL agent not available")
-            
-            # Add Knowledge Base Agent (always available)
-            logger.info("Creating Knowledge Base Agent...")
-            kb_agent = create_kb_agent()
-            if kb_agent is not None:
-                agents.append(kb_agent)
-                kb_task = create_kb_task(user_question, conversation_history, kb_agent)
-                tasks.append(kb_task)
-                logger.info("Knowledge Base agent (aws kb) ready and added to crew")
-                print(f"Knowledge Base agent ready")
-            else:
-                logger.error("Knowledge Base agent not available")
-                print("Knowledge Base agent not available")
-            
-            # Ensure we have at least one agent
-            if not agents:
-                logger.error("No agents available")
-                result_str = "Error: No agents available. Please check your configuration."
-            elif len(agents) != len(tasks):
-                logger.error(f"Mismatch between agents ({len(agents)}) and tasks ({len(tasks)}) count")
-                result_str = "Error: Mismatch between agents and tasks count."
-            else:
-                logger.info(f"Running crew with {len(agents)} agent(s)...")
-                print(f"Running crew with {len(agents)} agent(s)...")
-                
-                # Log which agents are running
-                for i, agent in enumerate(agents):
-                    logger.info(f"Agent {i+1}: {agent.role}")
-                
-                # Run crew
-            crew = Crew(
-                    agents=agents,
-                    tasks=tasks,
-                verbose=False,
-                    process=Process.sequential
-            )
+            # Only the agents the question needs are run
+            previous_question = conversation_history[-1]['user'] if conversation_history else None
+            routes = available_routes(route_question(user_question, previous_question))
+            labels = [AGENT_ROUTES[route][0] for route in routes]
+            logger.info(f"Question routed to: {', '.join(labels)}")
+            print(f"Running crew with {', '.join(labels)}...")
 
             logger.info("Starting crew execution...")
-            crew_output = crew.kickoff()
-            logger.info("Crew execution completed")
-
-            if hasattr(crew_output, 'raw_output'):
-                result_str = crew_output.raw_output
-                logger.info("Using raw_output from crew result")
-            elif hasattr(crew_output, 'result'):
-                result_str = crew_output.result
-                logger.info("Using result from crew output")
+            if CREW_EXECUTION == "parallel" and len(routes) > 1:
+                with ThreadPoolExecutor(max_workers=len(routes)) as pool:
+                    result_str, _ = collect_route_answers(submit_route_crews(pool, routes, user_question, conversation_history))
             else:
-                result_str = str(crew_output)
-                logger.info("Using string representation of crew output")
+                result_str = run_route_crew(routes, user_question, conversation_history)
+            logger.info("Crew execution completed")
 
         except Exception as e:
             result_str = f"Error processing your question: {str(e)}"
@@ -576,6 +700,7 @@ def run_knowledge_assistant():
 # Test function to debug NL2SQL tool
 def test_nl2sql_tool():
     """Test the NL2SQL tool directly"""
+    nl2sql_tool = get_nl2sql_tool()
     if nl2sql_tool is None:
         print("NL2SQL tool is not available")
         return
@@ -592,6 +717,12 @@ def test_nl2sql_tool():
 
 # Main execution
 if __name__ == "__main__":
+    setup_logging()
+    # Tools and DynamoDB are set up while the user types the first question
+    if AGENT_WARMUP == "background":
+        start_warm_up()
+    elif AGENT_WARMUP == "blocking":
+        warm_up()
     # Uncomment the next line to test the NL2SQL tool
     # test_nl2sql_tool()
     run_knowledge_assistant()
\ No newline at end of file
@@ -0,0 +1,205 @@
+"""
+Configurable FAISS index types.
+The ingestion pipeline always produces an exact flat index; this module rebuilds it as an
+approximate (IVF, HNSW, PQ or SQ) index when configured, and on request (rebuild_index.py --report,
+retrieval_benchmark.py) writes a report of recall@k against exact search and per-query latency for
+every candidate type, over the indexes that are actually searched (the collection shards when
+sharding is on).
+
+Configuration:
+- FAISS_INDEX_TYPE: flat (default), ivf, hnsw, pq, ivfpq, sq8 or ivfsq8
+- FAISS_INDEX_FACTORY: raw faiss.index_factory string, overrides FAISS_INDEX_TYPE
+- FAISS_NPROBE: IVF lists searched per query (default 8)
+- FAISS_HNSW_EF_SEARCH: HNSW search depth (default 64)
+- FAISS_INDEX_REPORT_TYPES: comma-separated index types compared in index_report.json
+"""
+import faiss
+import json
+import math
+import numpy as np
+import os
+import time
+
+INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat").lower()
+INDEX_FACTORY = os.getenv("FAISS_INDEX_FACTORY")
+NPROBE = int(os.getenv("FAISS_NPROBE", "8"))
+HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+
+INDEX_TYPES = ["flat", "ivf", "hnsw", "pq", "ivfpq", "sq8", "ivfsq8"]
+# PQ training is slow on 1536-d vectors, so it is only benchmarked when asked for
+REPORT_INDEX_TYPES = os.getenv("FAISS_INDEX_REPORT_TYPES", "flat,ivf,hnsw,sq8,ivfsq8").lower().split(",")
+REPORT_FILENAME = "index_report.json"
+
+
+def _pq_subquantizers(dimension):
+    """Largest common sub-quantizer count that divides the vector dimension"""
+    for m in (64, 48, 32, 16, 8, 4, 2):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+def factory_string(index_type, ntotal, dimension):
+    """
+    Translate an index type into a faiss.index_factory string sized for the number of vectors.
+    nlist and the PQ code size shrink for small corpora so training always has enough points.
+    """
+    nlist = max(1, min(int(4 * math.sqrt(ntotal)), ntotal // 39))
+    m = _pq_subquantizers(dimension)
+    nbits = max(1, min(8, int(math.log2(max(ntotal // 39, 2)))))
+    factories = {
+        "flat": "Flat",
+        "ivf": f"IVF{nlist},Flat",
+        "hnsw": "HNSW32",
+        "pq": f"PQ{m}x{nbits}",
+        "ivfpq": f"IVF{nlist},PQ{m}x{nbits}",
+        "sq8": "SQ8",
+        "ivfsq8": f"IVF{nlist},SQ8",
+    }
+    if index_type not in factories:
+        raise ValueError(f"Unknown FAISS index type '{index_type}', expected one of {', '.join(INDEX_TYPES)}")
+    return factories[index_type]
+
+
+def _configure_search(index):
+    """Apply the search-time parameters (nprobe, efSearch) for approximate indexes"""
+    try:
+        faiss.extract_index_ivf(index).nprobe = NPROBE
+    except RuntimeError:
+        pass
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+
+
+def build_ann_index(vectors, spec):
+    """Build, train and fill an index from a factory string"""
+    index = faiss.index_factory(vectors.shape[1], spec)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    try:
+        # Context packing reconstructs the vectors of the hits, which IVF only supports with a direct map
+        faiss.extract_index_ivf(index).make_direct_map()
+    except RuntimeError:
+        pass
+    _configure_search(index)
+    return index
+
+
+def _evaluate(index, exact_ids, queries, k):
+    """Recall@k against the exact neighbours and per-query latency percentiles in milliseconds"""
+    latencies = []
+    hits = 0
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, ids = index.search(queries[i:i + 1], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(set(ids[0]) & set(exact_ids[i]))
+    latencies = np.array(latencies)
+    return {
+        "recall_at_k": hits / float(exact_ids.size),
+        "latency_ms_mean": float(latencies.mean()),
+        "latency_ms_p50": float(np.percentile(latencies, 50)),
+        "latency_ms_p95": float(np.percentile(latencies, 95)),
+        "latency_ms_p99": float(np.percentile(latencies, 99)),
+    }
+
+
+def benchmark_index_types(vectors, index_types=INDEX_TYPES, k=5, num_queries=200, queries=None):
+    """
+    Compare index types against the exact flat index.
+    By default the queries are a deterministic sample of the indexed vectors themselves.
+    """
+    ntotal, dimension = vectors.shape
+    if queries is None:
+        rng = np.random.default_rng(0)
+        sample = rng.choice(ntotal, size=min(num_queries, ntotal), replace=False)
+        queries = vectors[sample]
+    k = min(k, ntotal)
+
+    exact = faiss.IndexFlatL2(dimension)
+    exact.add(vectors)
+    _, exact_ids = exact.search(queries, k)
+
+    results = []
+    for index_type in index_types:
+        spec = factory_string(index_type, ntotal, dimension)
+        try:
+            start = time.perf_counter()
+            index = build_ann_index(vectors, spec)
+            build_seconds = time.perf_counter() - start
+        except RuntimeError as e:
+            results.append({"index_type": index_type, "factory": spec, "error": str(e)})
+            continue
+        result = {"index_type": index_type, "factory": spec, "build_seconds": build_seconds}
+        result.update(_evaluate(index, exact_ids, queries, k))
+        results.append(result)
+    return {"k": k, "num_vectors": ntotal, "num_queries": len(queries), "results": results}
+
+
+def exact_vectors(docsearch):
+    """
+    The original embeddings of every vector of a FAISS store, in position order. A flat index
+    returns them as stored; any other index type only approximates them (PQ and SQ codes) or may
+    not reconstruct at all, so the chunks are embedded again, which the embedding cache answers
+    without calling the model.
+    """
+    index = docsearch.index
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    if isinstance(faiss.downcast_index(index), faiss.IndexFlat):
+        return index.reconstruct_n(0, index.ntotal)
+    texts = [docsearch.docstore.search(docsearch.index_to_docstore_id[i]).page_content for i in range(index.ntotal)]
+    return np.asarray(docsearch.embedding_function.embed_documents(texts), dtype=np.float32)
+
+
+def apply_index_type(docsearch, vectors, index_type=INDEX_TYPE):
+    """
+    Swap the exact index of a freshly built FAISS store (whose vectors are passed in) for the
+    configured index type. Positions are unchanged, so the docstore mapping stays valid.
+    """
+    ntotal = docsearch.index.ntotal
+    if ntotal == 0:
+        return docsearch
+    spec = INDEX_FACTORY or factory_string(index_type, ntotal, vectors.shape[1])
+    if spec != "Flat":
+        print(f"Building {spec} index over {ntotal} vectors...")
+        docsearch.index = build_ann_index(vectors, spec)
+    return docsearch
+
+
+def write_index_report(folder_path, vector_sets, index_type=INDEX_TYPE):
+    """
+    Write index_report.json to folder_path comparing the report index types on each searched index:
+    vector_sets maps the index name (a collection shard, or "index" without sharding) to its exact
+    vectors. Every type is trained and benchmarked, so only rebuild_index.py --report and the
+    retrieval benchmark ask for it.
+    """
+    report_types = list(REPORT_INDEX_TYPES)
+    if index_type not in report_types:
+        report_types.append(index_type)
+    report = {"configured_index_type": index_type, "indexes": {}}
+    for name, vectors in vector_sets.items():
+        if len(vectors) == 0:
+            continue
+        result = benchmark_index_types(vectors, index_types=report_types)
+        report["indexes"][name] = result
+        print(f"Index report for {name} ({result['num_vectors']} vectors, {result['num_queries']} queries, "
+              f"recall@{result['k']} vs exact):")
+        for entry in result["results"]:
+            if "error" in entry:
+                print(f"  {entry['index_type']:<8} failed: {entry['error']}")
+            else:
+                print(f"  {entry['index_type']:<8} recall={entry['recall_at_k']:.3f} "
+                      f"p50={entry['latency_ms_p50']:.3f}ms p99={entry['latency_ms_p99']:.3f}ms")
+    os.makedirs(folder_path, exist_ok=True)
+    with open(os.path.join(folder_path, REPORT_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+
+def supports_in_place_delete(index):
+    """
+    True when removing vectors compacts the index (flat, PQ and SQ codes).
+    IVF and HNSW keep their old labels, which breaks the positional docstore mapping.
+    """
+    return isinstance(faiss.downcast_index(index), faiss.IndexFlatCodes)
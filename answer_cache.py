@@ -0,0 +1,98 @@
+"""
+Semantic answer cache for repeated questions.
+Answers are keyed by the question embedding: a new question whose embedding is close enough
+(cosine similarity >= threshold) to a cached one reuses that answer without retrieval or an LLM call.
+Entries expire after a TTL, the least recently used entry is evicted when the cache is full,
+and the whole cache is cleared whenever the FAISS index is rebuilt.
+"""
+from collections import OrderedDict
+import numpy as np
+import os
+import threading
+import time
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512"))
+
+
+class SemanticAnswerCache:
+    """Thread-safe, in-memory cache of chat results keyed by normalized question embeddings"""
+
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+                 max_entries=ANSWER_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+        # Stacked vectors of all entries, rebuilt lazily after the entries change
+        self._matrix = None
+        self._matrix_keys = []
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _expire(self, now):
+        """Drop entries older than the TTL"""
+        expired = [key for key, entry in self._entries.items() if now - entry["created"] > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def _similarity_matrix(self):
+        if self._matrix is None:
+            self._matrix_keys = list(self._entries.keys())
+            if self._matrix_keys:
+                self._matrix = np.stack([self._entries[key]["vector"] for key in self._matrix_keys])
+        return self._matrix
+
+    def lookup(self, query_vector):
+        """Return the cached result for the most similar question above the threshold, or None"""
+        query = self._normalize(query_vector)
+        with self._lock:
+            self._expire(time.time())
+            matrix = self._similarity_matrix()
+            if matrix is None:
+                self.misses += 1
+                return None
+
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            key = self._matrix_keys[best]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]["result"]
+
+    def store(self, question, query_vector, result):
+        """Cache a chat result, evicting the least recently used entry when full"""
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = {
+                "question": question,
+                "vector": self._normalize(query_vector),
+                "result": result,
+                "created": time.time()
+            }
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self):
+        """Forget every cached answer (called whenever the index changes)"""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self._matrix_keys = []
@@ -4,27 +4,139 @@ FastAPI endpoints for the chatbot
 Provides REST API access to the knowledge assistant functionality
 """
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Literal
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
 import uuid
 from datetime import datetime
 import logging
 import os
+import time
 from dotenv import load_dotenv
+from metrics import API_STAGE_SECONDS, API_REQUEST_SECONDS, render_metrics
+from question_router import KB, SQL, DIRECT, route_question, answer_mode
+from direct_answer import answer_directly, get_chain, get_kb_client
 
 # Import the agent functions
 from agent import (
-    create_kb_agent, create_sql_agent, 
-    create_kb_task, create_sql_task,
+    get_kb_tool, get_nl2sql_tool,
+    AGENT_ROUTES, run_route_crew, submit_route_crews, collect_route_answers, CREW_EXECUTION,
     save_conversation_to_dynamodb, 
     get_conversation_history_from_dynamodb,
+    setup_logging, warm_up, AGENT_WARMUP,
     logger
 )
 
 load_dotenv()
 
+# Crew runs (Bedrock retrieval + LLM calls) and DynamoDB calls are blocking, so they run on bounded
+# thread pools instead of the event loop. /chat requests beyond the crew workers wait in a bounded
+# queue; when the queue is full they get 429, and when they wait longer than the timeout, 503.
+CREW_WORKERS = int(os.getenv("API_CREW_WORKERS", "4"))
+CREW_QUEUE_SIZE = int(os.getenv("API_CREW_QUEUE_SIZE", "16"))
+CREW_QUEUE_TIMEOUT = float(os.getenv("API_CREW_QUEUE_TIMEOUT", "30"))
+IO_WORKERS = int(os.getenv("API_IO_WORKERS", "16"))
+
+crew_executor = ThreadPoolExecutor(max_workers=CREW_WORKERS, thread_name_prefix="crew")
+io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="dynamodb")
+
+# Admission state, only touched from the event loop
+chat_in_flight = 0
+crew_slots = None
+crew_slots_lock = None
+
+def get_crew_slots():
+    """Semaphore of free crew workers, created lazily inside the running event loop"""
+    global crew_slots, crew_slots_lock
+    if crew_slots is None:
+        crew_slots = asyncio.Semaphore(CREW_WORKERS)
+        crew_slots_lock = asyncio.Lock()
+    return crew_slots
+
+async def run_io(function, *args, **kwargs):
+    """Run a blocking DynamoDB call on the I/O pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor, lambda: function(*args, **kwargs))
+
+async def acquire_crew_slots(count=1):
+    """
+    Take count crew worker slots, or raise 503 after CREW_QUEUE_TIMEOUT.
+    Requests take their slots one request at a time, in arrival order, so two requests needing two
+    slots each can't both end up holding one and waiting for the other. Slots taken before a
+    timeout or a cancellation (client gone) are given back.
+    """
+    slots = get_crew_slots()
+    acquired = 0
+
+    async def take():
+        nonlocal acquired
+        async with crew_slots_lock:
+            for _ in range(count):
+                await slots.acquire()
+                acquired += 1
+
+    with API_STAGE_SECONDS.time(stage="queue_wait"):
+        try:
+            await asyncio.wait_for(take(), timeout=CREW_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            for _ in range(acquired):
+                slots.release()
+            logger.warning(f"No crew worker free after {CREW_QUEUE_TIMEOUT:g}s, rejecting request")
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy, please retry shortly",
+                headers={"Retry-After": str(max(1, int(CREW_QUEUE_TIMEOUT)))}
+            )
+        except BaseException:
+            for _ in range(acquired):
+                slots.release()
+            raise
+
+def release_slot_when_done(future):
+    """
+    Give a crew worker slot back when the worker thread finishes, not when the request goes away,
+    so a disconnected client can't push more work onto the pool than there are workers.
+    """
+    loop = asyncio.get_running_loop()
+    future.add_done_callback(lambda _: loop.call_soon_threadsafe(crew_slots.release))
+
+async def run_on_crew_pool(function, *args):
+    """Run a crew kickoff or a direct answer on the crew pool once a worker slot is free"""
+    await acquire_crew_slots()
+    try:
+        future = crew_executor.submit(function, *args)
+    except Exception:
+        crew_slots.release()
+        raise
+    release_slot_when_done(future)
+    return await asyncio.wrap_future(future)
+
+async def run_crews_in_parallel(routes, message, conversation_history):
+    """
+    Run every routed agent as its own single-agent crew at the same time and merge their answers.
+    The slots of all crews are taken before any of them starts, so a busy server turns the whole
+    request away with 503 instead of answering with half of the agents.
+    Returns (answer, labels of the agents whose answers were used).
+    """
+    await acquire_crew_slots(len(routes))
+    runs = []
+    try:
+        runs = submit_route_crews(crew_executor, routes, message, conversation_history)
+    finally:
+        # Started crews give their slot back when they finish, the rest (submit failed) right away
+        for _, future in runs:
+            release_slot_when_done(future)
+        for _ in range(len(routes) - len(runs)):
+            crew_slots.release()
+    # Only waits; the results and errors are read from the futures by collect_route_answers
+    await asyncio.gather(*(asyncio.wrap_future(future) for _, future in runs), return_exceptions=True)
+    return collect_route_answers(runs)
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Chatbot API",
@@ -41,10 +153,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_duration(request: Request, call_next):
+    """Record the duration of every request by route template (not raw path) and status code"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        API_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status
+        )
+
 # Pydantic models for request/response
 class ChatRequest(BaseModel):
     message: str
     session_id: Optional[str] = None
+    # "direct": one retrieval and one LLM call, "agent": the agent crew; unset lets the router decide
+    mode: Optional[Literal["direct", "agent"]] = None
 
 class ChatResponse(BaseModel):
     session_id: str
@@ -52,6 +184,7 @@ class ChatResponse(BaseModel):
     response: str
     timestamp: str
     agents_used: List[str]
+    mode: str = "agent"
 
 class ChatHistoryResponse(BaseModel):
     session_id: str
@@ -62,62 +195,104 @@ class ErrorResponse(BaseModel):
     error: str
     detail: Optional[str] = None
 
-# Global variables for agents (initialized once)
-kb_agent = None
-sql_agent = None
+# The agents themselves are created per crew (see agent.create_route_agents); their tools are built
+# once, by the warm-up or the first request
+agents_ready = False
+sql_available = False
+agents_error = None
+agents_lock = threading.Lock()
 
 def initialize_agents():
-    """Initialize agents once at startup"""
-    global kb_agent, sql_agent
+    """Build the agent tools once; concurrent callers wait for the first one"""
+    global agents_ready, sql_available, agents_error
     
+    with agents_lock:
+        if agents_ready:
+            return
+        try:
+            logger.info("Initializing agent tools for API...")
+            
+            # Knowledge Base retriever tool
+            get_kb_tool()
+            
+            # NL2SQL tool (if the database is reachable)
+            sql_available = get_nl2sql_tool() is not None
+            if not sql_available:
+                logger.warning("SQL agent not available - continuing without database functionality")
+            
+            agents_ready = True
+            agents_error = None
+            logger.info("Agent tools initialized successfully for API")
+            
+        except Exception as e:
+            agents_error = str(e)
+            logger.error(f"Error initializing agents: {e}")
+            raise e
+
+def warm_up_api():
+    """Create the agents, tools, DynamoDB table and direct-path clients ahead of the first request"""
     try:
-        logger.info("Initializing agents for API...")
-        
-        # Create Knowledge Base Agent
-        kb_agent = create_kb_agent()
-        if kb_agent is None:
-            logger.error("Failed to create Knowledge Base agent")
-            raise Exception("Knowledge Base agent initialization failed")
-        
-        # Create SQL Agent
-        sql_agent = create_sql_agent()
-        if sql_agent is None:
-            logger.warning("SQL agent not available - continuing without database functionality")
-        
-        logger.info("Agents initialized successfully for API")
-        
+        initialize_agents()
+        warm_up()
+        get_kb_client()
+        get_chain()
     except Exception as e:
-        logger.error(f"Error initializing agents: {e}")
-        raise e
+        logger.error(f"API warm-up failed, retrying on the first request: {e}")
 
-# Initialize agents at startup
+# Startup only configures logging, so workers start serving right away; the agents, tools and
+# DynamoDB table are initialized by the warm-up or on first use (AGENT_WARMUP)
 @app.on_event("startup")
 async def startup_event():
-    """Initialize agents when the API starts"""
-    try:
-        initialize_agents()
-        logger.info("API startup completed successfully")
-    except Exception as e:
-        logger.error(f"API startup failed: {e}")
-        raise e
+    """Set up logging and start the warm-up"""
+    setup_logging()
+    if AGENT_WARMUP == "blocking":
+        try:
+            initialize_agents()
+            warm_up()
+            get_kb_client()
+            get_chain()
+        except Exception as e:
+            logger.error(f"API startup failed: {e}")
+            raise e
+    elif AGENT_WARMUP == "background":
+        threading.Thread(target=warm_up_api, name="api-warmup", daemon=True).start()
+    logger.info("API startup completed successfully")
 
 def get_agents():
-    """Dependency to get initialized agents"""
-    if kb_agent is None:
-        raise HTTPException(status_code=500, detail="Knowledge Base agent not initialized")
-    return kb_agent, sql_agent
+    """Make sure the agent tools are built (blocking); returns whether the SQL agent is available"""
+    if not agents_ready:
+        try:
+            initialize_agents()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Knowledge Base agent not initialized: {str(e)}")
+    return sql_available
 
 @app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest, agents=Depends(get_agents)):
+async def chat_endpoint(request: ChatRequest):
     """
     Chat endpoint - Send a message and get a response
     
     - **message**: The user's question/message
     - **session_id**: Optional session ID for continuing a conversation
     """
+    global chat_in_flight
+    # Admission control: running crews plus the queue are bounded, everything beyond is turned away
+    if chat_in_flight >= CREW_WORKERS + CREW_QUEUE_SIZE:
+        logger.warning(f"Rejecting chat request: {chat_in_flight} requests already in flight")
+        raise HTTPException(
+            status_code=429,
+            detail="Too many concurrent chat requests, please retry shortly",
+            headers={"Retry-After": "1"}
+        )
+    chat_in_flight += 1
+    try:
+        return await handle_chat(request)
+    finally:
+        chat_in_flight -= 1
+
+async def handle_chat(request: ChatRequest):
+    """Body of /chat, run once the request has been admitted"""
     try:
-        kb_agent, sql_agent = agents
-        
         # Generate or use provided session ID
         if request.session_id:
             session_id = request.session_id
@@ -127,61 +302,41 @@ async def chat_endpoint(request: ChatRequest, agents=Depends(get_agents)):
             logger.info(f"Starting new session: {session_id}")
         
         # Get conversation history for context
-        conversation_history = get_conversation_history_from_dynamodb(session_id, limit=5)
+        with API_STAGE_SECONDS.time(stage="history_fetch") as history_timer:
+            conversation_history = await run_io(get_conversation_history_from_dynamodb, session_id, limit=5)
         logger.info(f"Retrieved {len(conversation_history)} previous conversations")
         
-        # Prepare agents and tasks
-        agents_list = []
-        tasks = []
-        agents_used = []
-        
-        # Add Knowledge Base Agent (always available)
-        if kb_agent:
-            agents_list.append(kb_agent)
-            kb_task = create_kb_task(request.message, conversation_history, kb_agent)
-            tasks.append(kb_task)
-            agents_used.append("Knowledge Base")
-            logger.info("Knowledge Base agent added to crew")
+        # Only the agents the question needs are run
+        previous_question = conversation_history[-1]['user'] if conversation_history else None
+        routes = route_question(request.message, previous_question)
+        # The mode of the request wins; otherwise plain knowledge base questions skip the agent loop
+        mode = request.mode or answer_mode(request.message, routes)
+        if mode != DIRECT:
+            # Only the agent path needs the agent tools, so direct answers never wait for them; a
+            # database question falls back to the knowledge base when the SQL agent is unavailable
+            if not await asyncio.to_thread(get_agents):
+                routes = [route for route in routes if route != SQL] or [KB]
+                mode = request.mode or answer_mode(request.message, routes)
+        logger.info(f"Question routed to: {', '.join(routes)} ({mode})")
         
-        # Add SQL Agent (if available)
-        if sql_agent:
-            agents_list.append(sql_agent)
-            sql_task = create_sql_task(request.message, conversation_history, sql_agent)
-            tasks.append(sql_task)
-            agents_used.append("SQL Assistant")
-            logger.info("SQL agent added to crew")
-        
-        if not agents_list:
-            raise HTTPException(status_code=500, detail="No agents available")
-        
-        # Run the crew
-        from crewai import Crew, Process
-        crew = Crew(
-            agents=agents_list,
-            tasks=tasks,
-            verbose=False,
-            process=Process.sequential
-        )
-        
-        logger.info("Starting crew execution...")
-        crew_output = crew.kickoff()
-        logger.info("Crew execution completed")
-        
-        # Extract response
-        if hasattr(crew_output, 'raw_output'):
-            response_text = crew_output.raw_output
-            logger.info("Using raw_output from crew result")
-        elif hasattr(crew_output, 'result'):
-            response_text = crew_output.result
-            logger.info("Using result from crew output")
+        if mode == DIRECT:
+            # One Bedrock KB retrieval and one LLM call
+            agents_used = ["Knowledge Base"]
+            with API_STAGE_SECONDS.time(stage="direct_answer") as answer_timer:
+                response_text = await run_on_crew_pool(answer_directly, request.message, conversation_history)
         else:
-            response_text = str(crew_output)
-            logger.info("Using string representation of crew output")
+            with API_STAGE_SECONDS.time(stage="crew") as answer_timer:
+                response_text, agents_used = await answer_with_agents(request.message, conversation_history, routes)
         
         # Save conversation to DynamoDB
-        save_success = save_conversation_to_dynamodb(session_id, request.message, response_text)
+        with API_STAGE_SECONDS.time(stage="save") as save_timer:
+            save_success = await run_io(save_conversation_to_dynamodb, session_id, request.message, response_text)
         if not save_success:
             logger.warning("Failed to save conversation to DynamoDB")
+        logger.info(
+            f"Stage timings for {session_id}: history_fetch={history_timer.elapsed:.3f}s "
+            f"{mode}={answer_timer.elapsed:.3f}s save={save_timer.elapsed:.3f}s"
+        )
         
         # Prepare response
         timestamp = datetime.now().isoformat()
@@ -191,7 +346,8 @@ async def chat_endpoint(request: ChatRequest, agents=Depends(get_agents)):
             message=request.message,
             response=response_text,
             timestamp=timestamp,
-            agents_used=agents_used
+            agents_used=agents_used,
+            mode=mode
         )
         
     except HTTPException:
@@ -200,6 +356,20 @@ async def chat_endpoint(request: ChatRequest, agents=Depends(get_agents)):
         logger.error(f"Error in chat endpoint: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+async def answer_with_agents(message, conversation_history, routes):
+    """Agent path of /chat: run the routed agents' tasks, returns (response text, agents used)"""
+    agents_used = [AGENT_ROUTES[route][0] for route in routes]
+    logger.info(f"Starting crew execution with {', '.join(agents_used)}...")
+    # The crew covers the Bedrock KB retrieval, the SQL queries and every LLM call; the agents are
+    # created in the crew worker, one set per crew
+    # Parallel crews need a worker each, so with fewer workers than agents the crew runs sequentially
+    if CREW_EXECUTION == "parallel" and 1 < len(routes) <= CREW_WORKERS:
+        response_text, agents_used = await run_crews_in_parallel(routes, message, conversation_history)
+    else:
+        response_text = await run_on_crew_pool(run_route_crew, routes, message, conversation_history)
+    logger.info("Crew execution completed")
+    return response_text, agents_used
+
 @app.get("/chathistory/{session_id}", response_model=ChatHistoryResponse)
 async def get_chat_history(session_id: str, limit: int = 50):
     """
@@ -212,7 +382,7 @@ async def get_chat_history(session_id: str, limit: int = 50):
         logger.info(f"Retrieving chat history for session: {session_id}")
         
         # Get conversation history from DynamoDB
-        conversations = get_conversation_history_from_dynamodb(session_id, limit=limit)
+        conversations = await run_io(get_conversation_history_from_dynamodb, session_id, limit=limit)
         
         if not conversations:
             logger.warning(f"No conversations found for session: {session_id}")
@@ -239,19 +409,31 @@ async def health_check():
     """Health check endpoint"""
     try:
         # Check if agents are initialized
-        if kb_agent is None:
-            return {"status": "unhealthy", "reason": "Knowledge Base agent not initialized"}
+        if not agents_ready:
+            if agents_error:
+                return {"status": "unhealthy", "reason": f"Knowledge Base agent not initialized: {agents_error}"}
+            return {"status": "starting", "reason": "Agents are initialized by the warm-up or the first request"}
         
         return {
             "status": "healthy",
             "knowledge_base_agent": "available",
-            "sql_agent": "available" if sql_agent else "unavailable",
+            "sql_agent": "available" if sql_available else "unavailable",
+            "chat_load": {
+                "in_flight": chat_in_flight,
+                "crew_workers": CREW_WORKERS,
+                "queue_size": CREW_QUEUE_SIZE
+            },
             "timestamp": datetime.now().isoformat()
         }
     except Exception as e:
         logger.error(f"Health check failed: {e}")
         return {"status": "unhealthy", "reason": str(e)}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Latency histograms in the Prometheus text format"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 async def root():
     """Root endpoint with API information"""
@@ -261,7 +443,8 @@ async def root():
         "endpoints": {
             "chat": "POST /chat - Send a message and get a response",
             "history": "GET /chathistory/{session_id} - Get chat history for a session",
-            "health": "GET /health - Health check"
+            "health": "GET /health - Health check",
+            "metrics": "GET /metrics - Latency histograms (Prometheus format)"
         },
         "documentation": "/docs"
     }
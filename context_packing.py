@@ -0,0 +1,218 @@
+"""
+Context assembly between the FAISS search and the LLM call.
+The search returns more candidates than are used (CONTEXT_FETCH_K); they are then
+1. cut adaptively at the largest drop in relevance, so weak tail hits are not sent at all,
+2. diversified with maximal marginal relevance (vectorized with numpy), dropping near-duplicate chunks,
+3. stripped of text already in the context: the chunk_overlap shared by neighbouring chunks of a file
+   and repeated lines; table rows only count as repeated within one file, since identical CPT/fee
+   rows from different payer files carry different meaning,
+4. packed in relevance order until the CONTEXT_TOKEN_BUDGET is spent.
+
+Configuration:
+- CONTEXT_FETCH_K: candidates fetched from FAISS (default 20)
+- CONTEXT_MIN_K: hits always kept by the adaptive cut (default 2)
+- CONTEXT_SCORE_GAP: smallest relevance drop treated as a cut-off (default 0.05)
+- CONTEXT_MMR_LAMBDA: relevance vs diversity trade-off, 1.0 is pure relevance (default 0.7)
+- CONTEXT_DUPLICATE_THRESHOLD: cosine similarity above which a chunk counts as a duplicate (default 0.97)
+- CONTEXT_TOKEN_BUDGET: maximum tokens of context per question (default 3000)
+"""
+from langchain.schema import Document
+from conversation_memory import count_tokens
+import numpy as np
+import os
+import re
+
+CONTEXT_FETCH_K = int(os.getenv("CONTEXT_FETCH_K", "20"))
+CONTEXT_MIN_K = int(os.getenv("CONTEXT_MIN_K", "2"))
+CONTEXT_SCORE_GAP = float(os.getenv("CONTEXT_SCORE_GAP", "0.05"))
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.97"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+
+# Shortest shared prefix/suffix treated as chunk overlap, and shortest line worth deduplicating
+MIN_OVERLAP_CHARS = 50
+MIN_DUPLICATE_LINE_CHARS = 12
+
+
+def search_candidates(docsearch, query_vector, fetch_k=CONTEXT_FETCH_K):
+    """
+    Search the FAISS index directly so the stored vectors of the hits can be reconstructed for MMR.
+    Returns ([(doc, distance)], vectors); vectors is None when the index type can't reconstruct them.
+    """
+    index = docsearch.index
+    if index.ntotal == 0:
+        return [], None
+    query = np.asarray([query_vector], dtype=np.float32)
+    distances, positions = index.search(query, min(fetch_k, index.ntotal))
+
+    candidates = []
+    kept_positions = []
+    for distance, position in zip(distances[0], positions[0]):
+        # FAISS pads with -1 when an approximate index finds fewer than fetch_k neighbours
+        if position == -1:
+            continue
+        doc = docsearch.docstore.search(docsearch.index_to_docstore_id[int(position)])
+        if not isinstance(doc, Document):
+            continue
+        candidates.append((doc, float(distance)))
+        kept_positions.append(position)
+
+    try:
+        vectors = index.reconstruct_batch(np.asarray(kept_positions, dtype=np.int64)) if kept_positions else None
+    except RuntimeError:
+        vectors = None
+    return candidates, vectors
+
+
+def relevance_from_distance(distances):
+    """Squared L2 distance to cosine similarity (exact for the unit-length OpenAI embeddings)"""
+    return 1.0 - np.asarray(distances, dtype=np.float32) / 2.0
+
+
+def adaptive_cutoff(relevance, min_k=CONTEXT_MIN_K, min_gap=CONTEXT_SCORE_GAP):
+    """
+    Number of hits (sorted by relevance) to keep: everything before the largest drop in relevance
+    after the first min_k hits, or all of them when no drop is at least min_gap
+    """
+    n = len(relevance)
+    if n <= min_k:
+        return n
+    gaps = relevance[min_k - 1:-1] - relevance[min_k:]
+    largest = int(np.argmax(gaps))
+    if gaps[largest] < min_gap:
+        return n
+    return min_k + largest
+
+
+def mmr_select(query_vector, vectors, k, lambda_mult=CONTEXT_MMR_LAMBDA,
+               duplicate_threshold=CONTEXT_DUPLICATE_THRESHOLD):
+    """
+    Maximal marginal relevance over all candidates at once: one matrix product for the
+    candidate/candidate similarities, then k argmax steps. Candidates that are near-duplicates of an
+    already selected one are never picked. Returns candidate positions in selection order.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms > 0, norms, 1.0)
+    query = np.asarray(query_vector, dtype=np.float32)
+    query = query / (np.linalg.norm(query) or 1.0)
+
+    relevance = vectors @ query
+    similarity = vectors @ vectors.T
+
+    selected = [int(np.argmax(relevance))]
+    max_similarity = similarity[selected[0]].copy()
+    while len(selected) < min(k, len(vectors)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[selected] = -np.inf
+        scores[max_similarity >= duplicate_threshold] = -np.inf
+        best = int(np.argmax(scores))
+        if scores[best] == -np.inf:
+            break
+        selected.append(best)
+        max_similarity = np.maximum(max_similarity, similarity[best])
+    return selected
+
+
+def _overlap_length(left, right, min_chars=MIN_OVERLAP_CHARS):
+    """Length of the longest suffix of left that is also a prefix of right (0 if shorter than min_chars)"""
+    if min(len(left), len(right)) < min_chars:
+        return 0
+    probe = right[:min_chars]
+    start = left.find(probe, max(0, len(left) - len(right)))
+    while start != -1:
+        if right.startswith(left[start:]):
+            return len(left) - start
+        start = left.find(probe, start + 1)
+    return 0
+
+
+def _trim_overlap(text, packed_texts):
+    """Cut the chunk_overlap this chunk shares with neighbouring chunks of the same file already in the context"""
+    for other in packed_texts:
+        head = _overlap_length(other, text)
+        if head:
+            text = text[head:]
+        tail = _overlap_length(text, other)
+        if tail:
+            text = text[:-tail]
+    return text
+
+
+def _compact_lines(text, seen_lines, source=None):
+    """
+    Drop lines that are already in the context and squeeze the column padding of markdown tables.
+    Table rows are keyed by their source, so the same row from another file is kept.
+    Lines without letters or digits (blank lines, table separators) are kept for structure.
+    Returns the text and the keys of the lines it adds to the context.
+    """
+    lines = []
+    new_lines = set()
+    for line in text.splitlines():
+        table_row = line.lstrip().startswith("|")
+        if table_row:
+            line = re.sub(r" {2,}", " ", line.strip())
+        normalized = " ".join(line.split()).lower()
+        key = (source, normalized) if table_row else (None, normalized)
+        if len(normalized) >= MIN_DUPLICATE_LINE_CHARS and re.search(r"[a-z0-9]", normalized):
+            if key in seen_lines or key in new_lines:
+                continue
+            new_lines.add(key)
+        lines.append(line)
+    return "\n".join(lines).strip(), new_lines
+
+
+def _truncate_to_tokens(text, max_tokens):
+    """Cut text to roughly max_tokens, at a line boundary when possible"""
+    cut = text[:max_tokens * 4]
+    while cut and count_tokens(cut) > max_tokens:
+        cut = cut[:int(len(cut) * 0.9)]
+    if "\n" in cut:
+        cut = cut[:cut.rfind("\n")]
+    return cut.strip()
+
+
+def pack_context(query_vector, candidates, vectors=None, max_k=5, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Select, deduplicate and pack search candidates into at most max_k documents within token_budget.
+    candidates is the [(doc, distance)] list from search_candidates, best first.
+    Returns new Documents whose page_content is exactly the text sent to the LLM, with the
+    distance in metadata["score"].
+    """
+    if not candidates:
+        return []
+
+    relevance = relevance_from_distance([distance for _, distance in candidates])
+    keep = adaptive_cutoff(relevance)
+    if vectors is not None:
+        order = mmr_select(query_vector, vectors[:keep], max_k)
+    else:
+        order = list(range(min(keep, max_k)))
+
+    packed = []
+    packed_texts_by_source = {}
+    seen_lines = set()
+    used_tokens = 0
+    for position in order:
+        doc, distance = candidates[position]
+        source = doc.metadata.get("source")
+        same_source = packed_texts_by_source.setdefault(source, [])
+        raw_text = _trim_overlap(doc.page_content, same_source)
+        text, new_lines = _compact_lines(raw_text, seen_lines, source)
+        if not re.search(r"[A-Za-z0-9]", text):
+            continue
+
+        tokens = count_tokens(text)
+        if used_tokens + tokens > token_budget:
+            if packed:
+                # Try the next (smaller) candidates, they may still fit
+                continue
+            # Always send something: the best hit is truncated to the budget
+            text = _truncate_to_tokens(text, token_budget)
+            tokens = count_tokens(text)
+
+        same_source.append(doc.page_content)
+        seen_lines.update(new_lines)
+        used_tokens += tokens
+        packed.append(Document(page_content=text, metadata={**doc.metadata, "score": distance}))
+    return packed
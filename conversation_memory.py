@@ -0,0 +1,209 @@
+"""
+Token-budgeted conversation memory for ChatBot.
+Keeps the most recent exchanges verbatim while they fit in a token budget; older exchanges are
+folded into a rolling summary that is updated incrementally (previous summary + the evicted
+exchanges only). The summarizer LLM call runs in a background thread, never inside the chat turn;
+until it finishes, the evicted exchanges stay in the history section verbatim. The prompt's history
+section is built once per change and cached.
+
+Configuration:
+- CHAT_HISTORY_TOKEN_BUDGET: tokens of recent exchanges plus summary (default 1500)
+- CHAT_SUMMARY_MAX_TOKENS: cap of the rolling summary (default 300)
+- CHAT_SUMMARY_WORKERS: threads running summary updates for all conversations (default 2)
+"""
+from concurrent.futures import ThreadPoolExecutor
+from langchain.prompts import PromptTemplate
+from langchain.schema.output_parser import StrOutputParser
+from functools import lru_cache
+import os
+import threading
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1500"))
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "300"))
+CHAT_SUMMARY_WORKERS = int(os.getenv("CHAT_SUMMARY_WORKERS", "2"))
+
+SUMMARY_TEMPLATE = """
+Progressively summarize the conversation between a user and an HR assistant.
+Extend the current summary with the new lines, keeping names, policies, dates, amounts and
+any open questions. Keep it under {max_words} words.
+
+Current summary:
+{summary}
+
+New lines of conversation:
+{new_lines}
+
+New summary:
+"""
+
+
+# Shared by every conversation; each conversation has at most one update queued or running
+_summary_pool = ThreadPoolExecutor(max_workers=CHAT_SUMMARY_WORKERS, thread_name_prefix="memory-summary")
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model_name):
+    """tiktoken encoding for a model, loaded once per process and shared by every conversation"""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except Exception as e:
+        # Unknown model or the encoding file can't be downloaded: fall back to the estimate
+        print(f"Token counting falls back to an estimate: {str(e)}")
+        return None
+
+
+def count_tokens(text, model_name="gpt-4o"):
+    """Token count of a string (approximated as 4 characters per token without tiktoken)"""
+    encoding = _get_encoding(model_name)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+class TokenBudgetMemory:
+    """Recent window plus rolling summary, bounded by a token budget"""
+
+    def __init__(self, llm=None, max_tokens=CHAT_HISTORY_TOKEN_BUDGET, summary_max_tokens=CHAT_SUMMARY_MAX_TOKENS,
+                 model_name="gpt-4o"):
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.summary_chain = None
+        if llm is not None:
+            self.summary_chain = PromptTemplate(
+                template=SUMMARY_TEMPLATE,
+                input_variables=["summary", "new_lines", "max_words"]
+            ) | llm | StrOutputParser()
+
+        self.model_name = model_name
+        # Guards the summary and the pending lines, which the summary thread updates
+        self._lock = threading.Lock()
+        self._summarizing = False
+        # Bumped by clear(), so a summary of the previous conversation is discarded
+        self._generation = 0
+        self.clear()
+
+    def count_tokens(self, text):
+        """Token count of a string for the memory's model"""
+        return count_tokens(text, self.model_name)
+
+    def is_empty(self):
+        """True when nothing has been said yet in this conversation"""
+        return not self.exchanges and not self.summary and not self._pending
+
+    def clear(self):
+        """Forget the whole conversation"""
+        with self._lock:
+            self._generation += 1
+            self.summary = ""
+            # Evicted exchange lines waiting for the summary thread, oldest first
+            self._pending = []
+            # Each exchange is (question, answer, token count of its formatted lines)
+            self.exchanges = []
+            self._recent_tokens = 0
+            self._history_section = None
+
+    @staticmethod
+    def _format_exchange(question, answer):
+        return f"User: {question}\nAssistant: {answer}\n"
+
+    def _pop_over_budget(self):
+        """Remove the oldest exchanges until the recent window fits in the budget (always keeping the latest)"""
+        evicted = []
+        while len(self.exchanges) > 1 and self._recent_tokens + self.count_tokens(self.summary) > self.max_tokens:
+            question, answer, tokens = self.exchanges.pop(0)
+            self._recent_tokens -= tokens
+            evicted.append(self._format_exchange(question, answer))
+        return "".join(evicted)
+
+    def _summary_inputs(self, new_lines):
+        return {
+            "summary": self.summary or "(none)",
+            "new_lines": new_lines,
+            "max_words": int(self.summary_max_tokens * 0.75)
+        }
+
+    def _truncate_summary(self, summary):
+        """Without a summarizer (or if it rambles) keep only the tail of the summary within its budget"""
+        if self.count_tokens(summary) <= self.summary_max_tokens:
+            return summary.strip()
+        return summary[-self.summary_max_tokens * 4:].strip()
+
+    def _add_exchange(self, inputs, outputs):
+        question, answer = inputs["question"], outputs["output"]
+        tokens = self.count_tokens(self._format_exchange(question, answer))
+        self.exchanges.append((question, answer, tokens))
+        self._recent_tokens += tokens
+        self._history_section = None
+
+    def save_context(self, inputs, outputs):
+        """
+        Record an exchange and fold anything over budget into the rolling summary.
+        The summarizer runs in the background, so this returns without waiting for the LLM.
+        """
+        self._add_exchange(inputs, outputs)
+        new_lines = self._pop_over_budget()
+        if not new_lines:
+            return
+        with self._lock:
+            if self.summary_chain is None:
+                self.summary = self._truncate_summary(f"{self.summary}\n{new_lines}")
+                return
+            self._pending.append(new_lines)
+            self._history_section = None
+            if self._summarizing:
+                # The running update picks these lines up when it is done
+                return
+            self._summarizing = True
+        _summary_pool.submit(self._update_summary)
+
+    async def asave_context(self, inputs, outputs):
+        """Async counterpart of save_context (which doesn't block either)"""
+        self.save_context(inputs, outputs)
+
+    def _update_summary(self):
+        """Summary thread: fold the pending lines into the summary until none are left"""
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._summarizing = False
+                    return
+                generation, count = self._generation, len(self._pending)
+                new_lines = "".join(self._pending)
+                inputs = self._summary_inputs(new_lines)
+            try:
+                summary = self.summary_chain.invoke(inputs)
+            except Exception as e:
+                # Fold the raw lines in, as without a summarizer, rather than lose them
+                print(f"Conversation summary update failed: {str(e)}")
+                summary = f"{self.summary}\n{new_lines}"
+            with self._lock:
+                if generation == self._generation:
+                    self.summary = self._truncate_summary(summary)
+                    del self._pending[:count]
+                    self._history_section = None
+
+    def history_section(self):
+        """
+        The chat_history_section of the prompt, rebuilt only after the memory changes.
+        Evicted exchanges the summary thread hasn't folded in yet are still listed verbatim.
+        """
+        with self._lock:
+            if self._history_section is None:
+                if self.is_empty():
+                    self._history_section = "This is the first question in our conversation."
+                else:
+                    parts = []
+                    if self.summary:
+                        parts.append(f"Summary of earlier conversation:\n{self.summary}\n")
+                    parts.append("Previous conversation:\n" + "".join(self._pending) + "".join(
+                        self._format_exchange(question, answer) for question, answer, _ in self.exchanges
+                    ))
+                    self._history_section = "\n".join(parts)
+            return self._history_section
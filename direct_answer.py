@@ -0,0 +1,131 @@
+"""
+Direct retrieve-then-answer path for plain knowledge base questions.
+The crew's Knowledge Base agent runs a ReAct-style loop that can call the Bedrock retriever and the
+LLM several times before it answers. answer_directly() does exactly one Bedrock Knowledge Base
+retrieve call and one LLM call with the retrieved chunks as context, the same shape as the RAG
+chain of main.ChatBot, so its latency is predictable. chatbot_api uses it when the question router
+or the request picks the direct mode.
+
+Configuration:
+- DIRECT_ANSWER_K: chunks retrieved from the knowledge base (default 5, like the agent's retriever tool)
+- DIRECT_ANSWER_MODEL: OpenAI model of the LLM call (default gpt-4o)
+
+boto3 and LangChain are imported on first use, so importing this module (which chatbot_api does)
+stays cheap.
+"""
+from dotenv import load_dotenv
+import os
+import threading
+
+load_dotenv()
+
+KB_ID = os.getenv("KB_ID")
+AWS_REGION = os.getenv("AWS_REGION", "us-west-2")
+DIRECT_ANSWER_K = int(os.getenv("DIRECT_ANSWER_K", "5"))
+DIRECT_ANSWER_MODEL = os.getenv("DIRECT_ANSWER_MODEL", "gpt-4o")
+
+TEMPLATE = """
+You are a knowledgeable assistant answering questions from the company knowledge base.
+Answer using only the context below, and give complete, detailed information: exact requirements
+and procedures, deadlines and timeframes, required forms or steps, and any conditions or exceptions.
+Cite the source document when possible.
+If the context doesn't contain enough information to answer completely, say so clearly.
+
+{chat_history_section}
+
+Context: {context}
+Question: {question}
+
+Detailed Answer:
+"""
+
+_lock = threading.Lock()
+_kb_client = None
+_llm = None
+_chain = None
+
+
+def get_kb_client():
+    """Bedrock Agent Runtime client, created on first use (boto3 clients are thread-safe)"""
+    global _kb_client
+    with _lock:
+        if _kb_client is None:
+            import boto3
+            _kb_client = boto3.client("bedrock-agent-runtime", region_name=AWS_REGION)
+        return _kb_client
+
+
+def set_llm(llm):
+    """Use another LLM (any LangChain runnable) for the answer call"""
+    global _llm, _chain
+    with _lock:
+        _llm, _chain = llm, None
+
+
+def get_chain():
+    """prompt | llm | parser, built on first use"""
+    global _llm, _chain
+    with _lock:
+        if _chain is None:
+            from langchain.prompts import PromptTemplate
+            from langchain.schema.output_parser import StrOutputParser
+            if _llm is None:
+                from langchain_openai import ChatOpenAI
+                _llm = ChatOpenAI(
+                    model=DIRECT_ANSWER_MODEL,
+                    max_tokens=2000,
+                    timeout=60,
+                    temperature=0.1,
+                    max_retries=2,
+                    api_key=os.getenv("OPENAI_API_KEY")
+                )
+            prompt = PromptTemplate(template=TEMPLATE, input_variables=["context", "question", "chat_history_section"])
+            _chain = prompt | _llm | StrOutputParser()
+        return _chain
+
+
+def retrieve_from_kb(question, k=DIRECT_ANSWER_K):
+    """One Bedrock Knowledge Base retrieve call; returns the hits as Documents, best first"""
+    from langchain.schema import Document
+    response = get_kb_client().retrieve(
+        knowledgeBaseId=KB_ID,
+        retrievalQuery={"text": question},
+        retrievalConfiguration={"vectorSearchConfiguration": {"numberOfResults": k}}
+    )
+    docs = []
+    for result in response.get("retrievalResults", []):
+        text = result.get("content", {}).get("text", "")
+        if not text:
+            continue
+        location = result.get("location", {})
+        source = location.get("s3Location", {}).get("uri") or location.get("type", "")
+        docs.append(Document(page_content=text, metadata={"source": source, "score": result.get("score")}))
+    return docs
+
+
+def history_section(conversation_history):
+    """The last 3 exchanges, trimmed the same way as in the agent tasks"""
+    if not conversation_history:
+        return ""
+    section = "Previous conversation context:\n"
+    for exchange in conversation_history[-3:]:
+        section += f"User: {exchange['user']}\nAI: {exchange['ai'][:200]}...\n\n"
+    return section
+
+
+def format_context(docs):
+    """Chunks separated by blank lines, each headed by its source so the LLM can cite it"""
+    return "\n\n".join(
+        f"[{os.path.basename(doc.metadata['source'])}]\n{doc.page_content}" if doc.metadata.get("source") else doc.page_content
+        for doc in docs
+    )
+
+
+def answer_directly(question, conversation_history=None):
+    """Answer a question with one retrieval and one LLM call"""
+    docs = retrieve_from_kb(question)
+    return get_chain().invoke({
+        "context": format_context(docs),
+        "question": question,
+        "chat_history_section": history_section(conversation_history)
+    })
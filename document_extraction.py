@@ -0,0 +1,140 @@
+"""
+Streaming text extraction for PDF and DOCX sources, used by the ingestion pipeline.
+Both readers keep memory bounded by the part being processed, never the whole document:
+- PDF: pages are extracted in page ranges (PDF_PAGES_PER_TASK pages per task); each task opens
+  the file itself, so ranges run in parallel worker processes and only their text is sent back
+- DOCX: word/document.xml is read straight from the zip with iterparse and every top-level
+  paragraph or table is dropped once converted. The output is markdown (headings from the
+  Heading/Title styles, tables as pipe tables), yielded in sections that repeat their ancestor
+  headings so markdown_chunker keeps the full heading path
+
+pypdf is imported lazily, so markdown-only deployments don't need it.
+"""
+from xml.etree.ElementTree import iterparse
+import os
+import re
+import zipfile
+
+PDF_PAGES_PER_TASK = int(os.getenv("INGEST_PDF_PAGES_PER_TASK", "8"))
+# Approximate size of the DOCX sections handed to the chunker
+DOCX_SECTION_CHARS = 20000
+
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+HEADING_STYLE_PATTERN = re.compile(r"^heading\s*([1-6])$", re.IGNORECASE)
+
+
+def pdf_page_ranges(file_path, pages_per_task=PDF_PAGES_PER_TASK):
+    """Split a PDF into (start, stop) page ranges; only the page tree is read, not the page contents"""
+    from pypdf import PdfReader
+    with open(file_path, "rb") as f:
+        page_count = len(PdfReader(f).pages)
+    return [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+
+
+def _clean_pdf_text(text):
+    """Collapse the space runs PDF text extraction leaves in justified lines and headers"""
+    lines = [re.sub(r"[ \t ]{2,}", " ", line).strip() for line in text.splitlines()]
+    return "\n".join(lines).strip()
+
+
+def extract_pdf_pages(file_path, start, stop):
+    """Yield (page_number, text) for pages start..stop-1; page numbers are 1-based"""
+    from pypdf import PdfReader
+    with open(file_path, "rb") as f:
+        reader = PdfReader(f)
+        for index in range(start, stop):
+            yield index + 1, _clean_pdf_text(reader.pages[index].extract_text() or "")
+
+
+def _docx_style(paragraph):
+    style = paragraph.find(f"{WORD_NAMESPACE}pPr/{WORD_NAMESPACE}pStyle")
+    return style.get(f"{WORD_NAMESPACE}val", "") if style is not None else ""
+
+
+def _docx_text(element, line_break="\n"):
+    """Text of a paragraph or table cell: runs, tabs and line breaks"""
+    parts = []
+    for node in element.iter():
+        if node.tag == f"{WORD_NAMESPACE}t" and node.text:
+            parts.append(node.text)
+        elif node.tag == f"{WORD_NAMESPACE}tab":
+            parts.append(" ")
+        elif node.tag in (f"{WORD_NAMESPACE}br", f"{WORD_NAMESPACE}cr"):
+            parts.append(line_break)
+        elif node.tag == f"{WORD_NAMESPACE}p" and parts and node is not element:
+            parts.append(line_break)
+    return "".join(parts).strip()
+
+
+def _docx_table(table):
+    """A Word table as markdown pipe-table rows, the first row being the header"""
+    rows = []
+    for row in table.iter(f"{WORD_NAMESPACE}tr"):
+        cells = [_docx_text(cell, " ").replace("|", "/") for cell in row.findall(f"{WORD_NAMESPACE}tc")]
+        if any(cells):
+            rows.append("| " + " | ".join(cells) + " |")
+    if len(rows) > 1:
+        column_count = rows[0].count(" | ") + 1
+        rows.insert(1, "|" + "---|" * column_count)
+    return rows
+
+
+def iter_docx_sections(file_path, section_chars=DOCX_SECTION_CHARS):
+    """Yield the document as markdown sections of roughly section_chars characters"""
+    headings = []           # current heading stack: [(level, markdown line)]
+    prefix, lines, size = [], [], 0
+
+    def section():
+        return "\n\n".join(prefix + lines)
+
+    with zipfile.ZipFile(file_path) as archive, archive.open("word/document.xml") as document:
+        body = None
+        table_depth = 0
+        for event, element in iterparse(document, events=("start", "end")):
+            if event == "start":
+                if element.tag == f"{WORD_NAMESPACE}body":
+                    body = element
+                elif element.tag == f"{WORD_NAMESPACE}tbl":
+                    table_depth += 1
+                continue
+
+            block = []
+            heading_level = None
+            if element.tag == f"{WORD_NAMESPACE}tbl":
+                table_depth -= 1
+                if table_depth > 0:
+                    continue
+                block = ["\n".join(_docx_table(element))]
+            elif element.tag == f"{WORD_NAMESPACE}p" and table_depth == 0:
+                style = _docx_style(element)
+                if style.upper().startswith("TOC"):
+                    # The table of contents only repeats the headings
+                    continue
+                match = HEADING_STYLE_PATTERN.match(style)
+                heading_level = int(match.group(1)) if match else 1 if style == "Title" else None
+                text = _docx_text(element, " " if heading_level else "\n")
+                if text:
+                    block = [f"{'#' * heading_level} {text}" if heading_level else text]
+            else:
+                continue
+
+            # Converted blocks are dropped from the tree, which keeps iterparse's memory flat
+            if body is not None:
+                body.clear()
+            if not block or not block[0]:
+                continue
+
+            # Start a new section at a heading once the current one is big enough, or anywhere
+            # when a long stretch has no headings at all
+            if lines and (size >= section_chars and heading_level or size >= 4 * section_chars):
+                yield section()
+                # Ancestor headings of what comes next, so the chunker keeps the heading path
+                prefix = [line for level, line in headings if not heading_level or level < heading_level]
+                lines, size = [], 0
+            if heading_level:
+                headings = [(level, line) for level, line in headings if level < heading_level]
+                headings.append((heading_level, block[0]))
+            lines.extend(block)
+            size += sum(len(line) for line in block)
+    if lines:
+        yield section()
@@ -0,0 +1,142 @@
+"""
+Persistent on-disk cache for document embeddings.
+Chunks are keyed by a hash of their content and the embedding model, so rebuilding
+the FAISS index from unchanged text makes no embedding requests at all.
+"""
+from langchain_core.embeddings import Embeddings
+from array import array
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "embedding_cache")
+DEFAULT_MAX_SIZE_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+
+# SQLite limits the number of host parameters in a single statement
+_LOOKUP_BATCH_SIZE = 500
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings object and stores every document embedding in a SQLite file.
+    Least recently used entries are evicted once the cache grows past max_size_mb.
+    """
+
+    def __init__(self, embeddings, cache_dir=DEFAULT_CACHE_DIR, max_size_mb=DEFAULT_MAX_SIZE_MB, model_name=None):
+        self.embeddings = embeddings
+        # Vectors from different models must never be mixed, so the model is part of the key
+        self.model_name = model_name or getattr(embeddings, "model", None) or embeddings.__class__.__name__
+        self.max_size_bytes = max_size_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_path = os.path.join(cache_dir, "embeddings.sqlite")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.cache_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings(last_access)")
+        self._conn.commit()
+
+    def _key(self, text):
+        """Content hash of a chunk for the current embedding model"""
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys):
+        """Return a dict of key -> vector for the keys that are already cached"""
+        found = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), _LOOKUP_BATCH_SIZE):
+                batch = keys[start:start + _LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                        [(now, key) for key, _ in rows]
+                    )
+            self._conn.commit()
+        return found
+
+    def _store(self, items):
+        """Persist (key, vector) pairs and evict old entries if the cache is over budget"""
+        now = time.time()
+        rows = []
+        for key, vector in items:
+            blob = array("f", vector).tobytes()
+            rows.append((key, self.model_name, blob, len(blob), now))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+            self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is back under its size limit"""
+        total_size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        if total_size <= self.max_size_bytes:
+            return
+
+        # Evict down to 90% of the limit so we don't evict again on every insert
+        to_free = total_size - int(self.max_size_bytes * 0.9)
+        stale_keys = []
+        for key, size in self._conn.execute("SELECT key, size FROM embeddings ORDER BY last_access ASC"):
+            stale_keys.append((key,))
+            to_free -= size
+            if to_free <= 0:
+                break
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", stale_keys)
+        self._conn.commit()
+        print(f"Evicted {len(stale_keys)} entries from the embedding cache")
+
+    def embed_documents(self, texts):
+        """Embed documents, only calling the wrapped model for chunks that are not cached"""
+        keys = [self._key(text) for text in texts]
+        cached = self._lookup(keys)
+
+        # Deduplicate misses so repeated chunks are only embedded once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        self.hits += len(texts) - sum(1 for key in keys if key in missing)
+        self.misses += len(missing)
+
+        if missing:
+            new_vectors = self.embeddings.embed_documents(list(missing.values()))
+            new_items = list(zip(missing.keys(), new_vectors))
+            self._store(new_items)
+            cached.update(new_items)
+
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text):
+        """Queries are not cached here, they go straight to the wrapped model"""
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text):
+        """Use the wrapped model's native async query embedding"""
+        return await self.embeddings.aembed_query(text)
+
+    def close(self):
+        """Close the underlying SQLite connection"""
+        with self._lock:
+            self._conn.close()
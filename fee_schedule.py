@@ -0,0 +1,305 @@
+"""
+Structured lookup table for the payer fee schedules and the in-network payer list.
+The docs-text/pi_mapping-*.md and in_network_payers.md files are markdown tables; at ingestion
+time they are parsed into dictionaries keyed by payer and code and saved next to the FAISS index.
+ChatBot.chat tries answer() first, so questions that only ask for a fee ("Aetna max for 99204") or a
+network status get an exact answer without a vector search or an LLM call.
+"""
+from langchain.schema import Document
+import json
+import os
+import re
+
+FEE_SCHEDULE_FILENAME = "fee_schedule.json"
+IN_NETWORK_FILENAME = "in_network_payers.md"
+ALL_PAYERS_FILENAME = "pi_mapping-allpayers.md"
+
+# Per-payer fee schedule files and the payer name used as lookup key
+PAYER_FILES = {
+    "pi_mapping-aetna.md": "Aetna",
+    "pi_mapping-anthem.md": "Anthem",
+    "pi_mapping-frontpath.md": "FrontPath",
+    "pi_mapping-medicalmutual.md": "Medical Mutual",
+    "pi_mapping-medicare.md": "Medicare",
+    "pi_mapping-paramount.md": "Paramount",
+    "pi_mapping-uhc.md": "UHC",
+}
+
+# How payers are written in questions and in the all-payers sheet header
+PAYER_ALIASES = {
+    "aetna": "Aetna",
+    "anthem": "Anthem",
+    "front path": "FrontPath",
+    "frontpath": "FrontPath",
+    "medical mutual": "Medical Mutual",
+    "mmo": "Medical Mutual",
+    "medicare": "Medicare",
+    "paramount": "Paramount",
+    "uhc": "UHC",
+    "united healthcare": "UHC",
+    "unitedhealthcare": "UHC",
+    "optum": "UHC",
+}
+
+# Words too common in payer names to identify a payer on their own
+GENERIC_PAYER_WORDS = {"medicare", "medicaid", "health", "ohio", "the", "hold", "apply", "united", "american", "national"}
+
+CODE_PATTERN = re.compile(r"^(\d{5}|[A-Z]\d{4})$")
+QUESTION_CODE_PATTERN = re.compile(r"\b(\d{5}|[A-Z]\d{4})\b")
+AMOUNT_PATTERN = re.compile(r"^\$?\d[\d,]*(\.\d+)?$")
+DEFAULT_LABEL = "Max Amount"
+
+# Network status questions answered from the table: the whole question has to be "is/are <payers>
+# in network?" or "what is the network status of <payers>?", so questions that only mention the
+# network ("out of network claims", "network error") or ask something else as well go to RAG
+NETWORK_STATUS_PATTERN = re.compile(
+    r"^\s*(?:(?:is|are)\b[^?]*?\b(?:in[- ]network|out[- ]of[- ]network)"
+    r"|(?:what(?:'s| is) the )?network status (?:of|for)\b[^?]*?)[\s?.!]*$",
+    re.IGNORECASE
+)
+
+# Fee questions answered from the table: with the payers and codes taken out, the whole question may
+# only be made of these words ("What is the max amount Aetna pays for 99204?", "UHC allowable for
+# 90837"), and has to ask for an amount. Anything else ("why was my Aetna claim for 99204 denied",
+# "... and how do I bill it", "is Anthem in network for 99204") goes to RAG
+FEE_QUESTION_WORDS = {
+    "what", "what's", "whats", "is", "are", "the", "a", "does", "do", "will", "how", "much", "for", "of",
+    "on", "and", "to", "cpt", "code", "codes", "max", "maximum", "amount", "amounts", "allowable",
+    "allowables", "allowed", "rate", "rates", "fee", "fees", "schedule", "pay", "pays", "paid",
+    "reimburse", "reimburses", "reimbursement", "payment",
+}
+FEE_AMOUNT_WORDS = {
+    "much", "max", "maximum", "amount", "amounts", "allowable", "allowables", "allowed", "rate", "rates",
+    "fee", "fees", "pay", "pays", "paid", "reimburse", "reimburses", "reimbursement", "payment",
+}
+
+
+def _table_rows(text):
+    """Split markdown table lines into lists of stripped cells, skipping separator rows"""
+    rows = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line.startswith("|"):
+            continue
+        cells = [cell.strip() for cell in line.strip("|").split("|")]
+        if all(re.fullmatch(r":?-*:?", cell) for cell in cells):
+            continue
+        rows.append(cells)
+    return rows
+
+
+def _format_amount(value):
+    """Normalize '96.17' and '$96.17' to '$96.17'"""
+    return value if value.startswith("$") else f"${value}"
+
+
+def _normalize_payer(text):
+    """Map a payer name or alias to its lookup key, or None"""
+    return PAYER_ALIASES.get(text.strip().lower())
+
+
+def parse_payer_file(text):
+    """
+    Parse a single-payer fee schedule.
+    Rows without a code that contain labels (e.g. '| | Max Amount | LPCC |') set the column labels
+    for the code rows that follow.
+    """
+    entries = {}
+    labels = []
+    for cells in _table_rows(text):
+        first = cells[0]
+        if CODE_PATTERN.match(first):
+            for position, cell in enumerate(cells[1:], start=1):
+                if AMOUNT_PATTERN.match(cell):
+                    label = labels[position] if position < len(labels) and labels[position] else DEFAULT_LABEL
+                    entries.setdefault(first, []).append({"label": label, "amount": _format_amount(cell)})
+        elif not first and any(cells[1:]):
+            labels = cells
+    return entries
+
+
+def parse_all_payers_file(text):
+    """
+    Parse the all-payers sheet: the first row names the payer of each column and the
+    second column holds the service description.
+    Returns ({payer: {code: [entries]}}, {code: description})
+    """
+    rows = _table_rows(text)
+    if not rows:
+        return {}, {}
+    header = rows[0]
+    entries = {}
+    descriptions = {}
+    for cells in rows[1:]:
+        code = cells[0]
+        if not CODE_PATTERN.match(code):
+            continue
+        if len(cells) > 1 and cells[1]:
+            descriptions[code] = cells[1]
+        for position, cell in enumerate(cells[2:], start=2):
+            payer = _normalize_payer(header[position]) if position < len(header) else None
+            if payer and AMOUNT_PATTERN.match(cell):
+                entries.setdefault(payer, {}).setdefault(code, []).append(
+                    {"label": DEFAULT_LABEL, "amount": _format_amount(cell)}
+                )
+    return entries, descriptions
+
+
+def parse_in_network_file(text):
+    """Parse in_network_payers.md into a list of payer rows"""
+    payers = []
+    for cells in _table_rows(text)[1:]:
+        if len(cells) < 5 or not cells[1]:
+            continue
+        payers.append({
+            "payor_id": cells[0],
+            "name": cells[1],
+            "type": cells[2],
+            "in_network": cells[3],
+            "out_of_network": cells[4],
+        })
+    return payers
+
+
+def build_fee_schedule(docs_directory, index_path):
+    """Parse all fee schedule tables in docs_directory and save the lookup table next to the index"""
+    fees = {}
+    for filename, payer in PAYER_FILES.items():
+        file_path = os.path.join(docs_directory, filename)
+        if not os.path.exists(file_path):
+            continue
+        with open(file_path, "r", encoding="utf-8") as f:
+            for code, entries in parse_payer_file(f.read()).items():
+                fees[f"{payer}|{code}"] = {"entries": entries, "source": filename}
+
+    descriptions = {}
+    all_payers_path = os.path.join(docs_directory, ALL_PAYERS_FILENAME)
+    if os.path.exists(all_payers_path):
+        with open(all_payers_path, "r", encoding="utf-8") as f:
+            all_payer_entries, descriptions = parse_all_payers_file(f.read())
+        # The dedicated payer files win; the combined sheet only fills in missing codes
+        for payer, codes in all_payer_entries.items():
+            for code, entries in codes.items():
+                fees.setdefault(f"{payer}|{code}", {"entries": entries, "source": ALL_PAYERS_FILENAME})
+
+    in_network = []
+    in_network_path = os.path.join(docs_directory, IN_NETWORK_FILENAME)
+    if os.path.exists(in_network_path):
+        with open(in_network_path, "r", encoding="utf-8") as f:
+            in_network = parse_in_network_file(f.read())
+
+    table = {"fees": fees, "descriptions": descriptions, "in_network": in_network}
+    os.makedirs(index_path, exist_ok=True)
+    tmp_path = os.path.join(index_path, FEE_SCHEDULE_FILENAME + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(table, f, indent=2)
+    os.replace(tmp_path, os.path.join(index_path, FEE_SCHEDULE_FILENAME))
+    print(f"Fee schedule lookup built: {len(fees)} payer/code entries, {len(in_network)} network payers")
+    return FeeSchedule(table, docs_directory)
+
+
+class FeeSchedule:
+    """In-memory fee schedule and network lookup with a question-answering fast path"""
+
+    def __init__(self, table, docs_directory="docs-text"):
+        self.fees = table.get("fees", {})
+        self.descriptions = table.get("descriptions", {})
+        self.in_network = table.get("in_network", [])
+        self.docs_directory = docs_directory
+        # Longest alias first so "medical mutual" wins over shorter overlaps
+        self._aliases = sorted(PAYER_ALIASES, key=len, reverse=True)
+
+    @classmethod
+    def load(cls, index_path, docs_directory="docs-text"):
+        """Load the lookup table saved by build_fee_schedule, building it if it is missing"""
+        table_path = os.path.join(index_path, FEE_SCHEDULE_FILENAME)
+        if not os.path.exists(table_path):
+            return build_fee_schedule(docs_directory, index_path)
+        with open(table_path, "r", encoding="utf-8") as f:
+            return cls(json.load(f), docs_directory)
+
+    def lookup(self, payer, code):
+        """Exact fee schedule entries for a payer and code, or None"""
+        return self.fees.get(f"{payer}|{code}")
+
+    def _find_payers(self, question):
+        """Payers mentioned in the question, in order of first appearance"""
+        lowered = f" {question.lower()} "
+        found = []
+        for alias in self._aliases:
+            if re.search(rf"\b{re.escape(alias)}\b", lowered) and PAYER_ALIASES[alias] not in found:
+                found.append(PAYER_ALIASES[alias])
+        return found
+
+    def _is_fee_question(self, question):
+        """True when the whole question asks for the fee of payers and codes (see FEE_QUESTION_WORDS)"""
+        rest = f" {question.lower()} "
+        for alias in self._aliases:
+            rest = re.sub(rf"\b{re.escape(alias)}\b", " ", rest)
+        rest = QUESTION_CODE_PATTERN.sub(" ", rest.upper()).lower()
+        words = set(re.findall(r"[a-z][a-z']*", rest))
+        return words <= FEE_QUESTION_WORDS and bool(words & FEE_AMOUNT_WORDS)
+
+    def _source_doc(self, filename, text):
+        """Document shown as the source of a fast-path answer"""
+        return Document(
+            page_content=text,
+            metadata={"source": os.path.join(self.docs_directory, filename), "score": 0.0}
+        )
+
+    def _answer_fees(self, payers, codes):
+        lines = []
+        docs = []
+        for payer in payers:
+            for code in codes:
+                result = self.lookup(payer, code)
+                if result is None:
+                    continue
+                description = self.descriptions.get(code)
+                title = f"{payer} allowable for {code}" + (f" ({description})" if description else "")
+                amounts = "\n".join(f"- {entry['label']}: {entry['amount']}" for entry in result["entries"])
+                lines.append(f"{title}:\n{amounts}")
+                docs.append(self._source_doc(result["source"], f"{title}:\n{amounts}"))
+        if not lines:
+            return None
+        return {"response": "\n\n".join(lines), "relevant_docs": docs}
+
+    def _answer_network(self, question, payers):
+        lowered = question.lower()
+        matches = [row for row in self.in_network if len(row["name"]) > 3 and row["name"].lower() in lowered]
+        if not matches:
+            # Fall back to the distinctive first word of the payer name ("Oscar" for "Oscar Health Insurance")
+            words = set(re.findall(r"[a-z]+", lowered))
+            matches = [
+                row for row in self.in_network
+                if (first := row["name"].lower().split()[0]) not in GENERIC_PAYER_WORDS and len(first) > 3 and first in words
+            ]
+        if not matches:
+            aliases = [alias for alias in self._aliases if PAYER_ALIASES[alias] in payers]
+            matches = [row for row in self.in_network if any(alias in row["name"].lower() for alias in aliases)]
+        if not matches:
+            return None
+        lines = []
+        for row in matches:
+            if row["in_network"].upper() == "X":
+                status = "In Network"
+            elif row["out_of_network"].upper() == "X":
+                status = "Out of Network"
+            else:
+                status = row["in_network"] or row["out_of_network"] or "Unknown"
+            lines.append(f"- {row['name']} (Payor ID {row['payor_id']}, {row['type']}): {status}")
+        text = "Network status:\n" + "\n".join(lines)
+        return {"response": text, "relevant_docs": [self._source_doc(IN_NETWORK_FILENAME, text)]}
+
+    def answer(self, question):
+        """
+        Answer fee schedule and network status questions directly from the table.
+        Returns a chat-style result dict, or None when the question needs the full RAG chain.
+        """
+        payers = self._find_payers(question)
+        if NETWORK_STATUS_PATTERN.match(question):
+            return self._answer_network(question, payers)
+        codes = QUESTION_CODE_PATTERN.findall(question.upper())
+        if not payers or not codes or not self._is_fee_question(question):
+            return None
+        return self._answer_fees(payers, codes)
@@ -0,0 +1,84 @@
+"""
+Per-file manifest stored next to the FAISS index.
+For every source file it records the content hash, mtime and the IDs of the chunks
+it produced, so the index can be updated incrementally when only a few files change.
+"""
+import hashlib
+import json
+import os
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+def file_sha256(file_path):
+    """Compute the SHA-256 of a file without reading it into memory at once"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_key(file_path):
+    """
+    Path used both as manifest key and as the 'source' of the chunks. It is resolved to an absolute
+    path and made relative to the working directory, so "docs-text/a.md", "./docs-text/a.md" and
+    the absolute path of the same file share one key.
+    """
+    path = os.path.abspath(file_path)
+    try:
+        return os.path.relpath(path)
+    except ValueError:
+        # Windows: a file on another drive has no relative path
+        return path
+
+
+def make_chunk_ids(file_path, file_hash, count):
+    """Deterministic chunk IDs for a file version"""
+    name = os.path.basename(file_path)
+    return [f"{name}:{file_hash[:12]}:{i}" for i in range(count)]
+
+
+def make_entry(file_path, file_hash, chunk_ids):
+    """Build the manifest entry for a file that has just been indexed"""
+    return {
+        "hash": file_hash,
+        "mtime": os.path.getmtime(file_path),
+        "chunk_ids": list(chunk_ids)
+    }
+
+
+def load_manifest(index_path):
+    """Load the manifest for an index, or None if the index was built without one"""
+    manifest_path = os.path.join(index_path, MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error reading index manifest: {str(e)}")
+        return None
+
+
+def save_manifest(index_path, manifest):
+    """Write the manifest atomically so a crash never leaves a half-written file"""
+    os.makedirs(index_path, exist_ok=True)
+    manifest_path = os.path.join(index_path, MANIFEST_FILENAME)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def file_changed(entry, file_path):
+    """
+    Check whether a file differs from its manifest entry.
+    Returns (changed, file_hash). The mtime is compared first so unchanged files are not re-hashed.
+    """
+    if entry is not None and entry.get("mtime") == os.path.getmtime(file_path):
+        return False, entry["hash"]
+    file_hash = file_sha256(file_path)
+    if entry is not None and entry.get("hash") == file_hash:
+        return False, file_hash
+    return True, file_hash
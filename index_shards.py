@@ -0,0 +1,266 @@
+"""
+Per-collection index shards with query routing.
+docs-text mixes unrelated collections (HR handbook, billing manual, payer mappings, support tickets),
+so a single search lets the large handbook push out billing chunks. The live index is split into
+one FAISS index per collection, and a cheap router picks the shards worth searching:
+1. keywords: the collections whose keywords appear in the question, if any do,
+2. otherwise centroids: the collections whose mean chunk vector is within CENTROID_MARGIN of the
+   most similar one.
+The selected shards are searched in parallel (FAISS releases the GIL) and their hits merged by distance.
+
+Shards are built once, when a snapshot is written, from the exact embeddings (never from the
+quantized vectors of a PQ or SQ index), and stored in its shards/ folder; loading a snapshot only
+maps them from disk. Collections are assigned by file name (see COLLECTIONS), taken
+from the manifest's chunk IDs; chunks from files that match none go to "general".
+
+Configuration:
+- INDEX_SHARDING: 1 (default) to shard and route, 0 to always search the whole index
+- INDEX_ROUTER_CENTROID_MARGIN: similarity below the best centroid still routed to (default 0.05)
+"""
+from concurrent.futures import ThreadPoolExecutor
+from langchain_community.vectorstores import FAISS
+from langchain.schema import Document
+from ann_index import INDEX_FACTORY, INDEX_TYPE, build_ann_index, factory_string
+from context_packing import CONTEXT_FETCH_K, search_candidates
+from mmap_store import read_faiss_index
+import faiss
+import fnmatch
+import json
+import numpy as np
+import os
+import re
+
+INDEX_SHARDING = os.getenv("INDEX_SHARDING", "1").lower() not in ("0", "false", "no")
+CENTROID_MARGIN = float(os.getenv("INDEX_ROUTER_CENTROID_MARGIN", "0.05"))
+DEFAULT_COLLECTION = "general"
+
+# Files in a snapshot's shards/ folder: collections.json and centroids.npy, then
+# <collection>.faiss and <collection>.ids.json (docstore ID of each shard position) per shard
+SHARDS_DIRECTORY = "shards"
+COLLECTIONS_FILENAME = "collections.json"
+CENTROIDS_FILENAME = "centroids.npy"
+
+# collection -> file name patterns (matched case-insensitively against the source file name)
+COLLECTIONS = {
+    "handbook": ["handbook*", "employee handbook*"],
+    "billing": ["bh_manual*", "billingai*"],
+    "payers": ["pi_mapping-*", "in_network_payers*", "*by_payer*"],
+    "tickets": ["*tickets*"],
+}
+
+# collection -> words and phrases that send a question to it regardless of the centroids. A match
+# skips the centroid route, so only terms specific to one collection belong here: generic words
+# ("employee", "network", "error") would confine questions about other collections to this one
+ROUTER_KEYWORDS = {
+    "handbook": [
+        "handbook", "pto", "paid time off", "vacation", "holiday", "holidays", "leave of absence",
+        "sick leave", "harassment", "dress code", "payroll", "overtime", "termination", "tuition",
+    ],
+    "billing": [
+        "billing", "billed", "claim", "claims", "cpt", "modifier", "modifiers", "denial",
+        "prior authorization", "medicaid", "invoice", "self pay", "self-pay",
+    ],
+    "payers": [
+        "payer", "payers", "in network", "in-network", "out of network", "fee schedule", "max amount",
+        "allowable", "reimburse", "aetna", "anthem", "uhc", "medicare", "medical mutual",
+        "paramount", "frontpath", "termedstaff", "caresource", "molina", "buckeye", "oscar",
+    ],
+    "tickets": [
+        "ticket", "tickets", "emr", "login", "log in", "password", "printer", "it support",
+        "unfinalize", "unfinalized",
+    ],
+}
+
+
+def collection_for_source(source):
+    """Collection of a chunk, from the name of the file it came from"""
+    name = os.path.basename(source or "").lower()
+    for collection, patterns in COLLECTIONS.items():
+        if any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+            return collection
+    return DEFAULT_COLLECTION
+
+
+def collection_positions(docsearch, manifest=None):
+    """
+    Positions of a FAISS store's vectors per collection.
+    Collections come from the manifest's chunk IDs; chunks it doesn't list (or every chunk,
+    without a manifest) are decoded from the docstore to read their source.
+    """
+    collection_by_id = {}
+    if manifest is not None:
+        for source, entry in manifest["files"].items():
+            collection = collection_for_source(source)
+            collection_by_id.update((chunk_id, collection) for chunk_id in entry["chunk_ids"])
+
+    positions_by_collection = {}
+    for position in range(docsearch.index.ntotal):
+        doc_id = docsearch.index_to_docstore_id.get(position)
+        collection = collection_by_id.get(doc_id)
+        if collection is None:
+            doc = docsearch.docstore.search(doc_id) if doc_id is not None else None
+            collection = collection_for_source(doc.metadata.get("source") if isinstance(doc, Document) else None)
+        positions_by_collection.setdefault(collection, []).append(position)
+    return positions_by_collection
+
+
+def _keyword_pattern(keywords):
+    return re.compile(r"\b(?:" + "|".join(re.escape(keyword) for keyword in keywords) + r")\b", re.IGNORECASE)
+
+
+_KEYWORD_PATTERNS = {collection: _keyword_pattern(keywords) for collection, keywords in ROUTER_KEYWORDS.items()}
+
+# Shared by every ShardedIndex, so swapping in a new index doesn't leave threads behind
+_search_pool = ThreadPoolExecutor(max_workers=len(COLLECTIONS) + 1, thread_name_prefix="shard-search")
+
+
+def _build_shard_index(vectors):
+    """Same index type as the live index, sized for the shard; exact search if that can't be built"""
+    spec = INDEX_FACTORY or factory_string(INDEX_TYPE, len(vectors), vectors.shape[1])
+    try:
+        return build_ann_index(vectors, spec)
+    except RuntimeError:
+        return build_ann_index(vectors, "Flat")
+
+
+class ShardedIndex:
+    """One FAISS store per collection, sharing the docstore of the live index"""
+
+    def __init__(self, shards, centroids):
+        # collection -> FAISS store, collection -> unit-length mean vector
+        self.shards = shards
+        self.collections = list(shards)
+        self._centroids = np.stack([centroids[c] for c in self.collections]) if shards else None
+
+    @classmethod
+    def build(cls, docsearch, manifest=None, vectors=None):
+        """
+        Split a FAISS store by collection, training the shard indexes on vectors (the exact
+        embeddings, see ann_index.exact_vectors) or, when not given, on the vectors the index
+        reconstructs. Returns None when the index is empty or its vectors can't be reconstructed,
+        in which case the whole index is searched as before.
+        """
+        index = docsearch.index
+        if index.ntotal == 0:
+            return None
+        if vectors is None:
+            try:
+                vectors = index.reconstruct_n(0, index.ntotal)
+            except RuntimeError as e:
+                print(f"Index sharding disabled, vectors can't be reconstructed: {str(e)}")
+                return None
+
+        shards, centroids = {}, {}
+        for collection, positions in sorted(collection_positions(docsearch, manifest).items()):
+            shard_vectors = np.ascontiguousarray(vectors[positions], dtype=np.float32)
+            shards[collection] = FAISS(
+                embedding_function=docsearch.embedding_function,
+                index=_build_shard_index(shard_vectors),
+                docstore=docsearch.docstore,
+                index_to_docstore_id={i: docsearch.index_to_docstore_id[p] for i, p in enumerate(positions)}
+            )
+            centroid = shard_vectors.mean(axis=0)
+            norm = np.linalg.norm(centroid)
+            centroids[collection] = centroid / norm if norm > 0 else centroid
+        print("Index shards: " + ", ".join(f"{c}={shards[c].index.ntotal}" for c in shards))
+        return cls(shards, centroids)
+
+    def save(self, folder_path):
+        """Store the shard indexes, their docstore IDs and the centroids in a snapshot folder"""
+        shards_path = os.path.join(folder_path, SHARDS_DIRECTORY)
+        os.makedirs(shards_path, exist_ok=True)
+        for collection, shard in self.shards.items():
+            faiss.write_index(shard.index, os.path.join(shards_path, f"{collection}.faiss"))
+            with open(os.path.join(shards_path, f"{collection}.ids.json"), "w", encoding="utf-8") as f:
+                json.dump([shard.index_to_docstore_id[i] for i in range(shard.index.ntotal)], f)
+        np.save(os.path.join(shards_path, CENTROIDS_FILENAME), self._centroids)
+        # Written last: a folder without it is treated as having no shards
+        with open(os.path.join(shards_path, COLLECTIONS_FILENAME), "w", encoding="utf-8") as f:
+            json.dump(self.collections, f)
+
+    @classmethod
+    def load(cls, folder_path, docsearch):
+        """
+        Open the shards stored in a snapshot folder, sharing the docstore of its index (docsearch).
+        Returns None for snapshots written without shards.
+        """
+        shards_path = os.path.join(folder_path, SHARDS_DIRECTORY)
+        try:
+            with open(os.path.join(shards_path, COLLECTIONS_FILENAME), "r", encoding="utf-8") as f:
+                collections = json.load(f)
+        except OSError:
+            return None
+        shards = {}
+        for collection in collections:
+            with open(os.path.join(shards_path, f"{collection}.ids.json"), "r", encoding="utf-8") as f:
+                ids = json.load(f)
+            shards[collection] = FAISS(
+                embedding_function=docsearch.embedding_function,
+                index=read_faiss_index(os.path.join(shards_path, f"{collection}.faiss")),
+                docstore=docsearch.docstore,
+                index_to_docstore_id=dict(enumerate(ids))
+            )
+        centroids = np.load(os.path.join(shards_path, CENTROIDS_FILENAME))
+        return cls(shards, dict(zip(collections, centroids)))
+
+    def route(self, query_vector, question=None):
+        """Collections worth searching for a question: its keyword matches, else the closest centroids"""
+        if question:
+            matched = [c for c in self.collections if c in _KEYWORD_PATTERNS and _KEYWORD_PATTERNS[c].search(question)]
+            if matched:
+                return matched
+        similarities = self._centroids @ np.asarray(query_vector, dtype=np.float32)
+        best = float(similarities.max())
+        return [c for c, similarity in zip(self.collections, similarities) if similarity >= best - CENTROID_MARGIN]
+
+    def search(self, query_vector, question=None, collections=None, fetch_k=CONTEXT_FETCH_K):
+        """
+        Search the routed shards, or exactly the given collections (a metadata filter), and merge
+        their hits. Same return value as context_packing.search_candidates.
+        """
+        if collections is None:
+            collections = self.route(query_vector, question)
+        collections = [c for c in collections if c in self.shards]
+        if not collections:
+            return [], None
+
+        if len(collections) == 1:
+            results = [search_candidates(self.shards[collections[0]], query_vector, fetch_k)]
+        else:
+            futures = [_search_pool.submit(search_candidates, self.shards[c], query_vector, fetch_k) for c in collections]
+            results = [future.result() for future in futures]
+
+        merged = []
+        for candidates, vectors in results:
+            for i, (doc, distance) in enumerate(candidates):
+                merged.append((distance, doc, None if vectors is None else vectors[i]))
+        merged.sort(key=lambda item: item[0])
+        merged = merged[:fetch_k]
+
+        candidates = [(doc, distance) for distance, doc, _ in merged]
+        if not merged or any(vector is None for _, _, vector in merged):
+            return candidates, None
+        return candidates, np.stack([vector for _, _, vector in merged])
+
+
+def save_shards(docsearch, folder_path, manifest=None, vectors=None):
+    """
+    Build the shards of a snapshot that is being written, from the exact vectors, and store them in it.
+    Returns the ShardedIndex, or None when sharding is off or the index can't be sharded.
+    """
+    if not INDEX_SHARDING:
+        return None
+    shards = ShardedIndex.build(docsearch, manifest, vectors)
+    if shards is not None:
+        shards.save(folder_path)
+    return shards
+
+
+def load_shards(folder_path, docsearch):
+    """Shards of a published snapshot; snapshots written before shards were stored get them built in memory"""
+    if not INDEX_SHARDING or docsearch.index.ntotal == 0:
+        return None
+    shards = ShardedIndex.load(folder_path, docsearch)
+    if shards is None:
+        shards = ShardedIndex.build(docsearch)
+    return shards
@@ -0,0 +1,167 @@
+"""
+Versioned index snapshots with an atomic CURRENT pointer.
+Every build or update writes a complete new snapshot folder; it only becomes live once CURRENT
+is switched to it with os.replace, so readers never see a partially written index.
+
+Layout of the index folder:
+- CURRENT                   name of the live snapshot
+- snapshots/<version>/      index.faiss, docstore files, manifest.json, shards/, fee_schedule.json,
+                            index_report.json
+- WRITE.lock                flock held while a process builds, publishes and prunes snapshots
+- REBUILDER.lock            flock held by the one index watcher that rebuilds on docs changes
+
+Several processes (API workers, Streamlit, rebuild_index.py) can serve the same index folder.
+snapshot_write_lock() serializes the writers, so CURRENT and pruning never race, and
+acquire_rebuilder_lock() elects a single watcher to rebuild; the others only reload CURRENT.
+On platforms without fcntl (Windows) the locks are no-ops, so run a single process there.
+
+write_snapshot() is the one sequence that writes a snapshot, used by full builds, incremental
+updates, the legacy index conversion and rebuild_index.py.
+
+An index folder without CURRENT (built before snapshots existed) is used as-is until the first
+update writes a snapshot.
+"""
+from contextlib import contextmanager
+from ann_index import apply_index_type, exact_vectors, write_index_report
+from fee_schedule import build_fee_schedule
+from index_manifest import save_manifest
+from index_shards import collection_positions, save_shards
+from mmap_store import save_mmap_index
+import os
+import shutil
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+CURRENT_FILENAME = "CURRENT"
+SNAPSHOTS_DIRECTORY = "snapshots"
+WRITE_LOCK_FILENAME = "WRITE.lock"
+REBUILDER_LOCK_FILENAME = "REBUILDER.lock"
+# Old snapshots kept besides the live one, so processes still serving them are not cut off
+SNAPSHOTS_TO_KEEP = int(os.getenv("INDEX_SNAPSHOTS_TO_KEEP", "2"))
+
+
+def _snapshots_root(index_root):
+    return os.path.join(index_root, SNAPSHOTS_DIRECTORY)
+
+
+def current_snapshot(index_root):
+    """Name of the live snapshot, or None for an index folder without snapshots"""
+    try:
+        with open(os.path.join(index_root, CURRENT_FILENAME), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    if name and os.path.isdir(os.path.join(_snapshots_root(index_root), name)):
+        return name
+    return None
+
+
+def resolve_index_path(index_root):
+    """Folder holding the live index: the CURRENT snapshot, or the index folder itself"""
+    name = current_snapshot(index_root)
+    return os.path.join(_snapshots_root(index_root), name) if name else index_root
+
+
+def new_snapshot_path(index_root):
+    """Create and return an empty folder for the next snapshot; names sort by creation time"""
+    now = time.time_ns()
+    version = time.strftime("%Y%m%d-%H%M%S", time.gmtime(now // 1_000_000_000)) + f".{now % 1_000_000_000:09d}-{os.getpid()}"
+    path = os.path.join(_snapshots_root(index_root), version)
+    os.makedirs(path)
+    return path
+
+
+def publish_snapshot(index_root, snapshot_path):
+    """Atomically point CURRENT at a fully written snapshot"""
+    current_path = os.path.join(index_root, CURRENT_FILENAME)
+    tmp_path = f"{current_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(os.path.normpath(snapshot_path)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, current_path)
+
+
+def prune_snapshots(index_root, keep=SNAPSHOTS_TO_KEEP):
+    """
+    Delete all but the live snapshot and the `keep` newest others.
+    Open (mmapped) files of a deleted snapshot stay readable on POSIX until they are closed;
+    folders that can't be deleted yet (Windows) are retried on the next prune.
+    """
+    snapshots_root = _snapshots_root(index_root)
+    if not os.path.isdir(snapshots_root):
+        return
+    live = current_snapshot(index_root)
+    older = sorted((name for name in os.listdir(snapshots_root) if name != live), reverse=True)
+    for name in older[keep:]:
+        try:
+            shutil.rmtree(os.path.join(snapshots_root, name))
+        except OSError as e:
+            print(f"Could not remove old index snapshot {name}: {str(e)}")
+
+
+@contextmanager
+def snapshot_write_lock(index_root):
+    """Hold the index folder's write lock (blocking) while snapshots are written, published and pruned"""
+    os.makedirs(index_root, exist_ok=True)
+    with open(os.path.join(index_root, WRITE_LOCK_FILENAME), "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def acquire_rebuilder_lock(index_root):
+    """
+    Try to become the process that rebuilds the index folder. Returns the open lock file, held
+    until it is closed or the process exits, or None when another process holds it.
+    """
+    os.makedirs(index_root, exist_ok=True)
+    lock_file = open(os.path.join(index_root, REBUILDER_LOCK_FILENAME), "a")
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+    return lock_file
+
+
+def write_snapshot(index_root, docsearch, manifest, docs_directory="docs-text", full_build=False, write_report=False):
+    """
+    Write a FAISS store as a complete new snapshot of index_root, then publish it and prune old ones:
+    1. collection shards, trained on the exact embeddings
+    2. full_build (docsearch holds the exact flat index of a fresh build): swap in the configured
+       ANN index type
+    3. write_report: index_report.json over the indexes that are searched (the shards when sharding is on)
+    4. index and docstore in the mmap format, manifest, fee schedule lookup table
+    The caller holds snapshot_write_lock. Returns (docsearch, shards, fee_schedule, snapshot_path).
+    """
+    snapshot_path = new_snapshot_path(index_root)
+    vectors = exact_vectors(docsearch)
+    shards = save_shards(docsearch, snapshot_path, manifest, vectors)
+    if full_build:
+        docsearch = apply_index_type(docsearch, vectors)
+    if write_report and len(vectors):
+        if shards is not None:
+            vector_sets = {c: vectors[p] for c, p in sorted(collection_positions(docsearch, manifest).items())}
+        else:
+            vector_sets = {"index": vectors}
+        write_index_report(snapshot_path, vector_sets)
+
+    save_mmap_index(docsearch, snapshot_path)
+    if manifest is not None:
+        save_manifest(snapshot_path, manifest)
+    fee_schedule = build_fee_schedule(docs_directory, snapshot_path)
+
+    publish_snapshot(index_root, snapshot_path)
+    prune_snapshots(index_root)
+    return docsearch, shards, fee_schedule, snapshot_path
@@ -0,0 +1,107 @@
+"""
+Background hot-reload of the FAISS index.
+IndexWatcher polls the docs directory from a daemon thread. When the files change (and have stopped
+changing for one poll interval, so half-copied files are not indexed) it runs the engine's incremental
+update, which writes a new snapshot and swaps it in (see index_snapshots.py). It also picks up
+snapshots published by other processes, such as rebuild_index.py.
+
+When several processes serve the same index folder, only the watcher holding the folder's rebuilder
+lock re-indexes; the others just load the snapshots it publishes. If the rebuilder exits, the next
+watcher to poll takes the lock over.
+
+Chats are never blocked: the update is built off to the side and the live index reference is
+replaced in one assignment once the new snapshot is complete.
+"""
+from ingestion import discover_files
+from index_snapshots import acquire_rebuilder_lock
+import os
+import threading
+
+# Seconds between polls of the docs directory; 0 disables the watcher started by main.get_engine()
+INDEX_WATCH_INTERVAL = float(os.getenv("INDEX_WATCH_INTERVAL", "30"))
+
+
+def docs_signature(docs_directory):
+    """Name, size and mtime of every indexed file; any edit, addition or removal changes it"""
+    signature = []
+    for file_path in discover_files(docs_directory):
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            continue
+        signature.append((file_path, stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+
+class IndexWatcher:
+    """Polls a docs directory and keeps the engine's index in sync with it"""
+
+    def __init__(self, engine, docs_directory="docs-text", interval=INDEX_WATCH_INTERVAL):
+        self.engine = engine
+        self.docs_directory = docs_directory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        # The index is assumed to match the docs at startup; changes made while stopped are
+        # picked up by the next update_documents call
+        self._indexed_signature = None
+        self._pending_signature = None
+        # Open rebuilder lock file while this process is the one that re-indexes
+        self._rebuilder_lock = None
+
+    def start(self):
+        self._rebuilder_lock = acquire_rebuilder_lock(self.engine.faiss_index_path)
+        self._indexed_signature = docs_signature(self.docs_directory)
+        self._thread = threading.Thread(target=self._run, name="index-watcher", daemon=True)
+        self._thread.start()
+        if self._rebuilder_lock is not None:
+            print(f"Watching {self.docs_directory} for changes every {self.interval:g}s")
+        else:
+            print(f"Another process rebuilds {self.engine.faiss_index_path}; reloading its snapshots every {self.interval:g}s")
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._rebuilder_lock is not None:
+            self._rebuilder_lock.close()
+            self._rebuilder_lock = None
+
+    def is_rebuilder(self):
+        """True if this process re-indexes; takes the role over when its previous holder has exited"""
+        if self._rebuilder_lock is None:
+            self._rebuilder_lock = acquire_rebuilder_lock(self.engine.faiss_index_path)
+            if self._rebuilder_lock is not None:
+                # Changes the previous rebuilder didn't get to are found by one incremental update
+                self._indexed_signature = None
+                self._pending_signature = None
+        return self._rebuilder_lock is not None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                # Keep serving the current index and try again on the next poll
+                print(f"Index watcher error: {str(e)}")
+
+    def poll(self):
+        """One check: load a snapshot published elsewhere, then re-index changed docs once they settle"""
+        self.engine.reload_current_snapshot()
+        if not self.is_rebuilder():
+            return False
+
+        signature = docs_signature(self.docs_directory)
+        if signature == self._indexed_signature:
+            self._pending_signature = None
+            return False
+        if signature != self._pending_signature:
+            # Still changing (or just changed): wait one more interval
+            self._pending_signature = signature
+            return False
+
+        print(f"Changes detected in {self.docs_directory}, updating the index in the background...")
+        self.engine.update_documents(docs_directory=self.docs_directory)
+        self._indexed_signature = signature
+        self._pending_signature = None
+        return True
@@ -0,0 +1,303 @@
+"""
+Ingestion pipeline shared by rebuild_index.py and main.ChatBot.
+
+Stages:
+1. Discover: list the markdown, PDF and DOCX files in the docs directory, plus the PDF and DOCX
+   originals in the source directories (docs/) that have no markdown version yet
+2. Parse + chunk: split each file along its markdown structure in a process pool (see markdown_chunker.py).
+   PDFs are split into page ranges that are extracted in parallel; DOCX files are streamed
+   (see document_extraction.py)
+3. Embed: send chunk batches to the embedding model concurrently, under a rate limit.
+   Batches are submitted as soon as a file (or a PDF page range) is parsed, so embedding overlaps parsing.
+4. Index: build the FAISS index from the precomputed vectors and write the manifest
+"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from index_manifest import file_sha256, source_key, make_chunk_ids, make_entry
+from markdown_chunker import split_markdown
+from document_extraction import pdf_page_ranges, extract_pdf_pages, iter_docx_sections
+import faiss
+import os
+import threading
+import time
+
+DEFAULT_DOCS_DIRECTORY = "docs-text"
+# Directories with PDF/DOCX originals, indexed directly unless the docs directory has a markdown version
+SOURCE_DIRECTORIES = [d for d in os.getenv("INGEST_SOURCE_DIRECTORIES", "docs").split(",") if d]
+MARKDOWN_EXTENSIONS = (".md",)
+DOCUMENT_EXTENSIONS = (".pdf", ".docx")
+# Originals converted to markdown by hand (under another name) before PDF/DOCX extraction existed
+HAND_CONVERTED = {"Employee Handbook revised_6.09.2022.docx": "handbook.md"}
+CHUNK_SIZE = 1500
+# Stored in the manifest; indexes chunked by a different chunker are rebuilt instead of updated
+CHUNKER_VERSION = "markdown-1"
+
+# Pipeline tuning, overridable from the environment
+PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", str(os.cpu_count() or 1)))
+EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", "4"))
+EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "100"))
+EMBED_REQUESTS_PER_MINUTE = int(os.getenv("INGEST_EMBED_REQUESTS_PER_MINUTE", "500"))
+
+
+def discover_files(docs_directory=DEFAULT_DOCS_DIRECTORY, source_directories=SOURCE_DIRECTORIES):
+    """
+    Return the paths of all files to index, in a stable order: markdown, PDF and DOCX files in the
+    docs directory, then the PDF and DOCX files of the source directories. A PDF or DOCX is skipped
+    when the docs directory has a markdown version of it (same name, or listed in HAND_CONVERTED).
+    """
+    names = sorted(f for f in os.listdir(docs_directory) if f.lower().endswith(MARKDOWN_EXTENSIONS + DOCUMENT_EXTENSIONS))
+    markdown_stems = {os.path.splitext(f)[0].lower() for f in names if f.lower().endswith(MARKDOWN_EXTENSIONS)}
+
+    def has_markdown_version(name):
+        converted = HAND_CONVERTED.get(name)
+        return (os.path.splitext(name)[0].lower() in markdown_stems
+                or (converted is not None and os.path.splitext(converted)[0].lower() in markdown_stems))
+
+    file_paths = [
+        os.path.join(docs_directory, f) for f in names
+        if f.lower().endswith(MARKDOWN_EXTENSIONS) or not has_markdown_version(f)
+    ]
+    for directory in source_directories:
+        if not os.path.isdir(directory) or os.path.abspath(directory) == os.path.abspath(docs_directory):
+            continue
+        file_paths.extend(
+            os.path.join(directory, f) for f in sorted(os.listdir(directory))
+            if f.lower().endswith(DOCUMENT_EXTENSIONS) and not has_markdown_version(f)
+        )
+    return file_paths
+
+
+def load_and_split_file(file_path):
+    """
+    Parse and chunk a single markdown or DOCX file. Runs inside a worker process, so it must
+    stay a top-level function and return only picklable data.
+    """
+    result = {"file_path": file_path, "file_hash": None, "docs": [], "error": None}
+    try:
+        result["file_hash"] = file_sha256(file_path)
+        metadata = {"source": source_key(file_path)}
+        if file_path.lower().endswith(".docx"):
+            # Streamed section by section; each section repeats its heading path
+            for section in iter_docx_sections(file_path):
+                result["docs"].extend(split_markdown(section, metadata, CHUNK_SIZE))
+        else:
+            with open(file_path, "r", encoding="utf-8") as f:
+                text = f.read()
+            # The raw markdown is chunked directly so headings and tables survive
+            result["docs"] = split_markdown(text, metadata, CHUNK_SIZE)
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def load_and_split_pdf_pages(file_path, start, stop):
+    """
+    Extract and chunk one page range of a PDF, in a worker process like load_and_split_file.
+    Chunks never span pages and record their page number; the first range also hashes the file.
+    """
+    result = {"file_path": file_path, "file_hash": None, "docs": [], "error": None}
+    try:
+        if start == 0:
+            result["file_hash"] = file_sha256(file_path)
+        for page_number, text in extract_pdf_pages(file_path, start, stop):
+            if text:
+                metadata = {"source": source_key(file_path), "page": page_number}
+                result["docs"].extend(split_markdown(text, metadata, CHUNK_SIZE))
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+class RateLimiter:
+    """Thread-safe limiter that spaces requests evenly to stay under a requests-per-minute budget"""
+
+    def __init__(self, requests_per_minute):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def acquire(self):
+        """Block until the caller is allowed to send its next request"""
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def _embed_batch(embeddings, texts, rate_limiter):
+    """Embed one batch of chunk texts once the rate limiter allows it"""
+    rate_limiter.acquire()
+    return embeddings.embed_documents(texts)
+
+
+def _submit_embedding_batches(embed_pool, embeddings, docs, rate_limiter, batch_size):
+    """Split a file's chunks into batches and queue them on the embedding pool"""
+    texts = [doc.page_content for doc in docs]
+    return [
+        embed_pool.submit(_embed_batch, embeddings, texts[start:start + batch_size], rate_limiter)
+        for start in range(0, len(texts), batch_size)
+    ]
+
+
+def _parse_tasks(file_paths):
+    """
+    One parse task per file, or one per page range for PDFs.
+    Returns (file_path, part, parts, function, args) tuples.
+    """
+    tasks = []
+    for file_path in file_paths:
+        if file_path.lower().endswith(".pdf"):
+            try:
+                ranges = pdf_page_ranges(file_path)
+            except Exception as e:
+                ranges = []
+                print(f"Error reading {os.path.basename(file_path)}: {str(e)}")
+            for part, (start, stop) in enumerate(ranges):
+                tasks.append((file_path, part, len(ranges), load_and_split_pdf_pages, (file_path, start, stop)))
+        else:
+            tasks.append((file_path, 0, 1, load_and_split_file, (file_path,)))
+    return tasks
+
+
+def _iter_parsed_files(file_paths, parse_workers):
+    """
+    Yield (part, parts, result) as parse tasks complete, falling back to serial parsing if the
+    pool is unavailable. At most two tasks per worker are queued, so a large PDF is never
+    extracted much ahead of the embedding stage.
+    """
+    tasks = _parse_tasks(file_paths)
+    if parse_workers <= 1 or len(tasks) <= 1:
+        for _, part, parts, function, args in tasks:
+            yield part, parts, function(*args)
+        return
+
+    pending = list(tasks)
+    try:
+        with ProcessPoolExecutor(max_workers=min(parse_workers, len(tasks))) as parse_pool:
+            queued = {}
+            next_task = 0
+            while next_task < len(tasks) or queued:
+                while next_task < len(tasks) and len(queued) < 2 * parse_workers:
+                    task = tasks[next_task]
+                    queued[parse_pool.submit(task[3], *task[4])] = task
+                    next_task += 1
+                done, _ = wait(queued, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = queued.pop(future)
+                    result = future.result()
+                    pending.remove(task)
+                    yield task[1], task[2], result
+    except (BrokenProcessPool, OSError) as e:
+        print(f"Process pool unavailable ({str(e)}), parsing remaining files serially")
+        for _, part, parts, function, args in pending:
+            yield part, parts, function(*args)
+
+
+def process_files(file_paths, embeddings, parse_workers=PARSE_WORKERS, embed_workers=EMBED_WORKERS,
+                  batch_size=EMBED_BATCH_SIZE, requests_per_minute=EMBED_REQUESTS_PER_MINUTE):
+    """
+    Run the parse and embed stages for a list of files.
+    Returns one dict per successfully processed file, in the order of file_paths, with
+    the file hash, its chunks, their vectors and their deterministic chunk IDs.
+    """
+    rate_limiter = RateLimiter(requests_per_minute)
+    # file path -> {"file_hash", "docs" and "batches" per part, "failed"}
+    in_flight = {}
+
+    with ThreadPoolExecutor(max_workers=embed_workers) as embed_pool:
+        for part, parts, parsed in _iter_parsed_files(file_paths, parse_workers):
+            name = os.path.basename(parsed["file_path"])
+            state = in_flight.setdefault(
+                parsed["file_path"],
+                {"file_hash": None, "docs": [None] * parts, "batches": [None] * parts, "failed": False}
+            )
+            if parsed["error"] is not None:
+                print(f"Error processing {name}: {parsed['error']}")
+                state["failed"] = True
+                continue
+            if parsed["file_hash"] is not None:
+                state["file_hash"] = parsed["file_hash"]
+            state["docs"][part] = parsed["docs"]
+            state["batches"][part] = _submit_embedding_batches(embed_pool, embeddings, parsed["docs"], rate_limiter, batch_size)
+            if all(docs is not None for docs in state["docs"]):
+                print(f"Parsed {sum(len(docs) for docs in state['docs'])} chunks from {name}")
+
+        processed = []
+        for file_path in file_paths:
+            state = in_flight.get(file_path)
+            if state is None or state["failed"] or any(docs is None for docs in state["docs"]):
+                continue
+            docs = [doc for part_docs in state["docs"] for doc in part_docs]
+            try:
+                vectors = [vector for batches in state["batches"] for future in batches for vector in future.result()]
+            except Exception as e:
+                print(f"Error embedding {os.path.basename(file_path)}: {str(e)}")
+                continue
+            processed.append({
+                "file_path": file_path,
+                "file_hash": state["file_hash"],
+                "docs": docs,
+                "vectors": vectors,
+                "chunk_ids": make_chunk_ids(file_path, state["file_hash"], len(docs))
+            })
+    return processed
+
+
+def empty_index(embeddings, dimension=None):
+    """Create an empty FAISS store; the dimension is probed from the model when not given"""
+    if dimension is None:
+        dimension = len(embeddings.embed_query("dimension probe"))
+    return FAISS(
+        embedding_function=embeddings,
+        index=faiss.IndexFlatL2(dimension),
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={}
+    )
+
+
+def add_processed_files(docsearch, processed):
+    """Add the chunks and vectors of processed files to an existing FAISS store"""
+    for item in processed:
+        if not item["docs"]:
+            continue
+        docsearch.add_embeddings(
+            text_embeddings=[(doc.page_content, vector) for doc, vector in zip(item["docs"], item["vectors"])],
+            metadatas=[doc.metadata for doc in item["docs"]],
+            ids=item["chunk_ids"]
+        )
+
+
+def build_index(embeddings, docs_directory=DEFAULT_DOCS_DIRECTORY):
+    """
+    Run the full pipeline over a docs directory.
+    Returns (docsearch, manifest); docsearch is None if no document could be indexed.
+    """
+    file_paths = discover_files(docs_directory)
+    manifest = {"docs_directory": docs_directory, "chunker": CHUNKER_VERSION, "files": {}}
+    if not file_paths:
+        print(f"No markdown, PDF or DOCX files found in {docs_directory}")
+        return None, manifest
+
+    print(f"Found {len(file_paths)} files to process")
+    start = time.perf_counter()
+    processed = process_files(file_paths, embeddings)
+
+    total_chunks = sum(len(item["docs"]) for item in processed)
+    if total_chunks == 0:
+        print("No documents were successfully loaded")
+        return None, manifest
+
+    print(f"Total chunks to index: {total_chunks}")
+    docsearch = empty_index(embeddings, dimension=len(next(item for item in processed if item["vectors"])["vectors"][0]))
+    add_processed_files(docsearch, processed)
+    for item in processed:
+        manifest["files"][source_key(item["file_path"])] = make_entry(item["file_path"], item["file_hash"], item["chunk_ids"])
+
+    if hasattr(embeddings, "hits"):
+        print(f"Embedding cache: {embeddings.hits} hits, {embeddings.misses} new chunks embedded")
+    print(f"Ingestion pipeline finished in {time.perf_counter() - start:.1f}s")
+    return docsearch, manifest
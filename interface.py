@@ -1,10 +1,16 @@
 import streamlit as st
 
-# Initialize session state for bot
+@st.cache_resource(show_spinner=False)
+def load_engine():
+    """The FAISS index, embeddings and LLM clients are loaded once and shared by every browser session"""
+    from main import get_engine
+    return get_engine()
+
+# Initialize session state for bot; each session only holds its own conversation memory
 if "bot" not in st.session_state:
     try:
         from main import ChatBot
-        st.session_state.bot = ChatBot()
+        st.session_state.bot = ChatBot(load_engine())
     except Exception as e:
         st.error(f"Failed to initialize ChatBot: {str(e)}")
         st.stop()
@@ -26,15 +32,24 @@ with st.sidebar:
     st.markdown("**Settings:**")
     show_sources = st.checkbox("Show relevant sources", value=True, help="Display the source documents used to generate each response")
 
-# Function for generating LLM response using the optimized chat method
-def generate_response(input_text):
+# Function for generating LLM response using the streaming chat method
+def generate_response(input_text, result_holder):
+    """
+    Yield the answer token by token for st.write_stream.
+    The final result (response + relevant docs) is put in result_holder once the stream ends.
+    """
     try:
-        # chat method is used to generate the response 
-        # rag_chain.invoke can raise errors if inputs are missing or misformatted
-        result = bot.chat(input_text)
-        return result
+        # chat_stream yields tokens as they arrive and the full result at the end
+        # rag_chain.stream can raise errors if inputs are missing or misformatted
+        for event in bot.chat_stream(input_text):
+            if event["type"] == "token":
+                yield event["content"]
+            else:
+                result_holder["result"] = event["result"]
     except Exception as e:
-        return {"response": f"Sorry, I encountered an error: {str(e)}", "relevant_docs": []}
+        error_message = f"Sorry, I encountered an error: {str(e)}"
+        result_holder["result"] = {"response": error_message, "relevant_docs": []}
+        yield error_message
 
 # Store LLM generated responses
 if "messages" not in st.session_state.keys():
@@ -54,46 +69,35 @@ if input_text := st.chat_input():
 # Generate a new response if last message is not from assistant
 if st.session_state.messages[-1]["role"] != "assistant":
     with st.chat_message("assistant"):
-        with st.spinner("Getting your answer from documents.."):
-            result = generate_response(input_text)
+        result_holder = {}
+        # Render the answer incrementally so the user sees the first tokens right away
+        streamed_text = st.write_stream(generate_response(input_text, result_holder))
+        
+        result = result_holder.get("result", {"response": streamed_text, "relevant_docs": []})
+        relevant_docs = result.get("relevant_docs", [])
+        
+        # Display relevant documents if available and toggle is enabled
+        if relevant_docs and show_sources:
+            st.markdown("---")
+            st.markdown("**📚 Relevant Sources:**")
             
-            # Handle both old string format and new dict format for backward compatibility
-            if isinstance(result, dict):
-                response = result["response"]
-                relevant_docs = result.get("relevant_docs", [])
-            else:
-                response = result
-                relevant_docs = []
+            # Format and display relevant documents
+            docs_info = bot.get_relevant_docs_info(relevant_docs)
             
-            st.write(response)
+            # Show a summary of sources first
+            source_files = list(set([doc_info['filename'] for doc_info in docs_info]))
+            st.info(f"Found {len(relevant_docs)} relevant chunks from: {', '.join(source_files)}")
             
-            # Display relevant documents if available and toggle is enabled
-            if relevant_docs and show_sources:
-                st.markdown("---")
-                st.markdown("**📚 Relevant Sources:**")
-                
-                # Format and display relevant documents
-                docs_info = bot.get_relevant_docs_info(relevant_docs)
-                
-                # Show a summary of sources first
-                source_files = list(set([doc_info['filename'] for doc_info in docs_info]))
-                st.info(f"Found {len(relevant_docs)} relevant chunks from: {', '.join(source_files)}")
-                
-                for doc_info in docs_info:
-                    with st.expander(f"📄 {doc_info['filename']} (Source {doc_info['number']})"):
-                        st.markdown(f"**Content Preview:**")
-                        st.text(doc_info['content_preview'])
-                        st.markdown(f"**Full Content:**")
-                        st.text(doc_info['full_content'])
-                        st.markdown(f"**Source:** `{doc_info['source']}`")
-                       # if doc_info['similarity_score'] != 'N/A':
-                        #    st.markdown(f"**Relevance Score:** {doc_info['similarity_score']:.3f}")
+            for doc_info in docs_info:
+                with st.expander(f"📄 {doc_info['filename']} (Source {doc_info['number']})"):
+                    st.markdown(f"**Content Preview:**")
+                    st.text(doc_info['content_preview'])
+                    st.markdown(f"**Full Content:**")
+                    st.text(doc_info['full_content'])
+                    st.markdown(f"**Source:** `{doc_info['source']}`")
+                   # if doc_info['similarity_score'] != 'N/A':
+                    #    st.markdown(f"**Relevance Score:** {doc_info['similarity_score']:.3f}")
     
     # Store the response text in messages (not the full result dict)
-    if isinstance(result, dict):
-        message_content = result["response"]
-    else:
-        message_content = result
-    
-    message = {"role": "assistant", "content": message_content}
+    message = {"role": "assistant", "content": result["response"]}
     st.session_state.messages.append(message)
\ No newline at end of file
@@ -0,0 +1,203 @@
+"""
+Local stand-ins for the external services behind chatbot_api, used by the offline load test.
+With the stand-ins installed the API runs without network or credentials:
+- DynamoDB: boto3.resource("dynamodb") returns an in-memory table with put_item/query
+- Bedrock KB + OpenAI: crewai.Crew is replaced by a crew whose kickoff() sleeps for the configured
+  retrieval and LLM latencies (per task) and returns a canned answer
+- Direct answers: boto3.client("bedrock-agent-runtime") returns a retriever that sleeps for the
+  retrieval latency, and the direct path's LLM sleeps for the LLM latency
+- PostgreSQL: POSTGRES_URI is blanked so the SQL agent stays disabled
+Everything else (FastAPI, routing, validation, the endpoint code, logging, metrics) is the real
+serving stack, so the measured latency is the stack's own overhead plus the simulated latencies.
+
+install() must run before chatbot_api (and agent) are imported.
+"""
+import os
+import socket
+import threading
+import time
+
+_original_boto3_resource = None
+_original_boto3_client = None
+
+
+class LocalDynamoDBTable:
+    """In-memory table keyed by session_id, sorted by timestamp"""
+
+    def __init__(self, name, latency_seconds=0.0):
+        self.name = name
+        self.latency_seconds = latency_seconds
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def _simulate_latency(self):
+        if self.latency_seconds > 0:
+            time.sleep(self.latency_seconds)
+
+    def wait_until_exists(self):
+        return None
+
+    def put_item(self, Item):
+        self._simulate_latency()
+        with self._lock:
+            self._items.setdefault(Item["session_id"], []).append(dict(Item))
+        return {}
+
+    def query(self, KeyConditionExpression, ScanIndexForward=True, Limit=None, **kwargs):
+        self._simulate_latency()
+        # Key("session_id").eq(value) -> the value is the second operand of the condition
+        session_id = KeyConditionExpression.get_expression()["values"][1]
+        with self._lock:
+            items = sorted(self._items.get(session_id, []), key=lambda item: item["timestamp"],
+                           reverse=not ScanIndexForward)
+        if Limit is not None:
+            items = items[:Limit]
+        return {"Items": items, "Count": len(items)}
+
+
+class LocalBedrockAgentRuntime:
+    """Stands in for the bedrock-agent-runtime client: retrieve() returns one canned chunk"""
+
+    def __init__(self, latency_seconds=0.0):
+        self.latency_seconds = latency_seconds
+
+    def retrieve(self, knowledgeBaseId, retrievalQuery, **kwargs):
+        if self.latency_seconds > 0:
+            time.sleep(self.latency_seconds)
+        return {"retrievalResults": [{
+            "content": {"text": f"Local stand-in chunk for: {retrievalQuery['text']}"},
+            "location": {"type": "S3", "s3Location": {"uri": "s3://local-standin/handbook.md"}},
+            "score": 1.0
+        }]}
+
+
+class _ResourceInUseException(Exception):
+    pass
+
+
+class _LocalClientExceptions:
+    ResourceInUseException = _ResourceInUseException
+
+
+class _LocalClient:
+    exceptions = _LocalClientExceptions()
+
+
+class _LocalMeta:
+    client = _LocalClient()
+
+
+class LocalDynamoDBResource:
+    """Just enough of the boto3 DynamoDB resource for agent.py"""
+
+    meta = _LocalMeta()
+
+    def __init__(self, latency_seconds=0.0):
+        self.latency_seconds = latency_seconds
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def Table(self, name):
+        with self._lock:
+            if name not in self._tables:
+                self._tables[name] = LocalDynamoDBTable(name, self.latency_seconds)
+            return self._tables[name]
+
+    def create_table(self, TableName, **kwargs):
+        with self._lock:
+            if TableName in self._tables:
+                raise _ResourceInUseException(f"Table already exists: {TableName}")
+        return self.Table(TableName)
+
+
+class LocalCrew:
+    """Stands in for crewai.Crew: one simulated Bedrock retrieval and one LLM call per task"""
+
+    kb_latency_seconds = 0.0
+    llm_latency_seconds = 0.0
+
+    def __init__(self, agents=None, tasks=None, **kwargs):
+        self.agents = agents or []
+        self.tasks = tasks or []
+
+    def kickoff(self, inputs=None):
+        for _ in self.tasks or [None]:
+            time.sleep(self.kb_latency_seconds + self.llm_latency_seconds)
+        roles = ", ".join(getattr(agent, "role", "agent") for agent in self.agents) or "agent"
+        return f"Local stand-in answer from {roles}."
+
+
+def install(dynamodb_latency_ms=0.0, kb_latency_ms=0.0, llm_latency_ms=0.0):
+    """Patch boto3, crewai and the direct path's LLM with the local stand-ins and set placeholder credentials"""
+    global _original_boto3_resource, _original_boto3_client
+    import boto3
+    import crewai
+    from langchain.schema.runnable import RunnableLambda
+
+    # Placeholders so client constructors don't fail; nothing is ever sent with them
+    os.environ["OPENAI_API_KEY"] = os.environ.get("OPENAI_API_KEY") or "local-standin"
+    os.environ["KB_ID"] = os.environ.get("KB_ID") or "LOCALKB000"
+    os.environ.setdefault("AWS_DEFAULT_REGION", os.getenv("AWS_REGION", "us-west-2"))
+    # An empty value wins over .env (load_dotenv doesn't override), which disables the SQL agent
+    os.environ["POSTGRES_URI"] = ""
+
+    dynamodb = LocalDynamoDBResource(latency_seconds=dynamodb_latency_ms / 1000.0)
+    if _original_boto3_resource is None:
+        _original_boto3_resource = boto3.resource
+
+    def resource(service_name, *args, **kwargs):
+        if service_name == "dynamodb":
+            return dynamodb
+        return _original_boto3_resource(service_name, *args, **kwargs)
+
+    boto3.resource = resource
+
+    bedrock = LocalBedrockAgentRuntime(latency_seconds=kb_latency_ms / 1000.0)
+    if _original_boto3_client is None:
+        _original_boto3_client = boto3.client
+
+    def client(service_name, *args, **kwargs):
+        if service_name == "bedrock-agent-runtime":
+            return bedrock
+        return _original_boto3_client(service_name, *args, **kwargs)
+
+    boto3.client = client
+
+    def local_llm(prompt):
+        if llm_latency_ms > 0:
+            time.sleep(llm_latency_ms / 1000.0)
+        return "Local stand-in direct answer."
+
+    import direct_answer
+    direct_answer.set_llm(RunnableLambda(local_llm))
+    LocalCrew.kb_latency_seconds = kb_latency_ms / 1000.0
+    LocalCrew.llm_latency_seconds = llm_latency_ms / 1000.0
+    crewai.Crew = LocalCrew
+    return dynamodb
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_local_server(port=None, **latencies_ms):
+    """
+    Install the stand-ins and run chatbot_api with uvicorn in a background thread.
+    Returns (base_url, server); call server.should_exit = True to stop it.
+    """
+    install(**latencies_ms)
+    import uvicorn
+    from chatbot_api import app
+
+    port = port or _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="local-chatbot-api", daemon=True)
+    thread.start()
+    deadline = time.time() + 30
+    while not server.started:
+        if not thread.is_alive() or time.time() > deadline:
+            raise RuntimeError("Local API server failed to start")
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", server
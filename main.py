@@ -1,65 +1,91 @@
 from langchain_community.document_loaders import TextLoader
-from langchain.text_splitter import CharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_openai import ChatOpenAI
 from langchain.prompts import PromptTemplate
 from langchain.schema.runnable import RunnablePassthrough
 from langchain.schema.output_parser import StrOutputParser
-from langchain.memory import ConversationBufferMemory
 from langchain.schema.runnable import RunnableLambda
-from langchain_community.document_loaders import UnstructuredMarkdownLoader
+from langchain.schema import Document
 from dotenv import load_dotenv
+from embedding_cache import CachedEmbeddings
+from index_manifest import source_key, make_entry, load_manifest, file_changed
+from ingestion import build_index, process_files, add_processed_files, empty_index, discover_files, CHUNKER_VERSION
+from ann_index import supports_in_place_delete
+from answer_cache import SemanticAnswerCache
+from conversation_memory import TokenBudgetMemory
+from context_packing import search_candidates, pack_context
+from metrics import CHAT_STAGE_SECONDS
+from fee_schedule import FeeSchedule
+from mmap_store import has_mmap_index, has_legacy_index, load_mmap_index, load_legacy_index
+from index_snapshots import resolve_index_path, snapshot_write_lock, write_snapshot
+from index_watcher import IndexWatcher, INDEX_WATCH_INTERVAL
+from index_shards import load_shards
+import asyncio
 import os
 import shutil
+import threading
+import time
 
-#ChatBot class is used to initialize the components and setup the memory and rag chain
-class ChatBot:
-    def __init__(self):
+#ChatEngine holds everything that can be shared between conversations: the FAISS index,
+#the embeddings and LLM clients, the rag chain and the caches. It is loaded once per process.
+class ChatEngine:
+    def __init__(self, embeddings=None, llm=None, faiss_index_path="faiss_index", index_report=False):
+        """
+        embeddings and llm default to the OpenAI models; the retrieval benchmark passes a local
+        embedder and its own index folder instead, and index_report=True to also write
+        index_report.json when it builds the index
+        """
         load_dotenv()
-        self._initialize_components()
-        self._setup_memory()
+        # faiss_index_path is the index root; the live index is the snapshot its CURRENT file points to
+        self.faiss_index_path = faiss_index_path
+        self.index_report = index_report
+        self.index_path = resolve_index_path(faiss_index_path)
+        self.watcher = None
+        # Serializes index updates; readers never take it, they use whichever index is current
+        self._update_lock = threading.Lock()
+        # Bumped every time a new index is swapped in, so answers from the old index are not cached
+        self.index_version = 0
+        self._initialize_components(embeddings, llm)
         self._setup_rag_chain()
 
-    def _initialize_components(self):
+    def _initialize_components(self, embeddings=None, llm=None):
         """ 
         Initialize the components and setup the memory and rag chain
         """
-        # Initialize embeddings with OpenAI
-        self.embeddings = OpenAIEmbeddings()
+        # Initialize embeddings with OpenAI, backed by the on-disk cache so index
+        # rebuilds only pay for chunks that have not been embedded before
+        self.embeddings = embeddings or CachedEmbeddings(OpenAIEmbeddings())
 
-        # Define the path for the FAISS index
-        self.faiss_index_path = "faiss_index"
+        # Answers to repeated questions, cleared whenever the index changes
+        self.answer_cache = SemanticAnswerCache()
 
         # Check if FAISS index already exists locally and has the required files
-        index_faiss_path = os.path.join(self.faiss_index_path, "index.faiss")
-        index_pkl_path = os.path.join(self.faiss_index_path, "index.pkl")
-        
-        if os.path.exists(self.faiss_index_path) and os.path.exists(index_faiss_path) and os.path.exists(index_pkl_path):
+        if has_mmap_index(self.index_path) or has_legacy_index(self.index_path):
             print("Loading existing FAISS index...")
             try:
-                # Load the existing FAISS index
-                self.docsearch = FAISS.load_local(
-                    self.faiss_index_path,
-                    self.embeddings,
-                    allow_dangerous_deserialization=True
-                )
-                print("Successfully loaded existing FAISS index")
+                # Load the existing FAISS index; chunk text is only read from disk when a hit is returned
+                if has_mmap_index(self.index_path):
+                    self._load_snapshot(self.index_path)
+                else:
+                    # Indexes saved with the old pickled docstore are converted once
+                    self._migrate_legacy_index()
+                print(f"Successfully loaded existing FAISS index from {self.index_path}")
             except Exception as e:
                 print(f"Error loading existing FAISS index: {str(e)}")
                 print("Creating new FAISS index...")
-                # Remove corrupted index directory
-                if os.path.exists(self.faiss_index_path):
-                    shutil.rmtree(self.faiss_index_path)
+                # Remove corrupted index snapshot; an index folder without snapshots is left alone
+                if self.index_path != self.faiss_index_path and os.path.exists(self.index_path):
+                    shutil.rmtree(self.index_path)
                 # Load and process all documents from docs-text directory
-                self._create_faiss_index_from_directory()
+                self._create_first_index()
         else:
             print("Creating new FAISS index...")
             # Load and process all documents from docs-text directory
-            self._create_faiss_index_from_directory()
+            self._create_first_index()
 
         # Initialize LLM with better configuration for longer responses
-        self.llm = ChatOpenAI(
+        self.llm = llm or ChatOpenAI(
             model="gpt-4o",
             max_tokens=2000,
             timeout=60,
@@ -69,96 +95,158 @@ class ChatBot:
         )
              # Increase timeout for longer response)
         
+    def _create_first_index(self):
+        """
+        Build the index at startup, holding the index folder's write lock so processes that
+        start together build it once: the ones that waited load the snapshot published meanwhile
+        """
+        with snapshot_write_lock(self.faiss_index_path):
+            index_path = resolve_index_path(self.faiss_index_path)
+            if index_path != self.index_path and has_mmap_index(index_path):
+                self._load_snapshot(index_path)
+                print(f"Loaded FAISS index snapshot {index_path} built by another process")
+                return
+            self._create_faiss_index_from_directory()
+
+    def _migrate_legacy_index(self, docs_directory="docs-text"):
+        """
+        Convert an index folder saved with the old pickled docstore into a new snapshot and serve it.
+        The legacy files are left as they are (faiss_index/index.pkl is tracked in git); CURRENT
+        points to the converted snapshot from then on.
+        """
+        with snapshot_write_lock(self.faiss_index_path):
+            index_path = resolve_index_path(self.faiss_index_path)
+            if index_path == self.index_path:
+                docsearch = load_legacy_index(self.index_path, self.embeddings)
+                _, _, _, index_path = write_snapshot(
+                    self.faiss_index_path, docsearch, load_manifest(self.index_path), docs_directory
+                )
+                print(f"Converted {self.index_path} from index.pkl to the mmap docstore format in {index_path}")
+            # else another process converted it while this one waited for the lock
+        self._load_snapshot(index_path)
+
     def _create_faiss_index_from_directory(self, docs_directory="docs-text"):
         """
-        Create FAISS index from all text and markdown files in the specified directory
+        Create FAISS index from all markdown files in the specified directory
+        using the shared ingestion pipeline
         """
-        # Get all text and markdown files in the directory
-        #text_files = [f for f in os.listdir(docs_directory) if f.endswith('.txt')]
-        markdown_files = [f for f in os.listdir(docs_directory) if f.endswith('.md')]
-        all_files = markdown_files #text_files + 
-        
-        if not all_files:
-            print(f"No text or markdown files found in {docs_directory}")
+        docsearch, manifest = build_index(self.embeddings, docs_directory)
+        if docsearch is None:
             # Create empty index as fallback
-            self.docsearch = FAISS.from_documents([], self.embeddings)
-            self.docsearch.save_local(self.faiss_index_path)
-            return
-        
-        #print(f"Found {len(text_files)} text files and {len(markdown_files)} markdown files to process")
-        print(f"Found {len(markdown_files)} markdown files to process")
-        
-        # Load and combine all documents
-        all_docs = []
-        text_splitter = CharacterTextSplitter(
-            chunk_size=1500,
-            chunk_overlap=200,
-            separator = "\n\n"
-            )
-        
-        # Process text files
-        '''
-        for text_file in text_files:
-            file_path = os.path.join(docs_directory, text_file)
-            print(f"Processing text file: {text_file}...")
-            
-            try:
-                loader = TextLoader(file_path)
-                documents = loader.load()
-                
-                # Split documents
-                split_docs = text_splitter.split_documents(documents)
-                all_docs.extend(split_docs)
-                
-                print(f"Added {len(split_docs)} chunks from {text_file}")
-                
-            except Exception as e:
-                print(f"Error processing {text_file}: {str(e)}")
-        '''
-        
-        # Process markdown files
-        for markdown_file in markdown_files:
-            file_path = os.path.join(docs_directory, markdown_file)
-            print(f"Processing markdown file: {markdown_file}...")
-            
-            try:
-                loader = UnstructuredMarkdownLoader(file_path)
-                documents = loader.load()
-                
-                # Split documents
-                split_docs = text_splitter.split_documents(documents)
-                all_docs.extend(split_docs)
-                
-                print(f"Added {len(split_docs)} chunks from {markdown_file}")
-                
-            except Exception as e:
-                print(f"Error processing {markdown_file}: {str(e)}")
-        
-        if not all_docs:
-            print("No documents were successfully loaded")
-            # Create empty index as fallback
-            self.docsearch = FAISS.from_documents([], self.embeddings)
-        else:
-            print(f"Total chunks to index: {len(all_docs)}")
-            # Create FAISS vector store from documents
-            self.docsearch = FAISS.from_documents(all_docs, self.embeddings)
-        
-        # Save the FAISS index locally
-        self.docsearch.save_local(self.faiss_index_path)
-        print(f"FAISS index saved to {self.faiss_index_path}")
-        
-    def _setup_memory(self):
-        """Initialize conversation memory"""
-        self.memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True,
-            input_key="question",
-            output_key="output",
-            k=8 # Keep more context 
+            docsearch = empty_index(self.embeddings)
+        # Write and publish a new snapshot with the configured ANN index type (and the
+        # recall/latency report when asked); the live one is never modified
+        docsearch, shards, fee_schedule, snapshot_path = write_snapshot(
+            self.faiss_index_path, docsearch, manifest, docs_directory,
+            full_build=True, write_report=self.index_report
         )
-        # Track if this is the first interaction to avoid unnecessary memory loading
-        self._has_interaction_history = False
+        self._swap_index(docsearch, shards, fee_schedule, snapshot_path)
+        print(f"FAISS index saved to {snapshot_path}")
+
+    def _swap_index(self, docsearch, shards, fee_schedule, index_path):
+        """
+        Serve a published snapshot in this process. Conversations in flight keep searching the
+        index they already picked up; cached answers were built from the old index, so they are dropped.
+        """
+        # search() reads self.shards once, so it never mixes indexes
+        self.shards = shards
+        self.docsearch = docsearch
+        self.fee_schedule = fee_schedule
+        self.index_path = index_path
+        self.index_version += 1
+        self.answer_cache.clear()
+
+    def _load_snapshot(self, index_path):
+        """
+        Serve a published snapshot: its index, its collection shards (None to search the whole
+        index, see index_shards.py) and its fee schedule, all read from the snapshot folder
+        """
+        docsearch = load_mmap_index(index_path, self.embeddings)
+        self._swap_index(docsearch, load_shards(index_path, docsearch), FeeSchedule.load(index_path), index_path)
+
+    def reload_current_snapshot(self):
+        """
+        Load the snapshot CURRENT points to if it isn't the one being served, e.g. after
+        rebuild_index.py or another process published a new index. Returns True if it swapped.
+        """
+        with self._update_lock:
+            return self._load_current_snapshot()
+
+    def _load_current_snapshot(self):
+        index_path = resolve_index_path(self.faiss_index_path)
+        if index_path == self.index_path or not has_mmap_index(index_path):
+            return False
+        self._load_snapshot(index_path)
+        print(f"Loaded FAISS index snapshot {index_path}")
+        return True
+
+    def _delete_chunks(self, docsearch, chunk_ids):
+        """Remove chunk vectors, refusing index types whose labels don't compact on removal"""
+        if not supports_in_place_delete(docsearch.index):
+            raise RuntimeError(f"{type(docsearch.index).__name__} cannot remove vectors in place")
+        docsearch.delete(chunk_ids)
+
+    def _update_index_incrementally(self, file_paths, manifest):
+        """
+        Add, replace or delete only the vectors of files whose content changed since the manifest was written
+        """
+        # The live index may have memory-mapped, read-only vectors and is being searched by other
+        # sessions, so the update is applied to a private writable copy saved as a new snapshot
+        docsearch = load_mmap_index(self.index_path, self.embeddings, mmap_vectors=False)
+
+        files = manifest["files"]
+        removed = unchanged = 0
+        to_process = []
+
+        for file_path in file_paths:
+            key = source_key(file_path)
+            entry = files.get(key)
 
+            # File was deleted: drop its vectors
+            if not os.path.exists(file_path):
+                if entry is not None:
+                    if entry["chunk_ids"]:
+                        self._delete_chunks(docsearch, entry["chunk_ids"])
+                    del files[key]
+                    removed += 1
+                    print(f"Removed {len(entry['chunk_ids'])} chunks from {key}")
+                continue
+
+            changed, _ = file_changed(entry, file_path)
+            if not changed:
+                # Content is identical, only refresh the mtime so we skip hashing next time
+                entry["mtime"] = os.path.getmtime(file_path)
+                unchanged += 1
+                continue
+            to_process.append(file_path)
+
+        if not to_process and not removed:
+            # Nothing to re-index: keep serving the live snapshot untouched. Snapshots are never
+            # modified once published, so the refreshed mtimes are dropped and those files are
+            # re-hashed on the next update, which is far cheaper than writing a snapshot for them
+            print(f"Incremental update: no changes, {unchanged} unchanged")
+            return
+
+        # Parse and embed all changed files through the pipeline, then swap their vectors
+        processed = process_files(to_process, self.embeddings)
+        added = replaced = 0
+        for item in processed:
+            key = source_key(item["file_path"])
+            entry = files.get(key)
+            if entry is not None and entry["chunk_ids"]:
+                self._delete_chunks(docsearch, entry["chunk_ids"])
+                replaced += 1
+            else:
+                added += 1
+            files[key] = make_entry(item["file_path"], item["file_hash"], item["chunk_ids"])
+        add_processed_files(docsearch, processed)
+
+        docsearch, shards, fee_schedule, snapshot_path = write_snapshot(
+            self.faiss_index_path, docsearch, manifest, manifest.get("docs_directory", "docs-text")
+        )
+        self._swap_index(docsearch, shards, fee_schedule, snapshot_path)
+        print(f"Incremental update: {added} added, {replaced} replaced, {removed} removed, {unchanged} unchanged")
+        
     def _setup_rag_chain(self):
         #prompt for accuracy and detail
         template = """
@@ -187,11 +275,12 @@ class ChatBot:
             template=template,
             input_variables=["context", "question", "chat_history_section"])
 
-        #rag chain retreives top 4 relevant documents from the FAISS index
+        #rag chain builds the context from the documents already retrieved in chat()
+        #so the LLM sees exactly the chunks that are returned as sources
         #runnablelambda is used to add the chat history section to the input
         self.rag_chain = (
             RunnableLambda(lambda x: {
-                            "context": "\n\n".join([doc.page_content for doc in self.docsearch.as_retriever(search_kwargs={"k": 5}).invoke(x["question"])]),
+                            "context": "\n\n".join([doc.page_content for doc in x["relevant_docs"]]),
                             "question": x["question"],
                             "chat_history_section": x["chat_history_section"]
                             })
@@ -200,83 +289,330 @@ class ChatBot:
             | StrOutputParser()
         )
 
-    def update_documents(self, new_documents_path=None):
+    def update_documents(self, new_documents_path=None, incremental=True, docs_directory="docs-text"):
         """
-        Method to update the FAISS index when documents change
+        Method to update the FAISS index when documents change.
+        In incremental mode only the vectors of new, changed or deleted files are touched;
+        a full rebuild is used when incremental=False or the index has no manifest yet.
+        Chats keep running on the current index while the update is built.
+        The index folder's write lock is held throughout, so processes sharing the folder never
+        build, publish or prune snapshots at the same time.
         """
+        with self._update_lock, snapshot_write_lock(self.faiss_index_path):
+            # Build on top of the newest snapshot, which another process may have published
+            self._load_current_snapshot()
+            self._update_documents(new_documents_path, incremental, docs_directory)
+
+    def _update_documents(self, new_documents_path, incremental, docs_directory):
+        manifest = load_manifest(self.index_path) if incremental else None
+        if manifest is not None and manifest.get("chunker") != CHUNKER_VERSION:
+            # Unchanged files would keep their old chunks, so the whole index has to be re-chunked
+            print("Index was chunked with a different chunker.")
+            manifest = None
+
         if new_documents_path:
-            # If a specific document is provided, check if it's in docs-text directory
-            if os.path.exists(new_documents_path):
-                print(f"Document {new_documents_path} found. Rebuilding index with all documents...")
-                self._create_faiss_index_from_directory()
-                print(f"FAISS index updated and saved to {self.faiss_index_path}")
-            else:
+            # A deleted file is still a valid update as long as the manifest knows about it
+            known = manifest is not None and source_key(new_documents_path) in manifest["files"]
+            if not os.path.exists(new_documents_path) and not known:
                 print(f"Document {new_documents_path} not found. Please place it in the docs-text directory.")
+                return
+            file_paths = [new_documents_path]
         else:
-            # Rebuild index from all documents in docs-text directory
-            self._create_faiss_index_from_directory()
-            print(f"FAISS index updated and saved to {self.faiss_index_path}")
+            # Every markdown file on disk plus everything the manifest knows about (to catch deletions)
+            file_paths = discover_files(docs_directory)
+            if manifest is not None:
+                on_disk = {source_key(p) for p in file_paths}
+                file_paths.extend(key for key in manifest["files"] if key not in on_disk)
 
-    def chat(self, question):
-        """Chat method that maintains conversation history"""
-        # Retrieve chat history as messages
-        chat_history = self.memory.load_memory_variables({}).get("chat_history", [])
-        if chat_history:
-            # Format history as readable string
-            chat_history_section = ""
-            for msg in chat_history:
-                # Handle different message types from ChatOpenAI
-                if hasattr(msg, "type"):
-                    if msg.type == "human":
-                        chat_history_section += f"User: {msg.content}\n"
-                    elif msg.type == "ai":
-                        chat_history_section += f"Assistant: {msg.content}\n"
-                    else:
-                        chat_history_section += f"{msg.content}\n"
-                elif hasattr(msg, "role"):
-                    # Handle ChatMessage format
-                    if msg.role == "user":
-                        chat_history_section += f"User: {msg.content}\n"
-                    elif msg.role == "assistant":
-                        chat_history_section += f"Assistant: {msg.content}\n"
-                    else:
-                        chat_history_section += f"{msg.content}\n"
-                else:
-                    # Fallback for other message formats
-                    chat_history_section += f"{msg.content}\n"
-            chat_history_section = f"Previous conversation:\n{chat_history_section}"
+        if manifest is None:
+            print("No index manifest found. Rebuilding index with all documents...")
+            self._create_faiss_index_from_directory(docs_directory)
         else:
-            chat_history_section = "This is the first question in our conversation."
+            try:
+                self._update_index_incrementally(file_paths, manifest)
+            except RuntimeError as e:
+                # IVF and HNSW indexes cannot remove vectors in place
+                print(f"Incremental update not supported by this index ({str(e)}). Rebuilding index with all documents...")
+                self._create_faiss_index_from_directory(docs_directory)
+            except ValueError as e:
+                # The index and its manifest disagree (e.g. chunks indexed under another key)
+                print(f"Incremental update failed ({str(e)}). Rebuilding index with all documents...")
+                self._create_faiss_index_from_directory(docs_directory)
+        print(f"FAISS index updated, serving {self.index_path}")
 
-        # Get relevant documents first with similarity scores
-        retriever = self.docsearch.as_retriever(search_kwargs={"k": 5})
-        relevant_docs = retriever.invoke(question)
-        
-        # Get documents with scores using similarity search
-        docs_with_scores = self.docsearch.similarity_search_with_score(question, k=5)
-        
-        # Add scores to the documents
-        for i, (doc, score) in enumerate(docs_with_scores):
-            if i < len(relevant_docs):
-                relevant_docs[i].metadata['score'] = score
-        
-        # Prepare input for the RAG chain
-        inputs = {
-            "question": question,
-            "chat_history_section": chat_history_section
-        }
+    def retrieve(self, question, k=5, query_vector=None, collections=None):
+        """
+        Embed the question once (unless the vector is passed in) and return at most k documents
+        packed into the context token budget, with their similarity scores.
+        collections restricts the search to those collections instead of the routed ones.
+        """
+        if query_vector is None:
+            with CHAT_STAGE_SECONDS.time(stage="embed"):
+                query_vector = self.embeddings.embed_query(question)
+        candidates, vectors = self.search(query_vector, question, collections)
+        return self.pack(query_vector, candidates, vectors, k)
 
-        # Get response
-        response = self.rag_chain.invoke(inputs)
+    async def aretrieve(self, question, k=5, query_vector=None, collections=None):
+        """Async counterpart of retrieve"""
+        if query_vector is None:
+            with CHAT_STAGE_SECONDS.time(stage="embed"):
+                query_vector = await self.embeddings.aembed_query(question)
+        candidates, vectors = await asyncio.to_thread(self.search, query_vector, question, collections)
+        return self.pack(query_vector, candidates, vectors, k)
 
-        # Save the new exchange to memory
-        self.memory.save_context({"question": question}, {"output": response})
+    def search(self, query_vector, question=None, collections=None):
+        """
+        FAISS stage: fetch extra candidates and their vectors for the packing stage, from the
+        shards the router picks for the question (or the given collections)
+        """
+        # Read the index references once so a concurrent update can't swap them mid-search
+        shards, docsearch = self.shards, self.docsearch
+        with CHAT_STAGE_SECONDS.time(stage="search"):
+            if shards is not None:
+                return shards.search(query_vector, question, collections)
+            return search_candidates(docsearch, query_vector)
 
-        # Return both response and relevant documents
+    def pack(self, query_vector, candidates, vectors, k=5):
+        """Packing stage: dedup, diversify and pack the candidates into the context budget (see context_packing.py)"""
+        with CHAT_STAGE_SECONDS.time(stage="pack"):
+            return pack_context(query_vector, candidates, vectors, max_k=k)
+
+    async def aupdate_documents(self, new_documents_path=None, incremental=True, docs_directory="docs-text"):
+        """Run update_documents in a worker thread"""
+        await asyncio.to_thread(self.update_documents, new_documents_path, incremental, docs_directory)
+
+    def start_watcher(self, docs_directory="docs-text", interval=INDEX_WATCH_INTERVAL):
+        """Rebuild in the background when docs_directory changes (see index_watcher.py)"""
+        if self.watcher is None:
+            self.watcher = IndexWatcher(self, docs_directory, interval)
+            self.watcher.start()
+        return self.watcher
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Return the process-wide ChatEngine, loading it on first use"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = ChatEngine()
+                if INDEX_WATCH_INTERVAL > 0:
+                    _engine.start_watcher()
+    return _engine
+
+
+#ChatBot is one conversation: it only owns the memory and runs every question through the shared engine
+class ChatBot:
+    def __init__(self, engine=None):
+        self.engine = engine or get_engine()
+        self._setup_memory()
+
+    def _setup_memory(self):
+        """Initialize conversation memory: a recent window plus a rolling summary within a token budget"""
+        # The summarizer reuses the engine's LLM client
+        self.memory = TokenBudgetMemory(llm=self.engine.llm)
+        # Track if this is the first interaction to avoid unnecessary memory loading
+        self._has_interaction_history = False
+
+    def update_documents(self, new_documents_path=None, incremental=True, docs_directory="docs-text"):
+        """Update the shared index; every conversation sees the new documents"""
+        self.engine.update_documents(new_documents_path, incremental, docs_directory)
+
+    def _prepare_chat(self, question):
+        """
+        Everything that happens before the LLM call.
+        Returns (result, None) when the question was answered without the LLM (fee schedule or
+        answer cache), otherwise (None, turn) where turn holds the RAG chain inputs.
+        """
+        # Fee schedule and network questions are answered exactly from the lookup table,
+        # skipping the vector search and the LLM call
+        with CHAT_STAGE_SECONDS.time(stage="fee_schedule"):
+            fast_result = self.engine.fee_schedule.answer(question)
+        if fast_result is not None:
+            self._save_memory(question, fast_result["response"])
+            return fast_result, None
+
+        # The history section is cached by the memory and only rebuilt after it changes
+        chat_history_section = self.memory.history_section()
+
+        # Answers are only cached if the index doesn't change while this turn is running
+        index_version = self.engine.index_version
+
+        # The question embedding is shared by the answer cache and the retrieval below
+        with CHAT_STAGE_SECONDS.time(stage="embed"):
+            query_vector = self.engine.embeddings.embed_query(question)
+
+        # Standalone questions can reuse the answer to a near-duplicate question;
+        # follow-ups depend on the conversation so they always go to the LLM
+        use_answer_cache = self.memory.is_empty()
+        if use_answer_cache:
+            with CHAT_STAGE_SECONDS.time(stage="answer_cache"):
+                cached_result = self.engine.answer_cache.lookup(query_vector)
+            if cached_result is not None:
+                self._save_memory(question, cached_result["response"])
+                return cached_result, None
+
+        # Single retrieval pass: one embedding call and one FAISS search
+        relevant_docs = self.engine.retrieve(question, query_vector=query_vector)
+
+        return None, self._make_turn(question, chat_history_section, relevant_docs, query_vector,
+                                     use_answer_cache, index_version)
+
+    async def _aprepare_chat(self, question):
+        """Async counterpart of _prepare_chat"""
+        with CHAT_STAGE_SECONDS.time(stage="fee_schedule"):
+            fast_result = self.engine.fee_schedule.answer(question)
+        if fast_result is not None:
+            await self._asave_memory(question, fast_result["response"])
+            return fast_result, None
+
+        chat_history_section = self.memory.history_section()
+
+        index_version = self.engine.index_version
+
+        with CHAT_STAGE_SECONDS.time(stage="embed"):
+            query_vector = await self.engine.embeddings.aembed_query(question)
+
+        use_answer_cache = self.memory.is_empty()
+        if use_answer_cache:
+            with CHAT_STAGE_SECONDS.time(stage="answer_cache"):
+                cached_result = self.engine.answer_cache.lookup(query_vector)
+            if cached_result is not None:
+                await self._asave_memory(question, cached_result["response"])
+                return cached_result, None
+
+        relevant_docs = await self.engine.aretrieve(question, query_vector=query_vector)
+
+        return None, self._make_turn(question, chat_history_section, relevant_docs, query_vector,
+                                     use_answer_cache, index_version)
+
+    def _make_turn(self, question, chat_history_section, relevant_docs, query_vector, use_answer_cache, index_version):
+        """State carried from the retrieval step to the end of a chat turn"""
         return {
+            "inputs": {
+                "question": question,
+                "chat_history_section": chat_history_section,
+                "relevant_docs": relevant_docs
+            },
+            "query_vector": query_vector,
+            "use_answer_cache": use_answer_cache,
+            "index_version": index_version
+        }
+
+    def _build_result(self, question, turn, response):
+        """Build the chat result and add it to the answer cache when the question was standalone"""
+        # Return both response and relevant documents
+        result = {
             "response": response,
-            "relevant_docs": relevant_docs
+            "relevant_docs": turn["inputs"]["relevant_docs"]
         }
+        if turn["use_answer_cache"] and turn["index_version"] == self.engine.index_version:
+            self.engine.answer_cache.store(question, turn["query_vector"], result)
+        return result
+
+    def _save_memory(self, question, response):
+        """Record the exchange; this can include a summarizer LLM call once the history is over budget"""
+        with CHAT_STAGE_SECONDS.time(stage="memory"):
+            self.memory.save_context({"question": question}, {"output": response})
+
+    async def _asave_memory(self, question, response):
+        """Async counterpart of _save_memory"""
+        with CHAT_STAGE_SECONDS.time(stage="memory"):
+            await self.memory.asave_context({"question": question}, {"output": response})
+
+    def _finish_chat(self, question, turn, response):
+        """Save the exchange to memory (and the answer cache) and build the chat result"""
+        self._save_memory(question, response)
+        return self._build_result(question, turn, response)
+
+    async def _afinish_chat(self, question, turn, response):
+        """Async counterpart of _finish_chat"""
+        await self._asave_memory(question, response)
+        return self._build_result(question, turn, response)
+
+    def chat(self, question):
+        """Chat method that maintains conversation history"""
+        result, turn = self._prepare_chat(question)
+        if result is not None:
+            return result
+
+        # Get response
+        with CHAT_STAGE_SECONDS.time(stage="llm"):
+            response = self.engine.rag_chain.invoke(turn["inputs"])
+        return self._finish_chat(question, turn, response)
+
+    def chat_stream(self, question):
+        """
+        Streaming variant of chat.
+        Yields {"type": "token", "content": ...} events as the LLM produces them, then a single
+        {"type": "done", "result": ...} event with the same result dict chat() returns.
+        Memory is only updated once the stream has been consumed to the end.
+        """
+        result, turn = self._prepare_chat(question)
+        if result is not None:
+            # Answered without the LLM: emit the whole answer at once
+            yield {"type": "token", "content": result["response"]}
+            yield {"type": "done", "result": result}
+            return
+
+        # llm_first_token is the latency the user feels; llm also includes the time the caller
+        # spends rendering between tokens
+        chunks = []
+        start = time.perf_counter()
+        for chunk in self.engine.rag_chain.stream(turn["inputs"]):
+            if not chunks:
+                CHAT_STAGE_SECONDS.observe(time.perf_counter() - start, stage="llm_first_token")
+            chunks.append(chunk)
+            yield {"type": "token", "content": chunk}
+        CHAT_STAGE_SECONDS.observe(time.perf_counter() - start, stage="llm")
+        yield {"type": "done", "result": self._finish_chat(question, turn, "".join(chunks))}
+
+    async def achat(self, question):
+        """
+        Async counterpart of chat: embedding, retrieval, the LLM call and memory all go through
+        the async APIs, so many conversations can wait on OpenAI in one event loop
+        """
+        result, turn = await self._aprepare_chat(question)
+        if result is not None:
+            return result
+
+        with CHAT_STAGE_SECONDS.time(stage="llm"):
+            response = await self.engine.rag_chain.ainvoke(turn["inputs"])
+        return await self._afinish_chat(question, turn, response)
+
+    async def achat_stream(self, question):
+        """Async counterpart of chat_stream, yielding the same events"""
+        result, turn = await self._aprepare_chat(question)
+        if result is not None:
+            yield {"type": "token", "content": result["response"]}
+            yield {"type": "done", "result": result}
+            return
+
+        chunks = []
+        start = time.perf_counter()
+        async for chunk in self.engine.rag_chain.astream(turn["inputs"]):
+            if not chunks:
+                CHAT_STAGE_SECONDS.observe(time.perf_counter() - start, stage="llm_first_token")
+            chunks.append(chunk)
+            yield {"type": "token", "content": chunk}
+        CHAT_STAGE_SECONDS.observe(time.perf_counter() - start, stage="llm")
+        yield {"type": "done", "result": await self._afinish_chat(question, turn, "".join(chunks))}
+
+    @classmethod
+    async def acreate(cls):
+        """
+        Build a ChatBot without blocking the event loop.
+        Loading (or building) the FAISS index the first time is disk and CPU bound, so it runs in a worker thread.
+        """
+        return cls(await asyncio.to_thread(get_engine))
+
+    async def aupdate_documents(self, new_documents_path=None, incremental=True, docs_directory="docs-text"):
+        """Run update_documents in a worker thread"""
+        await self.engine.aupdate_documents(new_documents_path, incremental, docs_directory)
 
     def get_relevant_docs_info(self, docs):
         """Format relevant documents information for display"""
@@ -0,0 +1,145 @@
+"""
+Markdown-structure-aware chunker used by the ingestion pipeline.
+Splits raw markdown along its headings instead of at arbitrary blank lines:
+- every chunk belongs to exactly one section and starts with that section's heading path
+  (e.g. "PAID TIME OFF POLICY > Scope"), which is also stored in metadata["section"]
+- tables are never cut in the middle of a row; a table longer than a chunk is split into row
+  groups and each group repeats the table's header rows
+- column padding inside table rows is squeezed, so a chunk holds more rows
+- prose paragraphs are packed together up to the chunk size; only a single paragraph that is
+  larger than a chunk is split (by lines, then by words)
+"""
+from langchain.schema import Document
+import re
+
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+SEPARATOR_ROW_PATTERN = re.compile(r"^\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?$")
+SECTION_SEPARATOR = " > "
+
+
+def _squeeze_row(line):
+    """Collapse the space padding of a markdown table row (and the dash padding of its separator row)"""
+    line = re.sub(r" {2,}", " ", line.strip())
+    if SEPARATOR_ROW_PATTERN.match(line):
+        line = re.sub(r"-{3,}", "---", line)
+    return line
+
+
+def _parse_blocks(text):
+    """
+    Walk the markdown once and yield (heading_path, kind, lines) blocks where kind is
+    "table" or "text". Headings update the path and are not emitted as blocks.
+    """
+    path = []
+    kind = None
+    lines = []
+    for line in text.splitlines():
+        heading = HEADING_PATTERN.match(line)
+        is_table_row = line.lstrip().startswith("|")
+        if heading or not line.strip() or is_table_row != (kind == "table"):
+            if lines:
+                yield list(path), kind, lines
+            kind, lines = None, []
+        if heading:
+            level = len(heading.group(1))
+            # Page anchors (<span id=...>) and bold markers left over from the PDF conversion are not part of the title
+            title = re.sub(r"<[^>]+>", "", heading.group(2)).strip("* ")
+            # A heading replaces the path from its own level down; skipped levels (# then ###) are fine
+            del path[level - 1:]
+            if title:
+                path.append(title)
+            continue
+        if not line.strip():
+            continue
+        kind = "table" if is_table_row else "text"
+        lines.append(_squeeze_row(line) if is_table_row else line.rstrip())
+    if lines:
+        yield list(path), kind, lines
+
+
+def _table_header(rows):
+    """Header rows repeated on every segment of a split table: the first row and its separator"""
+    if len(rows) > 1 and SEPARATOR_ROW_PATTERN.match(rows[1]):
+        return rows[:2]
+    return rows[:1]
+
+
+def _split_table(rows, budget):
+    """Split table rows into segments of at most budget characters, each starting with the header"""
+    header = _table_header(rows)
+    header_size = sum(len(row) + 1 for row in header)
+    segments = []
+    current = list(header)
+    size = header_size
+    for row in rows[len(header):]:
+        if len(current) > len(header) and size + len(row) + 1 > budget:
+            segments.append("\n".join(current))
+            current = list(header)
+            size = header_size
+        current.append(row)
+        size += len(row) + 1
+    if len(current) > len(header) or not segments:
+        segments.append("\n".join(current))
+    return segments
+
+
+def _split_text(lines, budget):
+    """Split an oversized paragraph by lines, and lines that are still too long by words"""
+    pieces = []
+    for line in lines:
+        while len(line) > budget:
+            cut = line.rfind(" ", 0, budget)
+            cut = cut if cut > 0 else budget
+            pieces.append(line[:cut])
+            line = line[cut:].lstrip()
+        pieces.append(line)
+
+    segments = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 1 > budget:
+            segments.append(current)
+            current = ""
+        current = f"{current}\n{piece}" if current else piece
+    if current:
+        segments.append(current)
+    return segments
+
+
+def split_markdown(text, metadata=None, chunk_size=1500):
+    """
+    Chunk a markdown document along its structure.
+    Returns Documents with the heading path prepended to page_content and stored in
+    metadata["section"]; the given metadata is copied onto every chunk.
+    """
+    metadata = metadata or {}
+    chunks = []
+    current_path = None
+    current_parts = []
+    current_size = 0
+
+    def flush():
+        if current_parts:
+            section = SECTION_SEPARATOR.join(current_path)
+            body = "\n\n".join(current_parts)
+            content = f"{section}\n\n{body}" if section else body
+            chunks.append(Document(page_content=content, metadata={**metadata, "section": section}))
+
+    for path, kind, lines in _parse_blocks(text):
+        # Room left for the body once the heading path is prepended
+        budget = max(chunk_size - len(SECTION_SEPARATOR.join(path)) - 2, chunk_size // 2)
+        block = "\n".join(lines)
+        if len(block) > budget:
+            segments = _split_table(lines, budget) if kind == "table" else _split_text(lines, budget)
+        else:
+            segments = [block]
+
+        for segment in segments:
+            # A new section, or a segment that no longer fits, starts a new chunk
+            if path != current_path or current_size + len(segment) + 2 > budget:
+                flush()
+                current_path, current_parts, current_size = path, [], 0
+            current_parts.append(segment)
+            current_size += len(segment) + 2
+    flush()
+    return chunks
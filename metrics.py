@@ -0,0 +1,132 @@
+"""
+Minimal Prometheus-style metrics without extra dependencies.
+Histograms are kept in a process-wide registry and rendered in the Prometheus text exposition
+format by render_metrics(), which chatbot_api serves at GET /metrics.
+
+Usage:
+    with CHAT_STAGE_SECONDS.time(stage="embed"):
+        query_vector = embeddings.embed_query(question)
+"""
+from bisect import bisect_left
+import threading
+import time
+
+# Latency buckets in seconds, from a cache hit up to a slow multi-agent crew run
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+class _Timer:
+    """Context manager returned by Histogram.time(); elapsed holds the duration in seconds afterwards"""
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.elapsed = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.elapsed = time.perf_counter() - self._start
+        # Failed stages are recorded too, they are often the slow ones
+        self.histogram.observe(self.elapsed, **self.labels)
+        return False
+
+
+class Histogram:
+    """Thread-safe cumulative histogram with optional labels"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # label values -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series = {}
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def observe(self, value, **labels):
+        """Record one observation (in seconds for the latency histograms)"""
+        key = self._key(labels)
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels):
+        """Context manager that observes the wall-clock duration of its block"""
+        self._key(labels)
+        return _Timer(self, labels)
+
+    def render(self):
+        """Lines of the text exposition format for this histogram"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, [list(counts), total, count]) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in series:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels(labels + [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+def render_metrics():
+    """All registered metrics in the Prometheus text format (version 0.0.4)"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Stages of ChatBot.chat / chat_stream / achat: fee_schedule, embed, answer_cache, search, pack, llm, memory
+CHAT_STAGE_SECONDS = Histogram(
+    "chatbot_chat_stage_seconds", "Duration of each stage of a ChatBot chat turn", ["stage"]
+)
+
+# Stages of the /chat API endpoint: history_fetch, queue_wait (for a crew worker), crew (including queue_wait), save
+API_STAGE_SECONDS = Histogram(
+    "chatbot_api_stage_seconds", "Duration of each stage of a /chat API request", ["stage"]
+)
+
+# Whole HTTP requests, by route and status code
+API_REQUEST_SECONDS = Histogram(
+    "chatbot_api_request_seconds", "Duration of HTTP requests to the chatbot API", ["method", "route", "status"]
+)
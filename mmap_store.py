@@ -0,0 +1,162 @@
+"""
+Memory-mappable on-disk format for the FAISS index.
+Replaces the pickled index.pkl docstore: chunk text and metadata live in one flat file that is
+opened with mmap, and a chunk is only read and decoded when a search returns it.
+
+Files written to the index folder:
+- index.faiss            FAISS vectors
+- docstore.bin           concatenated UTF-8 JSON records ({"page_content": ..., "metadata": ...})
+- docstore.offsets.npy   int64 byte offsets of each record (n + 1 entries)
+- docstore.ids.json      docstore ID of each record, in FAISS position order
+"""
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.vectorstores import FAISS
+from langchain.schema import Document
+import faiss
+import json
+import mmap
+import numpy as np
+import os
+
+INDEX_FILENAME = "index.faiss"
+DOCSTORE_FILENAME = "docstore.bin"
+OFFSETS_FILENAME = "docstore.offsets.npy"
+IDS_FILENAME = "docstore.ids.json"
+LEGACY_PICKLE_FILENAME = "index.pkl"
+
+
+class MmapDocstore(Docstore, AddableMixin):
+    """
+    Read-mostly docstore backed by an mmapped file.
+    Documents added after loading (incremental updates) are kept in memory until the next save.
+    """
+
+    def __init__(self, folder_path):
+        with open(os.path.join(folder_path, IDS_FILENAME), "r", encoding="utf-8") as f:
+            ids = json.load(f)
+        self._positions = {doc_id: position for position, doc_id in enumerate(ids)}
+        self._offsets = np.load(os.path.join(folder_path, OFFSETS_FILENAME), mmap_mode="r")
+        self._added = {}
+
+        self._file = open(os.path.join(folder_path, DOCSTORE_FILENAME), "rb")
+        # mmap cannot map an empty file
+        if os.fstat(self._file.fileno()).st_size > 0:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._mmap = None
+
+    def search(self, search):
+        """Return the Document for a docstore ID, decoding it from the mapped file on demand"""
+        if search in self._added:
+            return self._added[search]
+        position = self._positions.get(search)
+        if position is None:
+            return f"ID {search} not found."
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        record = json.loads(self._mmap[start:end].decode("utf-8"))
+        return Document(page_content=record["page_content"], metadata=record["metadata"])
+
+    def add(self, texts):
+        """Add documents; they stay in memory until the index is saved again"""
+        overlapping = set(texts).intersection(self._positions).union(set(texts).intersection(self._added))
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self._added.update(texts)
+
+    def delete(self, ids):
+        """Forget documents by ID; the bytes are dropped from disk on the next save"""
+        for doc_id in ids:
+            if self._added.pop(doc_id, None) is None and self._positions.pop(doc_id, None) is None:
+                raise ValueError(f"ID {doc_id} not found.")
+
+
+def has_mmap_index(folder_path):
+    """Check whether a folder contains an index in the mmap format"""
+    return all(
+        os.path.exists(os.path.join(folder_path, name))
+        for name in (INDEX_FILENAME, DOCSTORE_FILENAME, OFFSETS_FILENAME, IDS_FILENAME)
+    )
+
+
+def has_legacy_index(folder_path):
+    """Check whether a folder contains an index saved with FAISS.save_local (pickled docstore)"""
+    return (
+        os.path.exists(os.path.join(folder_path, INDEX_FILENAME))
+        and os.path.exists(os.path.join(folder_path, LEGACY_PICKLE_FILENAME))
+    )
+
+
+def read_faiss_index(path, mmap_vectors=True):
+    """Read the FAISS index, mapping the vectors from disk when this FAISS build supports it"""
+    if mmap_vectors:
+        for flag_name in ("IO_FLAG_MMAP_IFC", "IO_FLAG_MMAP"):
+            flag = getattr(faiss, flag_name, None)
+            if flag is None:
+                continue
+            try:
+                return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError:
+                continue
+    return faiss.read_index(path)
+
+
+def load_mmap_index(folder_path, embeddings, mmap_vectors=True):
+    """
+    Open an index saved with save_mmap_index.
+    Pass mmap_vectors=False when the index is going to be modified (incremental updates).
+    """
+    index = read_faiss_index(os.path.join(folder_path, INDEX_FILENAME), mmap_vectors)
+    docstore = MmapDocstore(folder_path)
+    with open(os.path.join(folder_path, IDS_FILENAME), "r", encoding="utf-8") as f:
+        ids = json.load(f)
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=dict(enumerate(ids))
+    )
+
+
+def save_mmap_index(docsearch, folder_path):
+    """
+    Write a FAISS store in the mmap format.
+    Every file is written to a temporary name first and then moved into place.
+    """
+    os.makedirs(folder_path, exist_ok=True)
+    ids = [docsearch.index_to_docstore_id[position] for position in range(docsearch.index.ntotal)]
+
+    offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+    docstore_tmp = os.path.join(folder_path, DOCSTORE_FILENAME + ".tmp")
+    with open(docstore_tmp, "wb") as f:
+        for position, doc_id in enumerate(ids):
+            doc = docsearch.docstore.search(doc_id)
+            record = json.dumps(
+                {"page_content": doc.page_content, "metadata": doc.metadata},
+                ensure_ascii=False
+            ).encode("utf-8")
+            f.write(record)
+            offsets[position + 1] = offsets[position] + len(record)
+
+    # np.save appends .npy to names that don't already end with it
+    offsets_tmp = os.path.join(folder_path, "docstore.offsets.tmp.npy")
+    np.save(offsets_tmp, offsets)
+
+    ids_tmp = os.path.join(folder_path, IDS_FILENAME + ".tmp")
+    with open(ids_tmp, "w", encoding="utf-8") as f:
+        json.dump(ids, f)
+
+    index_tmp = os.path.join(folder_path, INDEX_FILENAME + ".tmp")
+    faiss.write_index(docsearch.index, index_tmp)
+
+    os.replace(docstore_tmp, os.path.join(folder_path, DOCSTORE_FILENAME))
+    os.replace(offsets_tmp, os.path.join(folder_path, OFFSETS_FILENAME))
+    os.replace(ids_tmp, os.path.join(folder_path, IDS_FILENAME))
+    os.replace(index_tmp, os.path.join(folder_path, INDEX_FILENAME))
+
+
+def load_legacy_index(folder_path, embeddings):
+    """
+    Load an index saved with the pickled index.pkl docstore, for its one-time conversion to a
+    snapshot in the mmap format. This is the only place that still unpickles; folder_path is left untouched.
+    """
+    return FAISS.load_local(folder_path, embeddings, allow_dangerous_deserialization=True)
@@ -0,0 +1,118 @@
+"""
+Question routing for the agent crews.
+Running both agents on every question makes a pure HR-policy question pay for an NL2SQL round trip
+against the database, and a database lookup pay for a knowledge base agent run. route_question()
+picks the agents a question needs with keyword rules, before the crew is assembled:
+- sql: questions that explicitly ask the database ("database", "table", "sql", "insurance company records")
+- both: counts and lookups about insurance ("how many payers", "payer ID", "insurance company phone
+  number"), which may be answered by the InsuranceCompany table or by the documents (the payer
+  sheets list IDs and phone numbers too), and explicit database questions that also have a
+  document signal
+- kb: questions about policies, procedures and the documents in the knowledge base, including
+  counts and lookups that aren't about insurance ("how many vacation days do I get")
+The SQL agent only sees the InsuranceCompany table, so it is only added for insurance or database
+questions, and the knowledge base is included whenever the question isn't explicitly about the database. A question with no signal (e.g. "tell me more") follows the route of the previous question in the
+conversation, and otherwise goes to QUESTION_ROUTER_DEFAULT.
+
+answer_mode() then picks how a question routed to the knowledge base alone is answered: "direct"
+(one retrieval and one LLM call, see direct_answer.py) unless it looks complex (long, several
+questions, comparisons or summaries), in which case the agent loop handles it.
+
+Configuration:
+- QUESTION_ROUTING: 1 (default) to route, 0 to always run every available agent
+- QUESTION_ROUTER_DEFAULT: route for questions with no signal at all, "kb" (default) or "both"
+- DIRECT_ANSWERS: "auto" (default) answers simple knowledge base questions directly, "always" all
+  knowledge base questions, "never" none
+- QUESTION_ROUTER_COMPLEX_WORDS: questions longer than this many words go to the agent (default 40)
+"""
+import os
+import re
+
+QUESTION_ROUTING = os.getenv("QUESTION_ROUTING", "1").lower() not in ("0", "false", "no")
+ROUTER_DEFAULT = os.getenv("QUESTION_ROUTER_DEFAULT", "kb").lower()
+DIRECT_ANSWERS = os.getenv("DIRECT_ANSWERS", "auto").lower()
+COMPLEX_WORDS = int(os.getenv("QUESTION_ROUTER_COMPLEX_WORDS", "40"))
+
+KB = "kb"
+SQL = "sql"
+ALL_ROUTES = [KB, SQL]
+
+DIRECT = "direct"
+AGENT = "agent"
+
+# Phrases that explicitly ask the database (the InsuranceCompany table)
+DATABASE_PATTERNS = [
+    r"database", r"tables?", r"sql", r"insurancecompany", r"insurance compan(?:y|ies) (?:records?|table|data)",
+]
+
+# Counts and lookups; the database may answer them when they are about insurance
+LOOKUP_PATTERNS = [
+    r"how many", r"number of", r"count of", r"total number", r"list (?:all|every|the)", r"show (?:me )?(?:all|every)",
+    r"records?", r"ids?", r"phone(?: number)?s?", r"fax(?: number)?s?", r"address(?:es)?", r"zip(?: code)?",
+]
+
+# What the InsuranceCompany table is about; a lookup needs one of these to involve the SQL agent
+INSURANCE_PATTERNS = [
+    r"insurance", r"insurers?", r"payers?", r"payors?", r"carriers?",
+]
+
+# Phrases that mean the answer is in the documents
+KB_PATTERNS = [
+    r"polic(?:y|ies)", r"procedures?", r"process", r"how (?:do|should|can|to) (?:i|we)?", r"why", r"explain",
+    r"handbook", r"manual", r"employees?", r"pto", r"paid time off", r"vacation", r"holidays?", r"benefits?",
+    r"billing", r"bill", r"claims?", r"cpt", r"modifiers?", r"denials?", r"prior authorization", r"documentation",
+    r"guidelines?", r"requirements?", r"fee schedule", r"in[- ]network", r"covered", r"coverage",
+    r"tickets?", r"emr", r"login", r"password",
+]
+
+# Phrases of questions that need more than one retrieval to answer well
+COMPLEX_PATTERNS = [
+    r"compare", r"comparison", r"differences?", r"versus", r"vs", r"pros and cons", r"step[- ]by[- ]step",
+    r"summari[sz]e", r"summary", r"all (?:the )?(?:policies|procedures|rules|options)",
+]
+
+
+def _pattern(phrases):
+    return re.compile(r"\b(?:" + "|".join(phrases) + r")\b", re.IGNORECASE)
+
+
+_DATABASE_PATTERN = _pattern(DATABASE_PATTERNS)
+_LOOKUP_PATTERN = _pattern(LOOKUP_PATTERNS)
+_INSURANCE_PATTERN = _pattern(INSURANCE_PATTERNS)
+_KB_PATTERN = _pattern(KB_PATTERNS)
+_COMPLEX_PATTERN = _pattern(COMPLEX_PATTERNS)
+
+
+def _signals(question):
+    """Route suggested by the question's own wording, or [] when it has no signal"""
+    question = question or ""
+    kb = _KB_PATTERN.search(question)
+    if _DATABASE_PATTERN.search(question):
+        return list(ALL_ROUTES) if kb else [SQL]
+    lookup, insurance = _LOOKUP_PATTERN.search(question), _INSURANCE_PATTERN.search(question)
+    if lookup and insurance:
+        return list(ALL_ROUTES)
+    # Lookups about anything else (vacation days, holidays, ticket steps) are document questions
+    return [KB] if kb or lookup or insurance else []
+
+
+def route_question(question, previous_question=None):
+    """Agents a question needs: ["kb"], ["sql"] or ["kb", "sql"]"""
+    if not QUESTION_ROUTING:
+        return list(ALL_ROUTES)
+    routes = _signals(question) or _signals(previous_question)
+    if routes:
+        return routes
+    return list(ALL_ROUTES) if ROUTER_DEFAULT == "both" else [KB]
+
+
+def answer_mode(question, routes):
+    """"direct" for knowledge base questions one retrieval can answer, "agent" for everything else"""
+    if routes != [KB] or DIRECT_ANSWERS == "never":
+        return AGENT
+    if DIRECT_ANSWERS == "always":
+        return DIRECT
+    question = question or ""
+    if len(question.split()) > COMPLEX_WORDS or question.count("?") > 1 or _COMPLEX_PATTERN.search(question):
+        return AGENT
+    return DIRECT
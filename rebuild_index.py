@@ -2,107 +2,57 @@
 """
 Script to rebuild the FAISS index with all documents in the docs-text directory
 """
-from langchain_community.document_loaders import TextLoader, UnstructuredMarkdownLoader
-from langchain.text_splitter import CharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
-import os
+import argparse
 import sys
 from dotenv import load_dotenv
+from embedding_cache import CachedEmbeddings
+from ingestion import build_index
+from index_snapshots import snapshot_write_lock, write_snapshot
 
-def rebuild_faiss_index():
+def rebuild_faiss_index(report=False):
     """
-    Rebuild the FAISS index with all documents in docs-text directory
+    Rebuild the FAISS index with all documents in docs-text directory.
+    With report, also write index_report.json comparing the ANN index types.
     """
     load_dotenv()
     
-    # Initialize embeddings
-    embeddings = OpenAIEmbeddings()
+    # Initialize embeddings, reusing cached vectors for chunks that haven't changed
+    embeddings = CachedEmbeddings(OpenAIEmbeddings())
     
     # Define paths
     docs_directory = "docs-text"
     faiss_index_path = "faiss_index"
     
-    # Get all text and markdown files in the directory
-    #text_files = [f for f in os.listdir(docs_directory) if f.endswith('.txt')]
-    markdown_files = [f for f in os.listdir(docs_directory) if f.endswith('.md')]
-    all_files =  markdown_files #text_files +
-    
-    if not all_files:
-        print(f"No text or markdown files found in {docs_directory}")
-        return False
-    
-    #print(f"Found {len(text_files)} text files and {len(markdown_files)} markdown files to process")
-    
-    # Load and combine all documents
-    all_docs = []
-    text_splitter = CharacterTextSplitter(
-            chunk_size=1500,
-            chunk_overlap=200,
-            separator = "\n\n"
-            )
-    
-    # Process text files
-    '''
-    for text_file in text_files:
-        file_path = os.path.join(docs_directory, text_file)
-        print(f"Processing text file: {text_file}...")
-        
-        try:
-            loader = TextLoader(file_path)
-            documents = loader.load()
-            
-            # Split documents
-            split_docs = text_splitter.split_documents(documents)
-            all_docs.extend(split_docs)
-            
-            print(f"Added {len(split_docs)} chunks from {text_file}")
-            
-        except Exception as e:
-            print(f"Error processing {text_file}: {str(e)}")
-     '''
-    
-    # Process markdown files
-    for markdown_file in markdown_files:
-        file_path = os.path.join(docs_directory, markdown_file)
-        print(f"Processing markdown file: {markdown_file}...")
-        
-        try:
-            loader = UnstructuredMarkdownLoader(file_path)
-            documents = loader.load()
-            
-            # Split documents
-            split_docs = text_splitter.split_documents(documents)
-            all_docs.extend(split_docs)
-            
-            print(f"Added {len(split_docs)} chunks from {markdown_file}")
-            
-        except Exception as e:
-            print(f"Error processing {markdown_file}: {str(e)}")
-    
-    if not all_docs:
-        print("No documents were successfully loaded")
-        return False
-    
-    print(f"Total chunks to index: {len(all_docs)}")
-    
-    # Create FAISS index
+    # Parse, chunk and embed everything through the shared ingestion pipeline; the index folder's
+    # write lock keeps running chatbots from writing or pruning snapshots at the same time
     try:
-        docsearch = FAISS.from_documents(all_docs, embeddings)
+        with snapshot_write_lock(faiss_index_path):
+            docsearch, manifest = build_index(embeddings, docs_directory)
+            if docsearch is None:
+                return False
         
-        # Save the index
-        docsearch.save_local(faiss_index_path)
-        print(f"FAISS index successfully created and saved to {faiss_index_path}")
+            # Write a new snapshot with the configured ANN index type (and the recall/latency report
+            # when asked), then go live: running chatbots with the index watcher pick it up on their next poll
+            _, _, _, snapshot_path = write_snapshot(
+                faiss_index_path, docsearch, manifest, docs_directory, full_build=True, write_report=report
+            )
+            print(f"FAISS index successfully created and saved to {snapshot_path}")
         
-        return True
+            return True
         
     except Exception as e:
         print(f"Error creating FAISS index: {str(e)}")
         return False
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the FAISS index from docs-text")
+    parser.add_argument("--report", action="store_true",
+                        help="also benchmark every FAISS_INDEX_REPORT_TYPES index type into index_report.json")
+    args = parser.parse_args()
+
     print("Rebuilding FAISS index with all documents...")
-    success = rebuild_faiss_index()
+    success = rebuild_faiss_index(report=args.report)
     
     if success:
         print("FAISS index rebuilt successfully!")
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Offline retrieval benchmark.
+Runs the golden questions in benchmarks/golden_questions.json through the ChatEngine retrieval path
+(query embedding -> FAISS search -> context packing) and reports recall@k, MRR and per-stage
+latency percentiles, so changes to chunking, k, context packing or the index type can be compared.
+
+The default embedder is HashingEmbeddings, a deterministic local embedder: no network, no API key,
+and the same scores on every run. The index is built from docs-text into its own folder
+(benchmark_index/<embedder>), never into faiss_index/.
+
+Usage:
+    python retrieval_benchmark.py
+    python retrieval_benchmark.py --k 3 --repeat 5 --output report.json
+    python retrieval_benchmark.py --embedder openai
+    python retrieval_benchmark.py --embedder mymodule:MyEmbeddings
+    FAISS_INDEX_TYPE=hnsw python retrieval_benchmark.py
+"""
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import FakeListChatModel
+from ann_index import INDEX_TYPE
+from conversation_memory import count_tokens
+from ingestion import CHUNKER_VERSION
+from main import ChatEngine
+import argparse
+import hashlib
+import importlib
+import json
+import math
+import numpy as np
+import os
+import re
+import shutil
+import sys
+import time
+
+DEFAULT_GOLDEN_PATH = os.path.join("benchmarks", "golden_questions.json")
+BENCHMARK_INDEX_DIRECTORY = "benchmark_index"
+STAGES = ["embed", "search", "pack", "total"]
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic bag-of-words embedder: word unigrams and bigrams are hashed into a fixed number of
+    signed buckets with sublinear term frequency, then L2-normalized like the OpenAI embeddings.
+    """
+
+    def __init__(self, dimension=1024):
+        self.dimension = dimension
+        self.model = f"hashing-{dimension}"
+
+    def _bucket(self, feature):
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        return value % self.dimension, 1.0 if value >> 63 else -1.0
+
+    def _embed(self, text):
+        words = re.findall(r"[a-z0-9]+", text.lower())
+        counts = {}
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            counts[feature] = counts.get(feature, 0) + 1
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for feature, count in counts.items():
+            bucket, sign = self._bucket(feature)
+            vector[bucket] += sign * (1.0 + math.log(count))
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm > 0 else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def load_embedder(name):
+    """'hashing' (default), 'openai' (cached OpenAI embeddings) or 'module:Class' for any Embeddings class"""
+    if name == "hashing":
+        return HashingEmbeddings()
+    if name == "openai":
+        from langchain_openai import OpenAIEmbeddings
+        from embedding_cache import CachedEmbeddings
+        return CachedEmbeddings(OpenAIEmbeddings())
+    module_name, _, class_name = name.partition(":")
+    if not class_name:
+        raise ValueError(f"Unknown embedder '{name}', expected hashing, openai or module:Class")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def load_golden_questions(path):
+    """Golden set: a list of {"question": ..., "expected_sources": [file names in docs-text]}"""
+    with open(path, "r", encoding="utf-8") as f:
+        questions = json.load(f)
+    for item in questions:
+        if not item.get("question") or not item.get("expected_sources"):
+            raise ValueError(f"Golden question needs 'question' and 'expected_sources': {item}")
+    return questions
+
+
+def _sources(docs):
+    return [os.path.basename(doc.metadata.get("source", "")) for doc in docs]
+
+
+def _recall(sources, expected, k):
+    return len(set(sources[:k]) & set(expected)) / float(len(expected))
+
+
+def _reciprocal_rank(sources, expected):
+    for rank, source in enumerate(sources, 1):
+        if source in expected:
+            return 1.0 / rank
+    return 0.0
+
+
+def _percentiles(values):
+    values = np.array(values) * 1000
+    return {
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+    }
+
+
+def run_benchmark(engine, questions, k=5, repeat=3):
+    """
+    Run every golden question repeat times through the engine's retrieval stages.
+    Quality metrics come from the first run (retrieval is deterministic); latencies from all runs.
+    "search" scores the top k FAISS candidates, "context" scores the packed documents sent to the LLM.
+    """
+    timings = {stage: [] for stage in STAGES}
+    per_question = []
+    for item in questions:
+        question, expected = item["question"], set(item["expected_sources"])
+        for run in range(repeat):
+            start = time.perf_counter()
+            query_vector = engine.embeddings.embed_query(question)
+            embedded = time.perf_counter()
+            candidates, vectors = engine.search(query_vector, question)
+            searched = time.perf_counter()
+            packed = engine.pack(query_vector, candidates, vectors, k)
+            finished = time.perf_counter()
+
+            timings["embed"].append(embedded - start)
+            timings["search"].append(searched - embedded)
+            timings["pack"].append(finished - searched)
+            timings["total"].append(finished - start)
+
+            if run == 0:
+                search_sources = _sources(doc for doc, _ in candidates)
+                context_sources = _sources(packed)
+                per_question.append({
+                    "question": question,
+                    "expected_sources": sorted(expected),
+                    "search_sources": search_sources[:k],
+                    "context_sources": context_sources,
+                    "search_recall": _recall(search_sources, expected, k),
+                    "context_recall": _recall(context_sources, expected, k),
+                    "search_rr": _reciprocal_rank(search_sources[:k], expected),
+                    "context_rr": _reciprocal_rank(context_sources, expected),
+                    "context_chunks": len(packed),
+                    "context_tokens": sum(count_tokens(doc.page_content) for doc in packed),
+                })
+
+    def mean(key):
+        return float(np.mean([result[key] for result in per_question]))
+
+    return {
+        "k": k,
+        "num_questions": len(questions),
+        "repeat": repeat,
+        "search": {f"recall_at_{k}": mean("search_recall"), "mrr": mean("search_rr")},
+        "context": {
+            f"recall_at_{k}": mean("context_recall"),
+            "mrr": mean("context_rr"),
+            "mean_chunks": mean("context_chunks"),
+            "mean_tokens": mean("context_tokens"),
+        },
+        "latency": {stage: _percentiles(values) for stage, values in timings.items()},
+        "questions": per_question,
+    }
+
+
+def print_report(report, verbose=False):
+    k = report["k"]
+    print(f"\n{report['num_questions']} golden questions, k={k}, {report['repeat']} runs each")
+    print(f"  search : recall@{k}={report['search'][f'recall_at_{k}']:.3f}  MRR={report['search']['mrr']:.3f}")
+    context = report["context"]
+    print(f"  context: recall@{k}={context[f'recall_at_{k}']:.3f}  MRR={context['mrr']:.3f}  "
+          f"chunks={context['mean_chunks']:.1f}  tokens={context['mean_tokens']:.0f}")
+    print("  latency (ms):")
+    for stage in STAGES:
+        stats = report["latency"][stage]
+        print(f"    {stage:<7} mean={stats['mean_ms']:.2f} p50={stats['p50_ms']:.2f} "
+              f"p95={stats['p95_ms']:.2f} p99={stats['p99_ms']:.2f}")
+    for result in report["questions"]:
+        if verbose or result["context_recall"] < 1.0:
+            print(f"  [{result['context_recall']:.2f}] {result['question']}")
+            print(f"         expected {result['expected_sources']} got {result['context_sources']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline retrieval benchmark over golden questions")
+    parser.add_argument("--golden", default=DEFAULT_GOLDEN_PATH, help="golden questions JSON file")
+    parser.add_argument("--embedder", default="hashing", help="hashing (default), openai or module:Class")
+    parser.add_argument("--k", type=int, default=5, help="number of chunks retrieved per question")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per question for the latency percentiles")
+    parser.add_argument("--reuse-index", action="store_true", help="reuse the benchmark index instead of rebuilding it")
+    parser.add_argument("--output", help="write the full report as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="list every question, not only the misses")
+    args = parser.parse_args()
+
+    questions = load_golden_questions(args.golden)
+    embeddings = load_embedder(args.embedder)
+    index_path = os.path.join(BENCHMARK_INDEX_DIRECTORY, re.sub(r"[^A-Za-z0-9_.-]", "_", args.embedder))
+    if not args.reuse_index and os.path.exists(index_path):
+        shutil.rmtree(index_path)
+
+    # The benchmark never calls the LLM; a local stand-in keeps it offline
+    # A rebuilt benchmark index also gets index_report.json comparing the ANN index types
+    engine = ChatEngine(embeddings=embeddings, llm=FakeListChatModel(responses=[""]), faiss_index_path=index_path,
+                        index_report=True)
+
+    report = run_benchmark(engine, questions, k=args.k, repeat=args.repeat)
+    report["config"] = {
+        "embedder": args.embedder,
+        "index_type": INDEX_TYPE,
+        "chunker": CHUNKER_VERSION,
+        "num_chunks": engine.docsearch.index.ntotal,
+    }
+    print_report(report, verbose=args.verbose)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
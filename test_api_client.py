@@ -2,10 +2,18 @@
 """
 Test client for the Chatbot API
 Demonstrates how to use the REST endpoints
+
+    python test_api_client.py            # smoke test of every endpoint
+    python test_api_client.py load ...   # concurrent load test, see run_load_test()
 """
 
 import requests
+import argparse
 import json
+import os
+import random
+import sys
+import threading
 import time
 
 # API Configuration
@@ -107,6 +115,185 @@ def test_root_endpoint():
     else:
         print(f"❌ Root endpoint failed: {response.status_code}")
 
+# Questions used by the load test when benchmarks/golden_questions.json is not available
+DEFAULT_LOAD_QUESTIONS = [
+    "How does paid time off accrue for full-time employees?",
+    "What is the max amount Aetna pays for 99204?",
+    "Is Oscar Health insurance in network?",
+    "How do I get an encounter unfinalized?",
+    "Which services require prior authorization?",
+]
+
+def load_questions(path=os.path.join("benchmarks", "golden_questions.json")):
+    """Questions for the load test: the retrieval benchmark's golden set if present"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return [item["question"] for item in json.load(f)]
+    except (OSError, ValueError, KeyError):
+        return list(DEFAULT_LOAD_QUESTIONS)
+
+class RequestPacer:
+    """Hands out evenly spaced start times so all workers together stay at the target rate"""
+
+    def __init__(self, rate_per_second):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def _percentile(sorted_values, percent):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(percent / 100.0 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def _load_worker(base_url, pacer, deadline, questions, new_session_ratio, history_ratio, results, results_lock, rng):
+    """
+    One simulated user: sends /chat (starting a new session or continuing one of its own)
+    and /chathistory requests until the deadline
+    """
+    http = requests.Session()
+    sessions = []
+    while True:
+        pacer.wait()
+        if time.monotonic() >= deadline:
+            break
+        if sessions and rng.random() < history_ratio:
+            kind = "history"
+            start = time.perf_counter()
+            try:
+                response = http.get(f"{base_url}/chathistory/{rng.choice(sessions)}", params={"limit": 10}, timeout=120)
+                ok = response.status_code == 200
+                status = response.status_code
+            except requests.exceptions.RequestException as e:
+                ok, status = False, type(e).__name__
+        else:
+            continue_session = sessions and rng.random() >= new_session_ratio
+            kind = "chat_continued" if continue_session else "chat_new"
+            payload = {"message": rng.choice(questions)}
+            if continue_session:
+                payload["session_id"] = rng.choice(sessions)
+            start = time.perf_counter()
+            try:
+                response = http.post(f"{base_url}/chat", json=payload, timeout=300)
+                ok = response.status_code == 200
+                status = response.status_code
+                if ok and not continue_session:
+                    sessions.append(response.json()["session_id"])
+            except requests.exceptions.RequestException as e:
+                ok, status = False, type(e).__name__
+        latency = time.perf_counter() - start
+        with results_lock:
+            results.append((kind, ok, status, latency))
+
+def summarize_load_results(results, elapsed):
+    """Throughput, error rate and latency percentiles per request kind and overall"""
+    summary = {}
+    kinds = sorted({kind for kind, _, _, _ in results}) + ["all"]
+    for kind in kinds:
+        rows = [row for row in results if kind == "all" or row[0] == kind]
+        latencies = sorted(row[3] * 1000 for row in rows)
+        errors = [row for row in rows if not row[1]]
+        status_counts = {}
+        for row in errors:
+            status_counts[str(row[2])] = status_counts.get(str(row[2]), 0) + 1
+        summary[kind] = {
+            "requests": len(rows),
+            "throughput_rps": len(rows) / elapsed if elapsed > 0 else 0.0,
+            "error_rate": len(errors) / len(rows) if rows else 0.0,
+            "errors_by_status": status_counts,
+            "latency_ms_mean": sum(latencies) / len(latencies) if latencies else 0.0,
+            "latency_ms_p50": _percentile(latencies, 50),
+            "latency_ms_p95": _percentile(latencies, 95),
+            "latency_ms_p99": _percentile(latencies, 99),
+        }
+    return summary
+
+def run_load_test(base_url=API_BASE_URL, sessions=10, rate=5.0, duration=60.0, new_session_ratio=0.3,
+                  history_ratio=0.1, seed=0):
+    """
+    Run `sessions` concurrent simulated users against /chat and /chathistory for `duration` seconds,
+    paced to `rate` requests per second in total (0 = as fast as the users can go).
+    new_session_ratio is the share of /chat requests that start a new session; the others continue
+    one of the user's sessions. history_ratio is the share of requests that go to /chathistory.
+    """
+    questions = load_questions()
+    pacer = RequestPacer(rate)
+    results = []
+    results_lock = threading.Lock()
+    start = time.monotonic()
+    deadline = start + duration
+    workers = [
+        threading.Thread(
+            target=_load_worker,
+            args=(base_url, pacer, deadline, questions, new_session_ratio, history_ratio,
+                  results, results_lock, random.Random(seed + i)),
+            daemon=True
+        )
+        for i in range(sessions)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return summarize_load_results(results, time.monotonic() - start)
+
+def print_load_summary(summary):
+    print(f"\n{'kind':<15} {'requests':>8} {'rps':>8} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for kind, stats in summary.items():
+        print(f"{kind:<15} {stats['requests']:>8} {stats['throughput_rps']:>8.2f} {stats['error_rate']:>7.1%} "
+              f"{stats['latency_ms_p50']:>9.1f} {stats['latency_ms_p95']:>9.1f} {stats['latency_ms_p99']:>9.1f}")
+        if stats["errors_by_status"]:
+            print(f"{'':<15} errors: {stats['errors_by_status']}")
+
+def load_test_main(argv):
+    parser = argparse.ArgumentParser(prog="test_api_client.py load", description="Concurrent load test for the Chatbot API")
+    parser.add_argument("--url", default=API_BASE_URL, help="API base URL (ignored with --offline)")
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent simulated users")
+    parser.add_argument("--rate", type=float, default=5.0, help="target requests per second in total, 0 for unthrottled")
+    parser.add_argument("--duration", type=float, default=60.0, help="test duration in seconds")
+    parser.add_argument("--new-session-ratio", type=float, default=0.3, help="share of /chat requests that start a new session")
+    parser.add_argument("--history-ratio", type=float, default=0.1, help="share of requests sent to /chathistory")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the summary as JSON to this file")
+    parser.add_argument("--offline", action="store_true",
+                        help="run the API in-process with local stand-ins for OpenAI, Bedrock and DynamoDB")
+    parser.add_argument("--standin-llm-ms", type=float, default=0.0, help="simulated LLM latency per task (offline)")
+    parser.add_argument("--standin-kb-ms", type=float, default=0.0, help="simulated Bedrock retrieval latency per task (offline)")
+    parser.add_argument("--standin-dynamodb-ms", type=float, default=0.0, help="simulated DynamoDB latency per call (offline)")
+    args = parser.parse_args(argv)
+
+    base_url, server = args.url, None
+    if args.offline:
+        from local_standins import start_local_server
+        base_url, server = start_local_server(
+            dynamodb_latency_ms=args.standin_dynamodb_ms,
+            kb_latency_ms=args.standin_kb_ms,
+            llm_latency_ms=args.standin_llm_ms
+        )
+        print(f"Local API with stand-ins running at {base_url}")
+
+    print(f"Load test: {args.sessions} sessions, target {args.rate} req/s, {args.duration}s against {base_url}")
+    try:
+        summary = run_load_test(base_url, args.sessions, args.rate, args.duration,
+                                args.new_session_ratio, args.history_ratio, args.seed)
+    finally:
+        if server is not None:
+            server.should_exit = True
+    print_load_summary(summary)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"Summary written to {args.output}")
+
 def main():
     """Run all tests"""
     print("🚀 Starting Chatbot API Tests")
@@ -140,4 +327,7 @@ def main():
         print(f"❌ Test failed with error: {e}")
 
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] == "load":
+        load_test_main(sys.argv[2:])
+    else:
+        main()